@@ -0,0 +1,2 @@
+"""Benchmarks for the tax calculator, run as modules e.g.
+python -m benchmarks.bench_parser_memory"""
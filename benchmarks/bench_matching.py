@@ -0,0 +1,70 @@
+""" Run time of the share matching stages on a synthetic high frequency ticker
+
+python -m benchmarks.bench_matching --trades 10000 100000 --splits 200
+"""
+import argparse
+import datetime
+from decimal import Decimal
+from fractions import Fraction
+import time
+
+from benchmarks.synthetic import make_trades
+from capital_gain.calculator import CgtCalculator
+from capital_gain.fixed_point import FixedPointCgtCalculator
+from capital_gain.model import CorporateActionType, ShareReorg
+
+STAGES = ["same_day", "bed_and_breakfast", "section104"]
+ENGINES = {"decimal": CgtCalculator, "fixed_point": FixedPointCgtCalculator}
+
+
+def main() -> None:
+    """Time each matching stage of CgtCalculator"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trades", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument(
+        "--splits", type=int, default=0, help="number of share split and merge"
+    )
+    parser.add_argument("--engine", choices=ENGINES, default="decimal")
+    args = parser.parse_args()
+    print(f"{'trades':>10} " + " ".join(f"{stage:>18}" for stage in args.stages))
+    for number_of_trades in args.trades:
+        trades = make_trades(number_of_trades)
+        first_date = trades[0].transaction_date
+        period = (trades[-1].transaction_date - first_date).days
+        # alternate 2 for 1 split and 1 for 2 merge over the trading period
+        splits = [
+            ShareReorg(
+                trades[0].ticker,
+                first_date + datetime.timedelta(days=i * period // args.splits),
+                CorporateActionType.SHARE_SPLIT,
+                Decimal(0),
+                Fraction(2) if i % 2 == 0 else Fraction(1, 2),
+            )
+            for i in range(args.splits)
+        ]
+        calculator = ENGINES[args.engine](trades, splits)
+        result = []
+        # pylint: disable=protected-access
+        stage_functions = [
+            calculator._match_same_day_disposal,
+            calculator._match_bed_and_breakfast_disposal,
+            calculator._match_section104,
+        ]
+        # later stages rely on the earlier ones, so run until the last selected
+        last_stage = max(STAGES.index(stage) for stage in args.stages)
+        for stage, function in zip(
+            STAGES[: last_stage + 1], stage_functions[: last_stage + 1]
+        ):
+            start = time.perf_counter()
+            function()
+            if stage in args.stages:
+                result.append(time.perf_counter() - start)
+        print(
+            f"{number_of_trades:>10} "
+            + " ".join(f"{duration:>17.3f}s" for duration in result)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+""" Memory used to hold trades as objects of the model before slots were used,
+as objects of the slotted model and in TradeStore
+
+python -m benchmarks.bench_model_memory --trades 100000 1000000
+"""
+import argparse
+from dataclasses import dataclass, field
+import datetime
+from decimal import Decimal
+import gc
+import tracemalloc
+from typing import Any, Iterable
+
+from iso4217 import Currency
+
+from benchmarks.synthetic import iter_trades
+from capital_gain.model import BuyTrade, SellTrade
+from capital_gain.trade_store import TradeStore
+
+MODELS = ["dict", "slots", "store"]
+
+
+# copy of the model classes before slots were used, each object has a __dict__
+@dataclass
+class _DictMoney:
+    value: Decimal
+    exchange_rate: Decimal = field(default=Decimal(1))
+    currency: Currency = field(default=Currency("GBP"))
+    note: str = ""
+
+
+@dataclass
+class _DictCalculationStatus:
+    unmatched: Decimal
+    comment: str = ""
+    total_gain: Decimal = Decimal(0)
+    allowable_cost: Decimal = Decimal(0)
+    section104_pre_trade: Decimal = Decimal(0)
+    section104_post_trade: Decimal = Decimal(0)
+
+
+@dataclass
+class _DictTrade:
+    ticker: str
+    transaction_date: datetime.date
+    transaction_id: int
+    size: Decimal
+    calculation_status: _DictCalculationStatus
+    transaction_value: _DictMoney
+    fee_and_tax: list[_DictMoney]
+    transaction_type: str
+    description: str
+
+
+def _money_fields(money: Any) -> dict[str, Any]:
+    """Fields of a Money object"""
+    return {
+        "value": money.value,
+        "exchange_rate": money.exchange_rate,
+        "currency": money.currency,
+        "note": money.note,
+    }
+
+
+def _to_dict_model(trades: Iterable[BuyTrade | SellTrade]) -> list[_DictTrade]:
+    """Same trades as objects of the model before slots were used"""
+    return [
+        _DictTrade(
+            trade.ticker,
+            trade.transaction_date,
+            trade.transaction_id,
+            trade.size,
+            _DictCalculationStatus(trade.size),
+            _DictMoney(**_money_fields(trade.transaction_value)),
+            [_DictMoney(**_money_fields(fee)) for fee in trade.fee_and_tax],
+            trade.transaction_type,
+            trade.description,
+        )
+        for trade in trades
+    ]
+
+
+def measure(number_of_trades: int, model: str) -> int:
+    """Return bytes allocated to hold number_of_trades trades with one fee each"""
+    gc.collect()
+    tracemalloc.start()
+    trades = iter_trades(number_of_trades, with_fee=True)
+    container: Any
+    if model == "dict":
+        container = _to_dict_model(trades)
+    elif model == "slots":
+        container = list(trades)
+    else:
+        container = TradeStore(trades)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del container
+    return size
+
+
+def main() -> None:
+    """Print memory used per trade of each model"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trades", type=int, nargs="+", default=[100000])
+    args = parser.parse_args()
+    print(f"{'trades':>10}", end="")
+    for model in MODELS:
+        print(f" {model + ' MB':>12} {'bytes/trade':>12}", end="")
+    print()
+    for number_of_trades in args.trades:
+        print(f"{number_of_trades:>10}", end="")
+        for model in MODELS:
+            size = measure(number_of_trades, model)
+            print(f" {size / 2**20:>12.1f} {size / number_of_trades:>12.0f}", end="")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+""" Scaling of the per ticker parallel calculation with the number of processes
+
+python -m benchmarks.bench_parallel_calculation --tickers 16 --trades 20000
+"""
+import argparse
+import os
+import time
+
+from benchmarks.synthetic import make_trades
+from capital_gain.calculator import CgtCalculator
+
+
+def main() -> None:
+    """Time CgtCalculator.calculate_tax with different number of workers"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tickers", type=int, default=16)
+    parser.add_argument(
+        "--trades", type=int, default=20000, help="number of trades of each ticker"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, 2, 4, 8, os.cpu_count() or 1}),
+    )
+    args = parser.parse_args()
+    trades = []
+    for i in range(args.tickers):
+        trades.extend(make_trades(args.trades, ticker=f"T{i}", seed=i))
+    print(f"{'workers':>8} {'seconds':>10} {'speedup':>8}")
+    serial_time = None
+    for workers in args.workers:
+        calculator = CgtCalculator(trades)
+        start = time.perf_counter()
+        calculator.calculate_tax(workers=workers)
+        elapsed = time.perf_counter() - start
+        if serial_time is None:
+            serial_time = elapsed
+        print(f"{workers:>8} {elapsed:>10.2f} {serial_time / elapsed:>8.2f}")
+        for trade in trades:
+            trade.clear_calculation()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+""" Peak memory of tree and streaming mode of the Flex statement parser
+
+Each measurement runs in a fresh process so that peak RSS is not carried over
+python -m benchmarks.bench_parser_memory --trades 20000 100000 400000
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.synthetic import write_flex_statement
+
+
+def _measure(mode: str, filename: str) -> None:
+    """Parse the file in the given mode and print peak RSS in kB"""
+    # pylint: disable=import-outside-toplevel
+    from statement_parser.ibkr import iter_statement, parse_statement
+
+    if mode == "tree":
+        parse_statement(filename)
+    else:
+        for _ in iter_statement(filename):
+            pass
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def main() -> None:
+    """Run the benchmark and print a table of file size against peak RSS"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--trades", type=int, nargs="+", default=[20000, 100000, 400000]
+    )
+    parser.add_argument("--measure", nargs=2, metavar=("MODE", "FILE"))
+    args = parser.parse_args()
+    if args.measure:
+        _measure(*args.measure)
+        return
+    print(f"{'trades':>10} {'file MB':>10} {'tree MB':>10} {'stream MB':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for number_of_trades in args.trades:
+            filename = os.path.join(directory, f"{number_of_trades}.xml")
+            write_flex_statement(filename, number_of_trades)
+            result = {}
+            for mode in ["tree", "streaming"]:
+                output = subprocess.run(
+                    [sys.executable, "-m", __spec__.name, "--measure", mode, filename],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                )
+                result[mode] = int(output.stdout) / 1024
+            print(
+                f"{number_of_trades:>10} "
+                f"{os.path.getsize(filename) / 1024 / 1024:>10.1f} "
+                f"{result['tree']:>10.1f} {result['streaming']:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
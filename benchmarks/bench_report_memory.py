@@ -0,0 +1,70 @@
+""" Peak memory of writing the trade report in default and constant memory mode
+
+Trades are generated one at a time so that the peak RSS is mostly the
+workbook. Each measurement runs in a fresh process so that peak RSS is not
+carried over.
+python -m benchmarks.bench_report_memory --rows 100000 1000000
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+
+def _measure(mode: str, number_of_rows: int) -> None:
+    """Write the trade table and print RSS before writing and peak RSS in kB"""
+    # pylint: disable=import-outside-toplevel
+    from benchmarks.synthetic import iter_trades
+    from excel_output.capital_gain_list import write_trade_by_ticker
+
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    write_trade_by_ticker(
+        iter_trades(number_of_rows, with_fee=True), mode == "constant_memory"
+    )
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def main() -> None:
+    """Run the benchmark and print a table of number of rows against peak RSS"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--modes", nargs="+", default=["default", "constant_memory"])
+    parser.add_argument("--measure", nargs=2, metavar=("MODE", "ROWS"))
+    args = parser.parse_args()
+    if args.measure:
+        _measure(args.measure[0], int(args.measure[1]))
+        return
+    print(f"{'rows':>10} " + " ".join(f"{mode + ' MB':>18}" for mode in args.modes))
+    environment = dict(os.environ, PYTHONPATH=os.getcwd())
+    for number_of_rows in args.rows:
+        result = {}
+        for mode in args.modes:
+            # the workbook is written to the current directory
+            with tempfile.TemporaryDirectory() as directory:
+                output = subprocess.run(
+                    [
+                        sys.executable,
+                        "-m",
+                        __spec__.name,
+                        "--measure",
+                        mode,
+                        str(number_of_rows),
+                    ],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                    cwd=directory,
+                    env=environment,
+                )
+            start, peak = output.stdout.split()
+            result[mode] = (int(peak) - int(start)) / 1024
+        print(
+            f"{number_of_rows:>10} "
+            + " ".join(f"{result[mode]:>18.1f}" for mode in args.modes)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+""" Wall time of writing the report workbooks with different number of processes
+
+python -m benchmarks.bench_reports --tickers 8 --trades 20000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import make_trades
+from capital_gain.calculator import CgtCalculator
+from excel_output.report import ReportData, write_reports
+
+
+def main() -> None:
+    """Time write_reports with different number of workers"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tickers", type=int, default=8)
+    parser.add_argument(
+        "--trades", type=int, default=20000, help="number of trades of each ticker"
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+    trades = []
+    for i in range(args.tickers):
+        trades.extend(make_trades(args.trades, ticker=f"T{i}", seed=i))
+    calculator = CgtCalculator(trades)
+    calculator.calculate_tax()
+    data = ReportData(list(trades), calculator.get_section104(), [])
+    print(f"{'workers':>8} {'seconds':>10} {'speedup':>8}")
+    serial_time = None
+    current_directory = os.getcwd()
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                start = time.perf_counter()
+                write_reports(data, workers=workers)
+                elapsed = time.perf_counter() - start
+            finally:
+                os.chdir(current_directory)
+        if serial_time is None:
+            serial_time = elapsed
+        print(f"{workers:>8} {elapsed:>10.2f} {serial_time / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
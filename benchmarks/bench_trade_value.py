@@ -0,0 +1,75 @@
+""" Sterling conversions done by the calculation and trade report with and
+without the sterling value and fee cached on the trades
+
+python -m benchmarks.bench_trade_value --trades 10000 100000
+"""
+import argparse
+from collections import Counter
+from decimal import Decimal
+import time
+from typing import Callable
+from unittest import mock
+
+from benchmarks.synthetic import iter_trades
+from capital_gain.calculator import CgtCalculator
+from capital_gain.model import Money, Trade
+from excel_output.capital_gain_list import set_trade_data
+
+
+def _uncached_value(trade: Trade) -> Decimal:
+    """get_gross_value before caching"""
+    return trade.transaction_value.get_value()
+
+
+def _uncached_fee(trade: Trade) -> Decimal:
+    """get_total_fee before caching"""
+    return sum((fee.get_value() for fee in trade.fee_and_tax), Decimal(0))
+
+
+def measure(number_of_trades: int, cached: bool) -> tuple[int, float]:
+    """Return number of Money.get_value calls and time taken to calculate and
+    write the trade table data"""
+    counter: Counter = Counter()
+    get_value: Callable = Money.get_value
+
+    def counted_get_value(money: Money) -> Decimal:
+        counter["get_value"] += 1
+        return get_value(money)
+
+    trades = list(iter_trades(number_of_trades, with_fee=True))
+    patches: list = [mock.patch.object(Money, "get_value", counted_get_value)]
+    if not cached:
+        patches += [
+            mock.patch.object(Trade, "get_gross_value", _uncached_value),
+            mock.patch.object(Trade, "get_total_fee", _uncached_fee),
+        ]
+    for patch in patches:
+        patch.start()
+    try:
+        start = time.perf_counter()
+        CgtCalculator(trades).calculate_tax()
+        for trade in trades:
+            set_trade_data(trade)
+        duration = time.perf_counter() - start
+    finally:
+        for patch in patches:
+            patch.stop()
+    return counter["get_value"], duration
+
+
+def main() -> None:
+    """Print sterling conversions and run time with and without the cache"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trades", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+    print(f"{'trades':>10} {'uncached':>12} {'time':>8} {'cached':>12} {'time':>8}")
+    for number_of_trades in args.trades:
+        print(f"{number_of_trades:>10}", end="")
+        for cached in (False, True):
+            conversions, duration = measure(number_of_trades, cached)
+            print(f" {conversions:>12} {duration:>7.2f}s", end="")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+""" Generate synthetic Flex statements for benchmarking """
+import datetime
+import random
+from typing import Iterator
+
+TICKERS = ["AMD", "MMM", "TSLA", "AAPL", "NVDA", "MSFT", "INTC", "KO"]
+
+
+def _format_date(date: datetime.date) -> str:
+    """date format used in the Flex statement e.g. 27-Jan-21"""
+    return date.strftime("%d-%b-%y")
+
+
+def write_flex_statement(
+    filename: str, number_of_trades: int, year: int = 2021, seed: int = 0
+) -> None:
+    """Write a Flex statement with number_of_trades stock trades in USD,
+    one statement of funds line per trade, some dividends and conversion rates
+    for every day of the year"""
+    rng = random.Random(seed)
+    start = datetime.date(year, 1, 1)
+    with open(filename, "w", encoding="utf-8") as file:
+        file.write(
+            '<FlexQueryResponse queryName="benchmark" type="AF">\n'
+            '<FlexStatements count="1">\n'
+            f'<FlexStatement accountId="U0000000" fromDate="{_format_date(start)}" '
+            f'toDate="{_format_date(datetime.date(year, 12, 31))}">\n'
+        )
+        trade_dates = sorted(
+            start + datetime.timedelta(days=rng.randrange(365))
+            for _ in range(number_of_trades)
+        )
+        file.write("<Trades>\n")
+        for date in trade_dates:
+            buy_sell = rng.choice(["BUY", "SELL"])
+            quantity = rng.randint(1, 100)
+            proceeds = quantity * rng.randint(10, 500)
+            file.write(
+                f'<Order assetCategory="STK" symbol="{rng.choice(TICKERS)}" '
+                f'description="SYNTHETIC TRADE" currency="USD" fxRateToBase="0.75" '
+                f'tradeDate="{_format_date(date)}" '
+                f'quantity="{quantity if buy_sell == "BUY" else -quantity}" '
+                f'proceeds="{-proceeds if buy_sell == "BUY" else proceeds}" '
+                f'taxes="0" ibCommission="-1" ibCommissionCurrency="USD" '
+                f'buySell="{buy_sell}" />\n'
+            )
+        file.write("</Trades>\n<CashTransactions>\n")
+        for date in trade_dates[:: max(1, number_of_trades // 100)]:
+            file.write(
+                f'<CashTransaction symbol="KO" isin="US1912161007" '
+                f'description="KO(US1912161007) CASH DIVIDEND USD 0.42 PER SHARE" '
+                f'currency="USD" fxRateToBase="0.75" reportDate="{_format_date(date)}" '
+                f'amount="42" type="Dividends" levelOfDetail="DETAIL" />\n'
+            )
+        file.write("</CashTransactions>\n<StmtFunds>\n")
+        for date in trade_dates:
+            amount = rng.randint(100, 50000)
+            debit, credit = ("", amount) if rng.random() < 0.5 else (-amount, "")
+            file.write(
+                f'<StatementOfFundsLine currency="USD" '
+                f'reportDate="{_format_date(date)}" '
+                f'activityDescription="SYNTHETIC TRADE" '
+                f'debit="{debit}" credit="{credit}" />\n'
+            )
+        file.write("</StmtFunds>\n<ConversionRates>\n")
+        for day in range(366):
+            date = start + datetime.timedelta(days=day)
+            file.write(
+                f'<ConversionRate reportDate="{_format_date(date)}" '
+                f'fromCurrency="USD" toCurrency="GBP" rate="0.75" />\n'
+            )
+        file.write(
+            "</ConversionRates>\n</FlexStatement>\n</FlexStatements>\n"
+            "</FlexQueryResponse>\n"
+        )
+
+
+def iter_trades(
+    number_of_trades: int,
+    ticker: str = "USD",
+    trades_per_day: int = 20,
+    seed: int = 0,
+    with_fee: bool = False,
+) -> Iterator:
+    """Yield buy and sell trades of a single ticker in date order, with about
+    trades_per_day trades on each day, like the fx trades generated from the
+    statement of funds of an active account"""
+    # pylint: disable=import-outside-toplevel
+    from decimal import Decimal
+
+    from capital_gain.model import BuyTrade, Money, SellTrade
+
+    rng = random.Random(seed)
+    start = datetime.date(2010, 1, 1)
+    for i in range(number_of_trades):
+        date = start + datetime.timedelta(days=i // trades_per_day)
+        size = Decimal(rng.randint(1, 1000))
+        value = Money(size * Decimal(rng.randint(50, 150)) / 100)
+        fee = [Money(Decimal(rng.randint(1, 100)) / 100)] if with_fee else []
+        trade_class = BuyTrade if rng.random() < 0.5 else SellTrade
+        yield trade_class(ticker, date, size, value, fee)
+
+
+def make_trades(
+    number_of_trades: int,
+    ticker: str = "USD",
+    trades_per_day: int = 20,
+    seed: int = 0,
+) -> list:
+    """Return a list of the trades from iter_trades"""
+    return list(iter_trades(number_of_trades, ticker, trades_per_day, seed))
@@ -1,12 +1,148 @@
 """ contain capital gain calculation for UK tax rules"""
 from __future__ import annotations
 
-from collections import defaultdict
+from bisect import bisect_right
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 from copy import deepcopy
+from dataclasses import dataclass
+import datetime
+from decimal import Decimal
 from fractions import Fraction
-from typing import DefaultDict, Optional, Sequence
+from typing import DefaultDict, Deque, Optional, Sequence
 
-from .model import BuyTrade, MatchType, Section104, SellTrade, ShareReorg, Trade
+from .model import (
+    BuyTrade,
+    CalculationStatus,
+    MatchEvent,
+    MatchType,
+    Section104,
+    Section104Value,
+    SellTrade,
+    ShareReorg,
+    Trade,
+)
+
+BED_AND_BREAKFAST_PERIOD = datetime.timedelta(days=30)
+
+
+def _find_open(next_open: list[int], index: int) -> int:
+    """Follow next_open from index to the first buy that is not fully matched"""
+    while next_open[index] != index:
+        # path halving keeps later searches short
+        next_open[index] = next_open[next_open[index]]
+        index = next_open[index]
+    return index
+
+
+class _SplitIndex:
+    """Share split and merge of a ticker in date order with cumulative ratio, so
+    that the ratio between any two dates is found with bisect"""
+
+    def __init__(self, corp_action_list: Sequence[ShareReorg]) -> None:
+        self.dates: list[datetime.date] = []
+        # cumulative_ratio[i] is the product of the ratio of the first i actions
+        self.cumulative_ratio: list[Fraction] = [Fraction(1)]
+        for corp_action in sorted(corp_action_list, key=lambda x: x.transaction_date):
+            self.dates.append(corp_action.transaction_date)
+            self.cumulative_ratio.append(self.cumulative_ratio[-1] * corp_action.ratio)
+
+    def get_ratio(self, date1: datetime.date, date2: datetime.date) -> Fraction:
+        """Return the combined ratio of actions after the earlier date up to and
+        including the later date.
+        note: A corp action happens before a trade on the same day
+        """
+        start, end = sorted([date1, date2])
+        return (
+            self.cumulative_ratio[bisect_right(self.dates, end)]
+            / self.cumulative_ratio[bisect_right(self.dates, start)]
+        )
+
+
+@dataclass
+class _TickerResult:
+    """Result of matching a single ticker in a worker process
+    open_shorts: position of the open shorts in the trade list of the ticker, or the
+    short itself if it comes from the initial section 104 pool
+    """
+
+    calculation_status: list[CalculationStatus]
+    corp_action_events: list[list[MatchEvent]]
+    section104_value: Optional[Section104Value]
+    open_shorts: Optional[list[int | SellTrade]]
+
+
+# calculator of the parent process, set once per worker by the pool initializer so
+# that each task only carries a ticker. The trades are still copied to every
+# worker: inherited with fork, pickled with the initializer under spawn
+_WORKER_CALCULATOR: Optional[CgtCalculator] = None
+
+
+def _init_worker(calculator: CgtCalculator) -> None:
+    """Keep the calculator to be used by _calculate_ticker in a worker process"""
+    global _WORKER_CALCULATOR  # pylint: disable=global-statement
+    _WORKER_CALCULATOR = calculator
+
+
+def _calculate_ticker(ticker: str) -> _TickerResult:
+    """Run the share matching of a single ticker in a worker process"""
+    assert _WORKER_CALCULATOR is not None
+    trade_list = _WORKER_CALCULATOR.ticker_transaction_list.get(ticker, [])
+    corp_action_list = _WORKER_CALCULATOR.ticker_corp_action_list.get(ticker, [])
+    init_section104 = Section104()
+    parent_section104 = _WORKER_CALCULATOR.get_section104()
+    if ticker in parent_section104.section104_list:
+        init_section104.section104_list[ticker] = parent_section104.section104_list[
+            ticker
+        ]
+    if ticker in parent_section104.short_book:
+        init_section104.short_book[ticker] = parent_section104.short_book[ticker]
+    # same kind of calculator as the parent, which may use another engine
+    calculator = type(_WORKER_CALCULATOR)(trade_list, corp_action_list, init_section104)
+    if ticker in _WORKER_CALCULATOR.ticker_split_index:
+        calculator.ticker_split_index[ticker] = _WORKER_CALCULATOR.ticker_split_index[
+            ticker
+        ]
+    calculator.calculate_tax()
+    section104 = calculator.get_section104()
+    open_shorts: Optional[list[int | SellTrade]] = None
+    if ticker in section104.short_book:
+        position = {id(trade): i for i, trade in enumerate(trade_list)}
+        open_shorts = [
+            position.get(id(short), short) for short in section104.short_book[ticker]
+        ]
+    return _TickerResult(
+        [trade.calculation_status for trade in trade_list],
+        [corp_action.events for corp_action in corp_action_list],
+        section104.section104_list.get(ticker),
+        open_shorts,
+    )
+
+
+def calculate_ticker(
+    ticker: str,
+    trade_list: Sequence[BuyTrade | SellTrade],
+    corp_action_list: Sequence[ShareReorg],
+    section104: Section104,
+) -> None:
+    """Calculate the trades and corporate actions of a single ticker, starting
+    from the pool and open short sales of the ticker in section104 and replacing
+    them with the result. Pools of other tickers are not used or changed.
+    """
+    ticker_section104 = Section104()
+    if ticker in section104.section104_list:
+        ticker_section104.section104_list[ticker] = section104.section104_list[ticker]
+    if ticker in section104.short_book:
+        ticker_section104.short_book[ticker] = section104.short_book[ticker]
+    calculator = CgtCalculator(trade_list, corp_action_list, ticker_section104)
+    calculator.calculate_tax()
+    result = calculator.get_section104()
+    if ticker in result.section104_list:
+        section104.section104_list[ticker] = result.section104_list[ticker]
+    if result.short_book.get(ticker):
+        section104.short_book[ticker] = result.short_book[ticker]
+    else:
+        section104.short_book.pop(ticker, None)
 
 
 class CgtCalculator:
@@ -36,18 +172,101 @@ class CgtCalculator:
             for corp_action in corp_action_list:
                 corp_action.clear_calculation()
                 self.ticker_corp_action_list[corp_action.ticker].append(corp_action)
+        self.ticker_split_index: dict[str, _SplitIndex] = {
+            ticker: _SplitIndex(corp_actions)
+            for ticker, corp_actions in self.ticker_corp_action_list.items()
+        }
         if init_section104 is not None:
             self.section104 = deepcopy(init_section104)
         else:
             self.section104 = Section104()
 
-    def calculate_tax(self) -> None:
+    def add_split_history(self, corp_action_list: Sequence[ShareReorg]) -> None:
+        """Share split and merge before the transactions of this calculator, which
+        are already applied to the initial section 104 pool. They are only used for
+        the ratio when an open short of the initial pool is covered.
+        """
+        history: DefaultDict[str, list[ShareReorg]] = defaultdict(list)
+        for corp_action in corp_action_list:
+            history[corp_action.ticker].append(corp_action)
+        for ticker, corp_actions in history.items():
+            self.ticker_split_index[ticker] = _SplitIndex(
+                [*corp_actions, *self.ticker_corp_action_list.get(ticker, [])]
+            )
+
+    def _tickers(self) -> list[str]:
+        """Tickers with trades, and tickers held in the initial section 104 pool
+        that have only share split or merge, so that the pool is adjusted"""
+        return [
+            *self.ticker_transaction_list,
+            *(
+                ticker
+                for ticker in self.ticker_corp_action_list
+                if ticker not in self.ticker_transaction_list
+                and ticker in self.section104.section104_list
+            ),
+        ]
+
+    def calculate_tax(self, workers: int = 1) -> None:
         """To calculate chargeable gain and
-        allowable loss of a list of same kind of shares"""
+        allowable loss of a list of same kind of shares
+        workers: number of processes, tickers are matched in parallel if more than 1
+        """
+        if workers > 1 and len(self._tickers()) > 1:
+            self._calculate_parallel(workers)
+            return
         self._match_same_day_disposal()
         self._match_bed_and_breakfast_disposal()
         self._match_section104()
 
+    def calculate_tax_before(self, end_date: datetime.date) -> None:
+        """Run only the matching that is final for transactions before end_date,
+        given that all trades up to 30 days after end_date are in the calculator.
+        Trades from end_date onward keep their same day matching and the bed and
+        breakfast matching with earlier disposals, and are left out of the
+        section 104 pool.
+        """
+        self._match_same_day_disposal()
+        self._match_bed_and_breakfast_disposal(end_date)
+        self._match_section104(end_date)
+
+    def _calculate_parallel(self, workers: int) -> None:
+        """Match each ticker in a process pool, then copy the results back to the
+        trades and section 104 pool in ticker order so that the result is the same
+        as the serial calculation
+        """
+        tickers = self._tickers()
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(self,)
+        ) as executor:
+            for ticker, result in zip(
+                tickers, executor.map(_calculate_ticker, tickers)
+            ):
+                self._merge_ticker_result(ticker, result)
+
+    def _merge_ticker_result(self, ticker: str, result: _TickerResult) -> None:
+        """Copy the result of a worker process back to the trades and corporate
+        actions of the ticker and to the section 104 pool"""
+        trade_list = self.ticker_transaction_list.get(ticker, [])
+        for trade, calculation_status in zip(trade_list, result.calculation_status):
+            trade.calculation_status = calculation_status
+        for corp_action, events in zip(
+            self.ticker_corp_action_list.get(ticker, []), result.corp_action_events
+        ):
+            corp_action.events = events
+        if result.section104_value is not None:
+            self.section104.section104_list[ticker] = result.section104_value
+        if result.open_shorts is not None:
+            short_book: Deque[SellTrade] = deque()
+            for short in result.open_shorts:
+                if isinstance(short, int):
+                    trade = trade_list[short]
+                    assert isinstance(trade, SellTrade)
+                    short_book.append(trade)
+                else:
+                    short_book.append(short)
+            self.section104.short_book[ticker] = short_book
+
     def _match(
         self,
         buy_transaction: BuyTrade,
@@ -106,72 +325,103 @@ class CgtCalculator:
     def _match_same_day_disposal(self) -> None:
         """To match buy and sell transactions that occur in the same day"""
         for _, trade_list in self.ticker_transaction_list.items():
+            # index buy trades by date so each sell only visit buys of the same day
+            buy_by_date: DefaultDict[datetime.date, list[BuyTrade]] = defaultdict(list)
+            for trade in trade_list:
+                if isinstance(trade, BuyTrade):
+                    buy_by_date[trade.transaction_date].append(trade)
             for sell_transaction in [x for x in trade_list if isinstance(x, SellTrade)]:
-                matched_transactions_list = [
-                    x
-                    for x in trade_list
-                    if x.transaction_date == sell_transaction.transaction_date
-                    and isinstance(x, BuyTrade)
-                ]
-                for buy_transaction in matched_transactions_list:
+                for buy_transaction in buy_by_date.get(
+                    sell_transaction.transaction_date, []
+                ):
                     self._match(buy_transaction, sell_transaction, MatchType.SAME_DAY)
 
+    def _unmatched(self, trade: Trade) -> Decimal | Fraction | int:
+        """Shares of a trade not yet matched, as read by the matching loops"""
+        return trade.calculation_status.unmatched
+
     def _check_share_split(self, trade1: Trade, trade2: Trade) -> Fraction:
         """For bed and breakfast matching, share split needs to be checked
         trade1 and trade2 are the two trade to be matched
         """
         assert trade1.ticker == trade2.ticker
-        corp_split_list = []
-        ratio = Fraction(1)
-        for corp_action in self.ticker_corp_action_list[trade1.ticker]:
-            # note the equal sign: A corp action happens before a trade on the same day
-            if (
-                trade2.transaction_date
-                < corp_action.transaction_date
-                <= trade1.transaction_date
-            ) or (
-                trade2.transaction_date
-                >= corp_action.transaction_date
-                > trade1.transaction_date
-            ):
-                corp_split_list.append(corp_action)
-        for split_action in corp_split_list:
-            ratio = ratio * split_action.ratio
-        return ratio
+        split_index = self.ticker_split_index.get(trade1.ticker)
+        if split_index is None:
+            return Fraction(1)
+        return split_index.get_ratio(trade1.transaction_date, trade2.transaction_date)
 
-    def _match_bed_and_breakfast_disposal(self) -> None:
-        """To match buy transactions that occur within 30 days of a sell transaction"""
+    def _match_bed_and_breakfast_disposal(
+        self, end_date: Optional[datetime.date] = None
+    ) -> None:
+        """To match buy transactions that occur within 30 days of a sell transaction
+        Disposals are matched in date order, each with the earliest acquisitions
+        in its 30 days window first
+        end_date: only match disposals before this date
+        """
         for _, trade_list in self.ticker_transaction_list.items():
-            for sell_transaction in [x for x in trade_list if isinstance(x, SellTrade)]:
-                matched_transactions_list = [
+            buy_list = sorted(
+                (x for x in trade_list if isinstance(x, BuyTrade)),
+                key=lambda x: x.transaction_date,
+            )
+            buy_dates = [x.transaction_date for x in buy_list]
+            # next_open[i] leads to the first buy at or after i that still has
+            # unmatched shares, so fully matched buys are skipped
+            next_open = [
+                i if self._unmatched(buy) > 0 else i + 1
+                for i, buy in enumerate(buy_list)
+            ]
+            next_open.append(len(buy_list))
+            sell_list = sorted(
+                (
                     x
                     for x in trade_list
-                    if 30
-                    >= (x.transaction_date - sell_transaction.transaction_date).days
-                    > 0
-                    and isinstance(x, BuyTrade)
-                ]
-                for buy_transaction in matched_transactions_list:
+                    if isinstance(x, SellTrade)
+                    and (end_date is None or x.transaction_date < end_date)
+                ),
+                key=lambda x: x.transaction_date,
+            )
+            for sell_transaction in sell_list:
+                sell_date = sell_transaction.transaction_date
+                end = bisect_right(buy_dates, sell_date + BED_AND_BREAKFAST_PERIOD)
+                i = _find_open(next_open, bisect_right(buy_dates, sell_date))
+                while i < end and self._unmatched(sell_transaction) > 0:
                     self._match(
-                        buy_transaction, sell_transaction, MatchType.BED_AND_BREAKFAST
+                        buy_list[i], sell_transaction, MatchType.BED_AND_BREAKFAST
                     )
+                    if self._unmatched(buy_list[i]) == 0:
+                        next_open[i] = i + 1
+                    i = _find_open(next_open, i + 1)
 
     def _check_cover_short(self, buy_transaction: BuyTrade):
         """Check and match when there is selling short then buy to cover"""
-        unclosed_short_list = self.section104.short_list
-        unclosed_short_list.sort()
-        for short_transaction in unclosed_short_list:
-            if buy_transaction.ticker == short_transaction.ticker:
-                self._match(buy_transaction, short_transaction, MatchType.SHORT_COVER)
-            if short_transaction.get_unmatched_share() == 0:
-                self.section104.short_list.remove(short_transaction)
-
-    def _match_section104(self) -> None:
-        """To handle section 104 share matching"""
-        for ticker, trade_list in self.ticker_transaction_list.items():
+        open_shorts = self.section104.short_book.get(buy_transaction.ticker)
+        if not open_shorts:
+            return
+        # shorts are in date order, the earliest is covered first
+        passed_over: list[SellTrade] = []
+        while open_shorts and self._unmatched(buy_transaction) > 0:
+            self._match(buy_transaction, open_shorts[0], MatchType.SHORT_COVER)
+            if self._unmatched(open_shorts[0]) == 0:
+                open_shorts.popleft()
+            elif self._unmatched(buy_transaction) == 0:
+                break
+            else:
+                # a remainder too small to match after a split is left open
+                passed_over.append(open_shorts.popleft())
+        open_shorts.extendleft(reversed(passed_over))
+
+    def _match_section104(self, end_date: Optional[datetime.date] = None) -> None:
+        """To handle section 104 share matching
+        end_date: only process transactions before this date
+        """
+        for ticker in self._tickers():
             merged_list: list[Trade | ShareReorg] = [
-                *trade_list,
-                *self.ticker_corp_action_list[ticker],
+                x
+                for x in [
+                    *self.ticker_transaction_list.get(ticker, []),
+                    *self.ticker_corp_action_list[ticker],
+                ]
+                if end_date is None or x.transaction_date < end_date
             ]
             # process transaction by chronological order
             merged_list.sort()
@@ -180,7 +430,11 @@ class CgtCalculator:
                 # if this stock is shorted and have to match with the short sell trade
                 if isinstance(transaction, BuyTrade):
                     self._check_cover_short(transaction)
-                transaction.match_with_section104(self.section104)
+                self._match_with_section104(transaction)
+
+    def _match_with_section104(self, transaction: Trade | ShareReorg) -> None:
+        """Add, remove or adjust the section 104 pool for a transaction"""
+        transaction.match_with_section104(self.section104)
 
     def get_section104(self):
         """get the pool of section 104 shares"""
@@ -1,37 +1,104 @@
 """ To calculate summary of capital gain """
+from dataclasses import dataclass
+import datetime
 from decimal import Decimal
-from typing import Sequence
+from typing import Callable, Hashable, Iterable, TypeVar
 
 from capital_gain.model import SellTrade
+from const import get_tax_year
 
+KeyT = TypeVar("KeyT", bound=Hashable)
 
-def get_number_of_disposal(trades: Sequence[SellTrade]) -> int:
-    """count number of disposal for the duration specified"""
-    count = set()
+
+@dataclass
+class CapitalGainSummary:
+    """data class for storing the capital gain summary of a group of disposals"""
+
+    number_of_disposal: int = 0
+    disposal_proceeds: Decimal = Decimal(0)
+    allowable_cost: Decimal = Decimal(0)
+    total_gain_exclude_loss: Decimal = Decimal(0)
+    capital_loss: Decimal = Decimal(0)
+
+
+@dataclass(frozen=True, eq=True, order=True)
+class YearAndTicker:
+    """data class for storing year and ticker of disposals or dividends"""
+
+    tax_year: int
+    ticker: str
+
+
+def by_tax_year(trade: SellTrade) -> int:
+    """Group key of the tax year of the disposal"""
+    return get_tax_year(trade.transaction_date)
+
+
+def by_ticker(trade: SellTrade) -> str:
+    """Group key of the ticker of the disposal"""
+    return trade.ticker
+
+
+def by_year_and_ticker(trade: SellTrade) -> YearAndTicker:
+    """Group key of the tax year and ticker of the disposal"""
+    return YearAndTicker(get_tax_year(trade.transaction_date), trade.ticker)
+
+
+def get_capital_gain_summary(trades: Iterable[SellTrade]) -> CapitalGainSummary:
+    """return all the summary figures of the disposals in a single pass"""
+    return get_grouped_capital_gain_summary(trades, lambda _: None).get(
+        None, CapitalGainSummary()
+    )
+
+
+def get_grouped_capital_gain_summary(
+    trades: Iterable[SellTrade], key: Callable[[SellTrade], KeyT]
+) -> dict[KeyT, CapitalGainSummary]:
+    """return the summary figures of each group of disposals in a single pass
+    key: function giving the group of a disposal, e.g. by_tax_year
+    """
+    summary: dict[KeyT, CapitalGainSummary] = {}
+    disposals: set[tuple[KeyT, str, datetime.date]] = set()
     for trade in trades:
+        group = key(trade)
+        group_summary = summary.get(group)
+        if group_summary is None:
+            group_summary = summary[group] = CapitalGainSummary()
         # trades on the same day, same symbol are count as one disposal
-        if (trade.ticker, trade.transaction_date) not in count:
-            count.add((trade.ticker, trade.transaction_date))
-    return len(count)
+        disposal = (group, trade.ticker, trade.transaction_date)
+        if disposal not in disposals:
+            disposals.add(disposal)
+            group_summary.number_of_disposal += 1
+        group_summary.disposal_proceeds += trade.get_disposal_proceeds()
+        group_summary.allowable_cost += trade.calculation_status.allowable_cost
+        gain = trade.calculation_status.total_gain
+        if gain >= 0:
+            group_summary.total_gain_exclude_loss += gain
+        else:
+            group_summary.capital_loss += gain
+    return summary
+
 
+def get_number_of_disposal(trades: Iterable[SellTrade]) -> int:
+    """count number of disposal for the duration specified"""
+    return get_capital_gain_summary(trades).number_of_disposal
 
-def get_disposal_proceeds(trades: Sequence[SellTrade]) -> Decimal | int:
+
+def get_disposal_proceeds(trades: Iterable[SellTrade]) -> Decimal:
     """return the gross total disposal proceeds for the duration specified"""
-    return sum([trade.get_disposal_proceeds() for trade in trades], Decimal(0))
+    return get_capital_gain_summary(trades).disposal_proceeds
 
 
-def get_allowable_cost(trades: Sequence[SellTrade]) -> Decimal | int:
+def get_allowable_cost(trades: Iterable[SellTrade]) -> Decimal:
     """return the total allowable cost for the duration specified"""
-    return sum(
-        [trade.calculation_status.allowable_cost for trade in trades], Decimal(0)
-    )
+    return get_capital_gain_summary(trades).allowable_cost
 
 
-def get_total_gain_exclude_loss(trades: Sequence[SellTrade]) -> Decimal:
+def get_total_gain_exclude_loss(trades: Iterable[SellTrade]) -> Decimal:
     """return capital gain excluding loss for the duration specified"""
-    return sum([trade.get_total_gain_exclude_loss() for trade in trades], Decimal(0))
+    return get_capital_gain_summary(trades).total_gain_exclude_loss
 
 
-def get_capital_loss(trades: Sequence[SellTrade]) -> Decimal | int:
+def get_capital_loss(trades: Iterable[SellTrade]) -> Decimal:
     """return total capital loss for the duration specified"""
-    return sum([trade.get_capital_loss() for trade in trades])
+    return get_capital_gain_summary(trades).capital_loss
@@ -1,8 +1,9 @@
 """ To calculate various dividend summary """
-from collections import defaultdict
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from decimal import Decimal
+from typing import Any, Hashable, Iterable
 
+from capital_gain.capital_summary import YearAndTicker
 from capital_gain.model import Dividend
 from const import get_tax_year
 
@@ -32,46 +33,66 @@ class DividendSummary:
     dividend_summary: DividendTotal
 
 
-def get_dividend_summary(dividend_list: list[Dividend]) -> list[DividendSummary]:
+@dataclass(frozen=True, eq=True)
+class YearAndCurrency:
+    """data class for storing year and currency of dividend"""
+
+    tax_year: int
+    currency: str
+
+
+@dataclass
+class DividendBreakdown:
+    """data class for storing dividend summary data of each tax year by country,
+    by ticker and by currency"""
+
+    by_country: dict[YearAndCountry, DividendTotal] = field(default_factory=dict)
+    by_ticker: dict[YearAndTicker, DividendTotal] = field(default_factory=dict)
+    by_currency: dict[YearAndCurrency, DividendTotal] = field(default_factory=dict)
+
+
+def get_dividend_summary(dividend_list: Iterable[Dividend]) -> list[DividendSummary]:
     """Return dividend summary data given a list of Dividend and withholding tax"""
-    sorted_list = _sort_dividend_list(dividend_list)
-    summary_list = []
-    for year_and_country, dividend_list in sorted_list.items():
-        total = _get_dividend_total(dividend_list)
-        summary_list.append(DividendSummary(year_and_country, total))
-    return summary_list
-
-
-def _sort_dividend_list(
-    dividend_list: list[Dividend],
-) -> defaultdict[YearAndCountry, list[Dividend]]:
-    sorted_dividend_list: defaultdict[YearAndCountry, list[Dividend]] = defaultdict(
-        list
-    )
+    return [
+        DividendSummary(year_and_country, total)
+        for year_and_country, total in get_dividend_breakdown(
+            dividend_list
+        ).by_country.items()
+    ]
+
+
+def get_dividend_breakdown(dividend_list: Iterable[Dividend]) -> DividendBreakdown:
+    """Return dividend summary data by country, ticker and currency, adding up
+    the dividends in a single pass"""
+    breakdown = DividendBreakdown()
     for dividend in dividend_list:
+        is_dividend = dividend.is_dividend()
+        if not is_dividend and not dividend.is_withholding_tax():
+            continue
         year = get_tax_year(dividend.transaction_date)
-        country = dividend.country
-        sorted_dividend_list[YearAndCountry(year, country)].append(dividend)
-    return sorted_dividend_list
-
-
-def _get_dividend_total(dividend_list: list[Dividend]) -> DividendTotal:
-    """get the sum of value in Sterling regardless of transaction type"""
-    total_dividend = sum(
-        [
-            dividend.value.get_value()
-            for dividend in dividend_list
-            if dividend.is_dividend()
-        ],
-        Decimal(0),
-    )
-    withholding_tax = sum(
-        [
-            dividend.value.get_value()
-            for dividend in dividend_list
-            if dividend.is_withholding_tax()
-        ],
-        Decimal(0),
-    )
-    net_income = total_dividend - withholding_tax
-    return DividendTotal(total_dividend, withholding_tax, net_income)
+        value = dividend.value.get_value()
+        for table, key in (
+            (breakdown.by_country, YearAndCountry(year, dividend.country)),
+            (breakdown.by_ticker, YearAndTicker(year, dividend.ticker)),
+            (
+                breakdown.by_currency,
+                YearAndCurrency(year, dividend.value.currency.value),
+            ),
+        ):
+            _add_to_total(table, key, value, is_dividend)
+    return breakdown
+
+
+def _add_to_total(
+    table: dict[Any, DividendTotal], key: Hashable, value: Decimal, is_dividend: bool
+) -> None:
+    """Add value in Sterling of a dividend or withholding tax to the total of key"""
+    total = table.get(key)
+    if total is None:
+        total = table[key] = DividendTotal(Decimal(0), Decimal(0), Decimal(0))
+    if is_dividend:
+        total.total_dividend += value
+        total.net_income += value
+    else:
+        total.withholding_tax += value
+        total.net_income -= value
@@ -6,8 +6,24 @@ class OverMatchError(Exception):
     """Trying to match too many shares"""
 
     def __init__(self, unmatched_qty: Decimal, attempted_match_qty: Decimal) -> None:
+        self.unmatched_qty = unmatched_qty
+        self.attempted_match_qty = attempted_match_qty
         self.message = (
             f"Matching too many shares. Try to match "
             f"{attempted_match_qty}, while {unmatched_qty} unmatched"
         )
         super().__init__(self.message)
+
+    def __reduce__(self):
+        # to be raised from worker processes of parallel calculation
+        return (self.__class__, (self.unmatched_qty, self.attempted_match_qty))
+
+
+class SnapshotMismatchError(Exception):
+    """Calculation resumed from a snapshot differs from a full recalculation"""
+
+    def __init__(self, difference: str) -> None:
+        self.message = (
+            f"Calculation from snapshot does not match full calculation: {difference}"
+        )
+        super().__init__(self.message)
@@ -0,0 +1,392 @@
+""" Share matching with quantities and sterling amounts as scaled integers """
+from __future__ import annotations
+
+from dataclasses import dataclass, fields
+import datetime
+from decimal import ROUND_HALF_EVEN, Decimal
+from fractions import Fraction
+from typing import Any, Iterable, Optional, Sequence
+
+from .calculator import CgtCalculator
+from .exception import OverMatchError
+from .model import (
+    BuyTrade,
+    CapitalGainEvent,
+    MatchEvent,
+    MatchType,
+    Section104,
+    Section104AddEvent,
+    Section104RemoveEvent,
+    Section104Value,
+    SellTrade,
+    ShareAdjustmentEvent,
+    ShareReorg,
+    ShareReorgEvent,
+    Trade,
+    TradeMatchEvent,
+)
+
+QUANTITY_DIGITS = 8
+MONEY_DIGITS = 10
+QUANTITY_UNIT = Decimal(1).scaleb(-QUANTITY_DIGITS)
+MONEY_UNIT = Decimal(1).scaleb(-MONEY_DIGITS)
+
+# a quantity is a Fraction only after a share split ratio is applied to it
+Quantity = int | Fraction
+
+
+def _to_int(value: Decimal, digits: int) -> int:
+    """Scale a Decimal to integer number of 10^-digits units"""
+    return int(value.scaleb(digits).to_integral_value(rounding=ROUND_HALF_EVEN))
+
+
+def _to_decimal(value: Quantity, unit: Decimal) -> Decimal:
+    """Convert number of units back to Decimal"""
+    # type() is used as isinstance() of Fraction is slow
+    if type(value) is int:  # pylint: disable=unidiomatic-typecheck
+        return Decimal(value) * unit
+    return Decimal(value.numerator) / Decimal(value.denominator) * unit
+
+
+def _exact(value: Fraction) -> Quantity:
+    """Return the value as int if it is a whole number"""
+    return value.numerator if value.denominator == 1 else value
+
+
+def _divide(numerator: Quantity, denominator: int) -> int:
+    """Division rounded half to even, denominator must be positive"""
+    if type(numerator) is not int:  # pylint: disable=unidiomatic-typecheck
+        return round(numerator / denominator)
+    quotient, remainder = divmod(numerator, denominator)
+    if 2 * remainder > denominator or (
+        2 * remainder == denominator and quotient % 2 == 1
+    ):
+        quotient += 1
+    return quotient
+
+
+# unit of the event fields that are kept as scaled integers until they are read
+_EVENT_FIELD_UNIT = {
+    **dict.fromkeys(
+        ["qty", "old_qty", "new_qty", "to_match_sell", "to_match_buy"], QUANTITY_UNIT
+    ),
+    **dict.fromkeys(
+        [
+            "proceeds",
+            "buy_cost",
+            "trade_cost_buy",
+            "trade_cost_sell",
+            "capital_gain",
+            "total_cost",
+            "fee_cost",
+            "old_cost",
+            "new_cost",
+        ],
+        MONEY_UNIT,
+    ),
+}
+
+
+def _scaled_event(event_type: type[MatchEvent]) -> Any:
+    """Subclass of an event that is created with the scaled integers of the
+    matching and converts a field to Decimal only when it is read, e.g. when the
+    comment is rendered. It has the name of the event, and is pickled and
+    copied as the event itself."""
+    # pylint: disable=protected-access
+    event_fields = [field.name for field in fields(event_type)]  # type: ignore
+
+    def __init__(self, *raw: Any) -> None:
+        self._raw = raw
+
+    def __reduce__(self) -> tuple:
+        return event_type, tuple(getattr(self, name) for name in event_fields)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, event_type) and all(
+            getattr(self, name) == getattr(other, name) for name in event_fields
+        )
+
+    def field_property(index: int, unit: Optional[Decimal]) -> property:
+        if unit is None:
+            return property(lambda self: self._raw[index])
+        return property(lambda self: _to_decimal(self._raw[index], unit))
+
+    return type(
+        event_type.__name__,
+        (event_type,),
+        {
+            "__slots__": ("_raw",),
+            "__qualname__": event_type.__qualname__,
+            "__init__": __init__,
+            "__reduce__": __reduce__,
+            "__eq__": __eq__,
+            "__hash__": None,
+            **{
+                name: field_property(index, _EVENT_FIELD_UNIT.get(name))
+                for index, name in enumerate(event_fields)
+            },
+        },
+    )
+
+
+_TradeMatchEvent = _scaled_event(TradeMatchEvent)
+_CapitalGainEvent = _scaled_event(CapitalGainEvent)
+_Section104AddEvent = _scaled_event(Section104AddEvent)
+_Section104RemoveEvent = _scaled_event(Section104RemoveEvent)
+_ShareAdjustmentEvent = _scaled_event(ShareAdjustmentEvent)
+_ShareReorgEvent = _scaled_event(ShareReorgEvent)
+
+
+@dataclass(slots=True)
+class _FixedPointTrade:
+    """Integer state of a trade during calculation
+    quantities are in 10^-QUANTITY_DIGITS shares, amounts in 10^-MONEY_DIGITS GBP
+    """
+
+    trade: Trade
+    size: int
+    value: int
+    fee: int
+    unmatched: Quantity
+    total_gain: int
+    allowable_cost: int
+    section104_pre_trade: Quantity
+    section104_post_trade: Quantity
+
+    def get_partial_value(self, qty: Quantity) -> int:
+        """Gross value in GBP of qty shares of this trade"""
+        return _divide(self.value * qty, self.size)
+
+    def get_partial_fee(self, qty: Quantity) -> int:
+        """Allowable fee in GBP of qty shares of this trade"""
+        return _divide(self.fee * qty, self.size)
+
+
+class FixedPointCgtCalculator(CgtCalculator):
+    """CgtCalculator that does the share matching with scaled integers instead of
+    Decimal. Quantities are in 10^-8 share and amounts in 10^-10 GBP. A quantity
+    that a share split ratio is applied to is kept as an exact Fraction. The result is
+    written back to the trades and section 104 pool as Decimal once the matching
+    ends, so it differs from the Decimal calculation only by rounding far below a
+    penny. The amounts of the match events are converted when they are read.
+    """
+
+    def __init__(
+        self,
+        transaction_list: Sequence[BuyTrade | SellTrade],
+        corp_action_list: Optional[Sequence[ShareReorg]] = None,
+        init_section104: Optional[Section104] = None,
+    ) -> None:
+        super().__init__(transaction_list, corp_action_list, init_section104)
+        self.fixed_point_trade: dict[int, _FixedPointTrade] = {}
+        # open shorts of the initial section 104 pool are covered like the trades
+        trade_lists: list[Iterable[Trade]] = [
+            *self.ticker_transaction_list.values(),
+            *self.section104.short_book.values(),
+        ]
+        for trade_list in trade_lists:
+            for trade in trade_list:
+                if id(trade) in self.fixed_point_trade:
+                    continue
+                status = trade.calculation_status
+                self.fixed_point_trade[id(trade)] = _FixedPointTrade(
+                    trade,
+                    _to_int(trade.size, QUANTITY_DIGITS),
+                    _to_int(trade.get_gross_value(), MONEY_DIGITS),
+                    _to_int(trade.get_total_fee(), MONEY_DIGITS),
+                    _to_int(status.unmatched, QUANTITY_DIGITS),
+                    _to_int(status.total_gain, MONEY_DIGITS),
+                    _to_int(status.allowable_cost, MONEY_DIGITS),
+                    _to_int(status.section104_pre_trade, QUANTITY_DIGITS),
+                    _to_int(status.section104_post_trade, QUANTITY_DIGITS),
+                )
+        # quantity and cost of section 104 pool of each ticker
+        self.fixed_point_section104: dict[str, list] = {
+            ticker: [
+                _to_int(value.quantity, QUANTITY_DIGITS),
+                _to_int(value.cost, MONEY_DIGITS),
+            ]
+            for ticker, value in self.section104.section104_list.items()
+        }
+
+    def _unmatched(self, trade: Trade) -> Quantity:
+        return self.fixed_point_trade[id(trade)].unmatched
+
+    def _match(
+        self,
+        buy_transaction: BuyTrade,
+        sell_transaction: SellTrade,
+        match_type: MatchType,
+    ) -> None:
+        """Match a buy and sell trade as CgtCalculator._match.
+        The side that runs out is found by comparing exact rationals, so that side
+        is matched in full and only the other side is rounded.
+        """
+        buy = self.fixed_point_trade[id(buy_transaction)]
+        sell = self.fixed_point_trade[id(sell_transaction)]
+        if not buy.unmatched or not sell.unmatched:
+            return
+        split_ratio = (
+            self._check_share_split(buy_transaction, sell_transaction)
+            if buy_transaction.ticker in self.ticker_split_index
+            else None
+        )
+        to_match_buy: Quantity
+        to_match_sell: Quantity
+        if split_ratio is None or split_ratio == 1:
+            to_match_buy = to_match_sell = min(buy.unmatched, sell.unmatched)
+        else:
+            # number of buy shares equal to one sell share
+            ratio = split_ratio
+            if buy_transaction.transaction_date < sell_transaction.transaction_date:
+                ratio = 1 / split_ratio
+            sell_in_buy_shares = _exact(sell.unmatched * ratio)
+            if sell_in_buy_shares <= buy.unmatched:
+                to_match_sell = sell.unmatched
+                to_match_buy = sell_in_buy_shares
+            else:
+                to_match_buy = buy.unmatched
+                to_match_sell = _exact(buy.unmatched / ratio)
+            if to_match_sell == 0:
+                return
+            sell_transaction.calculation_status.events.append(
+                _ShareAdjustmentEvent(split_ratio, to_match_sell, to_match_buy)
+            )
+        buy_cost = buy.get_partial_value(to_match_buy)
+        trade_cost_buy = buy.get_partial_fee(to_match_buy)
+        self._match_with_trade(
+            buy_transaction, sell_transaction.transaction_id, to_match_buy, match_type
+        )
+        self._match_with_trade(
+            sell_transaction, buy_transaction.transaction_id, to_match_sell, match_type
+        )
+        self._capital_gain_calc(
+            sell_transaction, to_match_sell, buy_cost, trade_cost_buy
+        )
+
+    def _match_with_trade(
+        self, trade: Trade, trade_id: int, qty: Quantity, match_type: MatchType
+    ) -> None:
+        """Fixed point version of Trade.match_with_trade"""
+        state = self.fixed_point_trade[id(trade)]
+        if qty > state.unmatched:
+            raise OverMatchError(
+                _to_decimal(state.unmatched, QUANTITY_UNIT),
+                _to_decimal(qty, QUANTITY_UNIT),
+            )
+        state.unmatched -= qty
+        trade.calculation_status.events.append(
+            _TradeMatchEvent(match_type, trade_id, qty)
+        )
+
+    def _capital_gain_calc(
+        self, trade: SellTrade, qty: Quantity, buy_cost: int, trade_cost_buy: int = 0
+    ) -> None:
+        """Fixed point version of SellTrade.capital_gain_calc"""
+        state = self.fixed_point_trade[id(trade)]
+        proceeds = state.get_partial_value(qty)
+        trade_cost_sell = state.get_partial_fee(qty)
+        capital_gain = proceeds - buy_cost - trade_cost_buy - trade_cost_sell
+        state.allowable_cost += buy_cost + trade_cost_buy + trade_cost_sell
+        state.total_gain += capital_gain
+        trade.calculation_status.events.append(
+            _CapitalGainEvent(
+                proceeds, buy_cost, trade_cost_buy, trade_cost_sell, capital_gain
+            )
+        )
+
+    def _match_section104(self, end_date: Optional[datetime.date] = None) -> None:
+        super()._match_section104(end_date)
+        self._write_result()
+
+    def _match_with_section104(self, transaction: Trade | ShareReorg) -> None:
+        pool = self.fixed_point_section104.setdefault(transaction.ticker, [0, 0])
+        # trades come first as they far outnumber the corporate actions
+        if isinstance(transaction, BuyTrade):
+            self._add_to_section104(transaction, pool)
+        elif isinstance(transaction, SellTrade):
+            self._remove_from_section104(transaction, pool)
+        elif isinstance(transaction, ShareReorg):
+            old_qty = pool[0]
+            pool[0] = _exact(pool[0] * transaction.ratio)
+            transaction.events.append(
+                _ShareReorgEvent(
+                    transaction.ticker,
+                    transaction.transaction_date,
+                    transaction.ratio,
+                    old_qty,
+                    pool[0],
+                )
+            )
+
+    def _add_to_section104(self, trade: BuyTrade, pool: list) -> None:
+        """Fixed point version of BuyTrade.match_with_section104"""
+        state = self.fixed_point_trade[id(trade)]
+        remaining_shares = state.unmatched
+        fee_cost = state.get_partial_fee(remaining_shares)
+        total_cost = state.get_partial_value(remaining_shares) + fee_cost
+        old_qty, old_cost = pool
+        pool[0] += remaining_shares
+        pool[1] += total_cost
+        state.unmatched = 0
+        state.section104_pre_trade = old_qty
+        state.section104_post_trade = pool[0]
+        if remaining_shares == 0:
+            return
+        trade.calculation_status.events.append(
+            _Section104AddEvent(
+                remaining_shares,
+                total_cost,
+                fee_cost,
+                old_qty,
+                pool[0],
+                old_cost,
+                pool[1],
+            )
+        )
+
+    def _remove_from_section104(self, trade: SellTrade, pool: list) -> None:
+        """Fixed point version of SellTrade.match_with_section104"""
+        state = self.fixed_point_trade[id(trade)]
+        matched_qty = min(state.unmatched, pool[0])
+        state.section104_pre_trade = pool[0]
+        buy_cost = 0
+        if matched_qty:
+            buy_cost = _divide(pool[1] * matched_qty, pool[0])
+            pool[1] -= buy_cost
+            pool[0] -= matched_qty
+        state.unmatched -= matched_qty
+        state.section104_post_trade = pool[0]
+        if state.unmatched > 0:
+            self.section104.add_short(trade)
+        if matched_qty == 0:
+            return
+        trade.calculation_status.events.append(
+            _Section104RemoveEvent(matched_qty, buy_cost, pool[0], pool[1])
+        )
+        self._capital_gain_calc(trade, matched_qty, buy_cost)
+
+    def _write_result(self) -> None:
+        """Copy the integer result to the trades and section 104 pool as Decimal"""
+        # the pool size after a trade is the size before the next one, so each
+        # size is converted once
+        pool_quantity: dict[Quantity, Decimal] = {}
+        for state in self.fixed_point_trade.values():
+            status = state.trade.calculation_status
+            # zero values that were zero before need no conversion
+            if state.unmatched or status.unmatched:
+                status.unmatched = _to_decimal(state.unmatched, QUANTITY_UNIT)
+            if state.total_gain or status.total_gain:
+                status.total_gain = _to_decimal(state.total_gain, MONEY_UNIT)
+            if state.allowable_cost or status.allowable_cost:
+                status.allowable_cost = _to_decimal(state.allowable_cost, MONEY_UNIT)
+            for quantity in (state.section104_pre_trade, state.section104_post_trade):
+                if quantity not in pool_quantity:
+                    pool_quantity[quantity] = _to_decimal(quantity, QUANTITY_UNIT)
+            status.section104_pre_trade = pool_quantity[state.section104_pre_trade]
+            status.section104_post_trade = pool_quantity[state.section104_post_trade]
+        for ticker, (quantity, cost) in self.fixed_point_section104.items():
+            self.section104.section104_list[ticker] = Section104Value(
+                _to_decimal(quantity, QUANTITY_UNIT),
+                _to_decimal(cost, MONEY_UNIT),
+            )
@@ -2,18 +2,22 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from collections import defaultdict
+from collections import defaultdict, deque
 from dataclasses import dataclass, field
 import datetime
 from decimal import Decimal
 from enum import Enum
 from fractions import Fraction
-from typing import ClassVar, DefaultDict, List
+from typing import Any, ClassVar, DefaultDict, Deque, List, Optional
 
 from iso4217 import Currency
 
 from .exception import OverMatchError
 
+# increase when the fields of the classes change, as objects pickled by an older
+# version cannot be loaded, e.g. from the cache of parsed statements
+MODEL_VERSION = "2"
+
 
 class CorporateActionType(Enum):
     """Enum of type of corporate actions"""
@@ -40,9 +44,11 @@ class MatchType(Enum):
     SHORT_COVER = "Cover sell short"
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Money:
-    """class to record monetary value of various currency"""
+    """class to record monetary value of various currency
+    It is immutable so that the sterling value cached by a trade stays valid
+    """
 
     value: Decimal
     exchange_rate: Decimal = field(default=Decimal(1))
@@ -54,21 +60,162 @@ class Money:
         return self.value * self.exchange_rate
 
 
-@dataclass
+class MatchEvent(ABC):
+    """A step of the calculation, recorded during matching and only rendered as
+    text when the comment is needed"""
+
+    __slots__ = ()
+
+    @abstractmethod
+    def render(self) -> str:
+        """Return the text of this step for the comment"""
+
+
+@dataclass(slots=True)
+class TradeMatchEvent(MatchEvent):
+    """Shares matched with another trade by same day, bed and breakfast or
+    covering short rule"""
+
+    match_type: MatchType
+    trade_id: int
+    qty: Decimal
+
+    def render(self) -> str:
+        return (
+            f"{self.match_type.value} matched with trade ID"
+            f" {self.trade_id} for {self.qty:.2f} share(s)"
+        )
+
+
+@dataclass(slots=True)
+class CapitalGainEvent(MatchEvent):
+    """Capital gain of a part of a disposal"""
+
+    proceeds: Decimal
+    buy_cost: Decimal
+    trade_cost_buy: Decimal
+    trade_cost_sell: Decimal
+    capital_gain: Decimal
+
+    def render(self) -> str:
+        buy_cost_comment = (
+            f"Minus allowable acquisition dealing cost: £{self.trade_cost_buy:.2f}\n"
+            if self.trade_cost_buy
+            else ""
+        )
+        sell_cost_comment = (
+            f"Minus allowable disposal dealing cost: £{self.trade_cost_sell:.2f}\n"
+            if self.trade_cost_sell
+            else ""
+        )
+        return (
+            f"Gross proceeds is £{self.proceeds:.2f}.\n"
+            f"Minus cost of buying: £{self.buy_cost:.2f}\n"
+            + buy_cost_comment
+            + sell_cost_comment
+            + f"Capital gain = £{self.capital_gain:.2f}\n\n"
+        )
+
+
+@dataclass(slots=True)
+class Section104AddEvent(MatchEvent):
+    """Shares of an acquisition added to section 104 pool"""
+
+    qty: Decimal
+    total_cost: Decimal
+    fee_cost: Decimal
+    old_qty: Decimal
+    new_qty: Decimal
+    old_cost: Decimal
+    new_cost: Decimal
+
+    def render(self) -> str:
+        return (
+            f"{self.qty:2f} share(s) added to Section104 pool "
+            f"with allowable cost £{self.total_cost:.2f} "
+            f"including dealing cost £{self.fee_cost:.2f}.\n"
+            f"Total number of share(s) for section 104 "
+            f"changes from {self.old_qty:2f} to {self.new_qty:2f}.\n"
+            f"Total allowable cost change from £{self.old_cost:.2f} to "
+            f"£{self.new_cost:.2f}\n\n"
+        )
+
+
+@dataclass(slots=True)
+class Section104RemoveEvent(MatchEvent):
+    """Shares of a disposal removed from section 104 pool"""
+
+    qty: Decimal
+    buy_cost: Decimal
+    new_qty: Decimal
+    new_cost: Decimal
+
+    def render(self) -> str:
+        return (
+            f"{self.qty:.2f} share(s) removed from Section104 pool "
+            f"with allowable cost £{self.buy_cost:.2f}.\n"
+            f"New total number of share(s) for section 104 "
+            f"is {self.new_qty:.2f}.\n"
+            f"New total allowable cost is £{self.new_cost:.2f}\n\n"
+        )
+
+
+@dataclass(slots=True)
+class ShareAdjustmentEvent(MatchEvent):
+    """Different number of shares matched due to share split between the trades"""
+
+    ratio: Fraction
+    to_match_sell: Decimal
+    to_match_buy: Decimal
+
+    def render(self) -> str:
+        return (
+            f"Acquisition of size {self.to_match_buy:.2f} is matched to disposal of "
+            f"size {self.to_match_sell:.2f} due to forward/reverse split "
+            f"with ratio {self.ratio}.\n"
+        )
+
+
+@dataclass(slots=True)
+class ShareReorgEvent(MatchEvent):
+    """Section 104 pool changed by share split or merge"""
+
+    ticker: str
+    transaction_date: datetime.date
+    ratio: Fraction
+    old_qty: Decimal
+    new_qty: Decimal
+
+    def render(self) -> str:
+        return (
+            f"Share {self.ticker} split/merge at date {self.transaction_date} with "
+            f"ratio {self.ratio.denominator} to {self.ratio.numerator}.\n"
+            f"Old quantity of Section 104 is {self.old_qty:2f}\n"
+            f"New quantity is now "
+            f"{self.new_qty:2f}\n"
+        )
+
+
+@dataclass(slots=True)
 class CalculationStatus:
     """To keep track of buy and sell matching during calculation"""
 
     unmatched: Decimal
-    comment: str = ""
+    events: list[MatchEvent] = field(default_factory=list)
     total_gain: Decimal = Decimal(0)
     allowable_cost: Decimal = Decimal(0)
     section104_pre_trade: Decimal = Decimal(0)
     section104_post_trade: Decimal = Decimal(0)
 
+    @property
+    def comment(self) -> str:
+        """Text of the calculation rendered from the events"""
+        return "".join(event.render() for event in self.events)
+
     def reset_calculation(self, size: Decimal):
         """clear the calculation and reset unmatched size"""
         self.unmatched = size
-        self.comment = ""
+        self.events = []
 
     def match(self, size: Decimal) -> None:
         """Update the transaction record when it is matched"""
@@ -79,18 +226,22 @@ class CalculationStatus:
 
 
 # mypy bug #5374
-@dataclass  # type: ignore
+@dataclass(slots=True)  # type: ignore
 class Transaction(ABC):
-    """base class for all transactions"""
+    """base class for all transactions
+    transaction_id: Optional keyword only id of a stored transaction that is read
+    back, so that it does not take a new id from the counter. Ids start from 1.
+    """
 
     ticker: str
     transaction_date: datetime.date
-    transaction_id: int = field(init=False)
+    transaction_id: int = field(default=0, kw_only=True)
     transaction_id_counter: ClassVar[int] = 1
 
     def __post_init__(self) -> None:
-        self.transaction_id = Transaction.transaction_id_counter
-        Transaction.transaction_id_counter += 1
+        if not self.transaction_id:
+            self.transaction_id = Transaction.transaction_id_counter
+            Transaction.transaction_id_counter += 1
 
     def __lt__(self, other: Transaction) -> bool:
         """For sorting of Transaction for gain calculation"""
@@ -114,7 +265,7 @@ class Transaction(ABC):
         """Subclass should implement this for handling of section 104"""
 
 
-@dataclass
+@dataclass(slots=True)
 class Dividend:
     """Dataclass to store dividend information"""
 
@@ -143,7 +294,7 @@ class Dividend:
         return self.transaction_type == DividendType.WITHHOLDING
 
 
-@dataclass
+@dataclass(slots=True)
 class ShareReorg(Transaction):
     """Dataclass to store share split and merge events
     ratio: If there is a share split of 2 shares to 5, then the ratio would be 2.5
@@ -153,11 +304,16 @@ class ShareReorg(Transaction):
     size: Decimal
     ratio: Fraction = Fraction(1)
     description: str = ""
-    comment: str = ""
+    events: list[MatchEvent] = field(default_factory=list)
+
+    @property
+    def comment(self) -> str:
+        """Text of the calculation rendered from the events"""
+        return "".join(event.render() for event in self.events)
 
     def clear_calculation(self):
         """discard old calculation and start anew"""
-        self.comment = ""
+        self.events = []
 
     def match_with_section104(self, section_104: Section104) -> None:
         """Changing section 104 pool due to share split/merge"""
@@ -166,16 +322,18 @@ class ShareReorg(Transaction):
             self.ticker,
             old_qty * Decimal(self.ratio.numerator) / Decimal(self.ratio.denominator),
         )
-        self.comment += (
-            f"Share {self.ticker} split/merge at date {self.transaction_date} with "
-            f"ratio {self.ratio.denominator} to {self.ratio.numerator}.\n"
-            f"Old quantity of Section 104 is {old_qty:2f}\n"
-            f"New quantity is now "
-            f"{section_104.get_qty(self.ticker):2f}\n"
+        self.events.append(
+            ShareReorgEvent(
+                self.ticker,
+                self.transaction_date,
+                self.ratio,
+                old_qty,
+                section_104.get_qty(self.ticker),
+            )
         )
 
 
-@dataclass  # type: ignore
+@dataclass(slots=True)  # type: ignore
 class Trade(Transaction, ABC):
     """Dataclass to store transaction
     ticker: A string represent the symbol of the security
@@ -183,6 +341,8 @@ class Trade(Transaction, ABC):
     transaction value: Gross value of the trade
     fee_and_tax: Note that fee could be negative due to rebates,
     here the convention is positive value means fee, and negative value mean credit
+    The sterling value and total fee are cached, assign a new list to fee_and_tax
+    instead of changing the list so that the cache is cleared.
     """
 
     size: Decimal
@@ -191,11 +351,39 @@ class Trade(Transaction, ABC):
     fee_and_tax: list[Money] = field(default_factory=list)
     transaction_type: str = "Trade"
     description: str = ""
+    _gross_value: Optional[Decimal] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _total_fee: Optional[Decimal] = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     def __post_init__(self) -> None:
-        super().__post_init__()
+        # zero argument super() does not work with slots=True dataclass
+        Transaction.__post_init__(self)
         self.calculation_status = CalculationStatus(self.size)
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        if name == "transaction_value":
+            object.__setattr__(self, "_gross_value", None)
+        elif name == "fee_and_tax":
+            object.__setattr__(self, "_total_fee", None)
+
+    def get_gross_value(self) -> Decimal:
+        """return the gross value of the whole trade in GBP"""
+        if self._gross_value is None:
+            self._gross_value = self.transaction_value.get_value()
+        return self._gross_value
+
+    def get_total_fee(self) -> Decimal:
+        """return the total fee and tax of the whole trade in GBP"""
+        if self._total_fee is None:
+            self._total_fee = sum(
+                (fee.get_value() for fee in self.fee_and_tax), Decimal(0)
+            )
+        return self._total_fee
+
     def clear_calculation(self):
         """discard old calculation and start anew"""
         self.calculation_status = CalculationStatus(self.size)
@@ -206,19 +394,18 @@ class Trade(Transaction, ABC):
 
     def get_partial_value(self, qty: Decimal) -> Decimal:
         """return the gross value for partial share matching for this transaction"""
-        return self.transaction_value.get_value() * qty / self.size
+        return self.get_gross_value() * qty / self.size
 
     def get_partial_fee(self, qty: Decimal) -> Decimal:
         """return the allowable fee for partial share matching for this transaction"""
-        return sum(fee.get_value() for fee in self.fee_and_tax) * qty / self.size
+        return self.get_total_fee() * qty / self.size
 
     def match_with_trade(self, trade_id: int, qty: Decimal, match_type: MatchType):
         """Note for buy trade to comment when the shares are matched for same day or
         bed and breakfast"""
         self.calculation_status.match(qty)
-        self.calculation_status.comment += (
-            f"{match_type.value} matched with trade ID"
-            f" {trade_id} for {qty:.2f} share(s)"
+        self.calculation_status.events.append(
+            TradeMatchEvent(match_type, trade_id, qty)
         )
 
     def get_total_gain_exclude_loss(self):
@@ -235,7 +422,7 @@ class Trade(Transaction, ABC):
         return loss if loss <= 0 else 0
 
 
-@dataclass
+@dataclass(slots=True)
 class BuyTrade(Trade):
     """Represent a buying trade"""
 
@@ -255,18 +442,20 @@ class BuyTrade(Trade):
         if remaining_shares == 0:
             return
         else:
-            self.calculation_status.comment += (
-                f"{remaining_shares:2f} share(s) added to Section104 pool "
-                f"with allowable cost £{total_cost:.2f} "
-                f"including dealing cost £{fee_cost:.2f}.\n"
-                f"Total number of share(s) for section 104 "
-                f"changes from {old_qty:2f} to {section_104.get_qty(self.ticker):2f}.\n"
-                f"Total allowable cost change from £{old_cost:.2f} to "
-                f"£{section_104.get_cost(self.ticker):.2f}\n\n"
+            self.calculation_status.events.append(
+                Section104AddEvent(
+                    remaining_shares,
+                    total_cost,
+                    fee_cost,
+                    old_qty,
+                    section_104.get_qty(self.ticker),
+                    old_cost,
+                    section_104.get_cost(self.ticker),
+                )
             )
 
 
-@dataclass
+@dataclass(slots=True)
 class SellTrade(Trade):
     """Represent a selling trade"""
 
@@ -285,16 +474,17 @@ class SellTrade(Trade):
         self.calculation_status.section104_post_trade = section_104.get_qty(self.ticker)
         # if section 104 is not enough to match all sell shares, it is sell short
         if self.calculation_status.unmatched > 0:
-            section_104.short_list.append(self)
+            section_104.add_short(self)
         # there is no need to show calculation if 0 shares are matched
         if matched_qty == 0:
             return
-        self.calculation_status.comment += (
-            f"{matched_qty:.2f} share(s) removed from Section104 pool "
-            f"with allowable cost £{buy_cost:.2f}.\n"
-            f"New total number of share(s) for section 104 "
-            f"is {section_104.get_qty(self.ticker):.2f}.\n"
-            f"New total allowable cost is £{section_104.get_cost(self.ticker):.2f}\n\n"
+        self.calculation_status.events.append(
+            Section104RemoveEvent(
+                matched_qty,
+                buy_cost,
+                section_104.get_qty(self.ticker),
+                section_104.get_cost(self.ticker),
+            )
         )
         self.capital_gain_calc(matched_qty, buy_cost)
 
@@ -310,36 +500,22 @@ class SellTrade(Trade):
         proceeds = self.get_partial_value(qty)
         trade_cost_sell = self.get_partial_fee(qty)
         capital_gain = proceeds - buy_cost - trade_cost_buy - trade_cost_sell
-        buy_cost_comment = (
-            f"Minus allowable acquisition dealing cost: £{trade_cost_buy:.2f}\n"
-            if trade_cost_buy
-            else ""
-        )
-        sell_cost_comment = (
-            f"Minus allowable disposal dealing cost: £{trade_cost_sell:.2f}\n"
-            if trade_cost_sell
-            else ""
-        )
         self.calculation_status.allowable_cost += (
             buy_cost + trade_cost_buy + trade_cost_sell
         )
         self.calculation_status.total_gain += capital_gain
-        self.calculation_status.comment += (
-            f"Gross proceeds is £{proceeds:.2f}.\n"
-            f"Minus cost of buying: £{buy_cost:.2f}\n"
-            + buy_cost_comment
-            + sell_cost_comment
-            + f"Capital gain = £{capital_gain:.2f}\n\n"
+        self.calculation_status.events.append(
+            CapitalGainEvent(
+                proceeds, buy_cost, trade_cost_buy, trade_cost_sell, capital_gain
+            )
         )
 
     def share_adjustment(
         self, ratio: Fraction, to_match_sell: Decimal, to_match_buy: Decimal
     ):
         """Comment when a share split occurs during bed and breakfast matching"""
-        self.calculation_status.comment += (
-            f"Acquisition of size {to_match_buy:.2f} is matched to disposal of "
-            f"size {to_match_sell:.2f} due to forward/reverse split "
-            f"with ratio {ratio}.\n"
+        self.calculation_status.events.append(
+            ShareAdjustmentEvent(ratio, to_match_sell, to_match_buy)
         )
 
 
@@ -351,7 +527,18 @@ class Section104:
         self.section104_list: DefaultDict[str, Section104Value] = defaultdict(
             Section104Value
         )
-        self.short_list: List[SellTrade] = []
+        # open short sales of each ticker in date order
+        self.short_book: DefaultDict[str, Deque[SellTrade]] = defaultdict(deque)
+
+    @property
+    def short_list(self) -> List[SellTrade]:
+        """Return open short sales of all tickers in date order. The list is built
+        and sorted on each access, read short_book for the shorts of a ticker"""
+        return sorted(trade for shorts in self.short_book.values() for trade in shorts)
+
+    def add_short(self, trade: SellTrade) -> None:
+        """Record a sell trade that is not fully matched as an open short sale"""
+        self.short_book[trade.ticker].append(trade)
 
     def add_to_section104(self, symbol: str, qty: Decimal, cost: Decimal) -> None:
         """Handle adding shares to section 104 pool"""
@@ -395,7 +582,7 @@ class Section104:
         return self.section104_list[symbol].cost
 
 
-@dataclass
+@dataclass(slots=True)
 class Section104Value:
     """dataclass to store quantity and allowable cost for section 104"""
 
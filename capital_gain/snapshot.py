@@ -0,0 +1,241 @@
+""" Snapshot of capital gain calculation at a tax year boundary, so that the next
+tax year can be calculated without the full trade history
+"""
+from __future__ import annotations
+
+from collections import Counter
+from copy import deepcopy
+from dataclasses import dataclass, field
+import datetime
+from decimal import Decimal
+import pickle
+from typing import Optional, Sequence
+
+from .calculator import BED_AND_BREAKFAST_PERIOD, CgtCalculator
+from .exception import SnapshotMismatchError
+from .model import BuyTrade, Section104, SellTrade, ShareReorg, Transaction
+
+SNAPSHOT_VERSION = 1
+
+
+@dataclass
+class Section104Snapshot:
+    """State of the calculation at a tax year boundary
+    section104: section 104 pool and open shorts after processing all transactions
+    before the cutoff, which is 30 days before the boundary
+    pending_trades: trades from the cutoff to the boundary, with same day matching
+    and bed and breakfast matching of earlier disposals done. Disposals in this
+    period can still be matched with acquisitions after the boundary
+    pending_corp_actions: share split and merge from the cutoff to the boundary
+    split_history: share split and merge before the cutoff of tickers with open
+    shorts, needed for the ratio when the shorts are covered
+    """
+
+    boundary: datetime.date
+    section104: Section104
+    pending_trades: list[BuyTrade | SellTrade]
+    pending_corp_actions: list[ShareReorg]
+    split_history: list[ShareReorg] = field(default_factory=list)
+
+    @property
+    def cutoff(self) -> datetime.date:
+        """Transactions before this date are final in the snapshot"""
+        return self.boundary - BED_AND_BREAKFAST_PERIOD
+
+
+def take_snapshot(
+    transaction_list: Sequence[BuyTrade | SellTrade],
+    boundary: datetime.date,
+    corp_action_list: Optional[Sequence[ShareReorg]] = None,
+    init_section104: Optional[Section104] = None,
+    previous: Optional[Section104Snapshot] = None,
+) -> Section104Snapshot:
+    """Take a snapshot at boundary from the trade history, or from the snapshot
+    of a previous boundary and the trades after it.
+    Transactions from the boundary onward are ignored, the given transactions and
+    the previous snapshot are not modified.
+    """
+    trades = deepcopy([x for x in transaction_list if x.transaction_date < boundary])
+    corp_actions = deepcopy(
+        [x for x in corp_action_list or [] if x.transaction_date < boundary]
+    )
+    for trade in trades:
+        trade.clear_calculation()
+    split_history: list[ShareReorg] = []
+    if previous is not None:
+        previous = deepcopy(previous)
+        calculator = resume_calculator(previous, trades, corp_actions)
+        trades = [*previous.pending_trades, *trades]
+        corp_actions = [*previous.pending_corp_actions, *corp_actions]
+        split_history = previous.split_history
+    else:
+        calculator = CgtCalculator(trades, corp_actions, init_section104)
+    cutoff = boundary - BED_AND_BREAKFAST_PERIOD
+    calculator.calculate_tax_before(cutoff)
+    section104 = calculator.get_section104()
+    short_tickers = {
+        ticker for ticker, shorts in section104.short_book.items() if shorts
+    }
+    return Section104Snapshot(
+        boundary,
+        section104,
+        [x for x in trades if x.transaction_date >= cutoff],
+        [x for x in corp_actions if x.transaction_date >= cutoff],
+        [
+            x
+            for x in [*split_history, *corp_actions]
+            if x.transaction_date < cutoff and x.ticker in short_tickers
+        ],
+    )
+
+
+def resume_calculator(
+    snapshot: Section104Snapshot,
+    transaction_list: Sequence[BuyTrade | SellTrade],
+    corp_action_list: Optional[Sequence[ShareReorg]] = None,
+) -> CgtCalculator:
+    """Return a calculator of the pending trades of the snapshot and new trades
+    from the boundary onward. The pending trades of the snapshot are updated by
+    the calculation, load the snapshot again to resume it another time.
+    """
+    corp_action_list = corp_action_list or []
+    for transaction in [*transaction_list, *corp_action_list]:
+        if transaction.transaction_date < snapshot.boundary:
+            raise ValueError(
+                f"Transaction {transaction.transaction_id} on "
+                f"{transaction.transaction_date} is before the snapshot boundary "
+                f"{snapshot.boundary}"
+            )
+    calculator = CgtCalculator(
+        [*snapshot.pending_trades, *transaction_list],
+        [*snapshot.pending_corp_actions, *corp_action_list],
+        snapshot.section104,
+    )
+    calculator.add_split_history(snapshot.split_history)
+    return calculator
+
+
+def save_snapshot(snapshot: Section104Snapshot, file: str) -> None:
+    """Write the snapshot to file"""
+    with open(file, "wb") as snapshot_file:
+        pickle.dump((SNAPSHOT_VERSION, snapshot), snapshot_file)
+
+
+def load_snapshot(file: str) -> Section104Snapshot:
+    """Read a snapshot from file
+    Transaction ids of the snapshot come from the run that saved it, the id
+    counter is moved past them so that statements loaded afterward do not reuse
+    the ids
+    """
+    with open(file, "rb") as snapshot_file:
+        version, snapshot = pickle.load(snapshot_file)
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(
+            f"Snapshot version {version} is not supported, "
+            f"version {SNAPSHOT_VERSION} is expected"
+        )
+    transactions: list[Transaction] = [
+        *snapshot.pending_trades,
+        *snapshot.pending_corp_actions,
+        *(x for shorts in snapshot.section104.short_book.values() for x in shorts),
+    ]
+    if transactions:
+        Transaction.transaction_id_counter = max(
+            Transaction.transaction_id_counter,
+            max(x.transaction_id for x in transactions) + 1,
+        )
+    return snapshot
+
+
+def _trade_result(
+    trade: BuyTrade | SellTrade,
+) -> tuple[str, datetime.date, str, Decimal, Decimal, Decimal, Decimal, Decimal]:
+    """Content and calculation result of a trade, transaction id is left out as it
+    differs between runs"""
+    return (
+        trade.ticker,
+        trade.transaction_date,
+        trade.transaction_type,
+        trade.size,
+        trade.get_gross_value(),
+        trade.calculation_status.unmatched,
+        trade.calculation_status.total_gain,
+        trade.calculation_status.allowable_cost,
+    )
+
+
+def _compare(name: str, expected: Counter, actual: Counter) -> None:
+    """Raise SnapshotMismatchError if the two collections differ"""
+    if expected != actual:
+        raise SnapshotMismatchError(
+            f"{name} only in full calculation: {list((expected - actual).elements())}, "
+            f"only in calculation from snapshot: {list((actual - expected).elements())}"
+        )
+
+
+def verify_snapshot(
+    snapshot: Section104Snapshot,
+    transaction_list: Sequence[BuyTrade | SellTrade],
+    corp_action_list: Optional[Sequence[ShareReorg]] = None,
+    init_section104: Optional[Section104] = None,
+) -> None:
+    """Prove that resuming from the snapshot gives the same result as a full
+    calculation of the whole trade history, raise SnapshotMismatchError otherwise.
+    Trades from the cutoff onward, open shorts at the cutoff and the final
+    section 104 pool are compared. Neither the snapshot nor the given
+    transactions are modified.
+    """
+    corp_action_list = corp_action_list or []
+    full_trades = deepcopy(list(transaction_list))
+    for trade in full_trades:
+        trade.clear_calculation()
+    full = CgtCalculator(full_trades, deepcopy(corp_action_list), init_section104)
+    full.calculate_tax()
+
+    resumed_snapshot = deepcopy(snapshot)
+    new_trades = deepcopy(
+        [x for x in transaction_list if x.transaction_date >= snapshot.boundary]
+    )
+    for trade in new_trades:
+        trade.clear_calculation()
+    resumed = resume_calculator(
+        resumed_snapshot,
+        new_trades,
+        deepcopy(
+            [x for x in corp_action_list if x.transaction_date >= snapshot.boundary]
+        ),
+    )
+    # shorts opened before the cutoff and covered later are part of the result
+    open_shorts = resumed.get_section104().short_list
+    resumed.calculate_tax()
+
+    open_short_content = {_trade_result(x)[:5] for x in open_shorts}
+    _compare(
+        "Trades",
+        Counter(
+            _trade_result(x)
+            for x in full_trades
+            if x.transaction_date >= snapshot.cutoff
+            or _trade_result(x)[:5] in open_short_content
+        ),
+        Counter(
+            _trade_result(x)
+            for x in [*resumed_snapshot.pending_trades, *new_trades, *open_shorts]
+        ),
+    )
+    _compare(
+        "Section 104 pools",
+        Counter(
+            (ticker, value.quantity, value.cost)
+            for ticker, value in full.get_section104().section104_list.items()
+        ),
+        Counter(
+            (ticker, value.quantity, value.cost)
+            for ticker, value in resumed.get_section104().section104_list.items()
+        ),
+    )
+    _compare(
+        "Open shorts",
+        Counter(_trade_result(x) for x in full.get_section104().short_list),
+        Counter(_trade_result(x) for x in resumed.get_section104().short_list),
+    )
@@ -0,0 +1,263 @@
+""" Columnar storage of trades, to hold a large number of trades such as the fx
+trades from statement of funds with less memory than one object per trade
+"""
+from __future__ import annotations
+
+from array import array
+from collections import defaultdict
+from copy import deepcopy
+import datetime
+from decimal import Decimal
+from typing import DefaultDict, Hashable, Iterable, Optional, Sequence, overload
+
+from .calculator import calculate_ticker
+from .model import (
+    BuyTrade,
+    CalculationStatus,
+    MatchEvent,
+    Money,
+    Section104,
+    SellTrade,
+    ShareReorg,
+)
+
+# digits of a coefficient that always fits in a signed 64 bit integer
+_MAX_DIGITS = 18
+
+
+class _ValueTable:
+    """Keep one copy of each repeated value such as ticker, currency and
+    description, and refer to it by index"""
+
+    def __init__(self) -> None:
+        self.values: list = []
+        self.index: dict[Hashable, int] = {}
+
+    def add(self, value: Hashable) -> int:
+        """Return index of the value, adding it if it is new"""
+        if value not in self.index:
+            self.index[value] = len(self.values)
+            self.values.append(value)
+        return self.index[value]
+
+
+class _DecimalColumn:
+    """Decimal values stored as integer coefficient and exponent, so that a value
+    is read back exactly. A value that does not fit, such as one with more than
+    18 digits, is kept as it is."""
+
+    def __init__(self) -> None:
+        self.coefficient = array("q")
+        self.exponent = array("b")
+        self.other: dict[int, Decimal] = {}
+
+    def append(self, value: Decimal) -> None:
+        """Add a value to the end of the column"""
+        self.coefficient.append(0)
+        self.exponent.append(0)
+        self[len(self.coefficient) - 1] = value
+
+    def __getitem__(self, index: int) -> Decimal:
+        if self.other and index in self.other:
+            return self.other[index]
+        return Decimal(self.coefficient[index]).scaleb(self.exponent[index])
+
+    def __setitem__(self, index: int, value: Decimal) -> None:
+        sign, digits, exponent = value.as_tuple()
+        if (
+            isinstance(exponent, int)
+            and -128 <= exponent <= 127
+            and len(digits) <= _MAX_DIGITS
+            and (value or not sign)
+        ):
+            self.coefficient[index] = int(value.scaleb(-exponent))
+            self.exponent[index] = exponent
+            self.other.pop(index, None)
+        else:
+            self.other[index] = value
+
+
+class TradeStore(Sequence[BuyTrade | SellTrade]):
+    """Buy and sell trades stored in parallel arrays of dates, sizes, values and
+    fees instead of one set of objects per trade. Decimal values are kept as
+    integer coefficient and exponent.
+    A trade object with the same transaction id and calculation status is created
+    each time a trade is read. Use calculate_from_store to calculate the trades
+    one ticker at a time and store the result, CgtCalculator given the store reads
+    every trade at once and keeps the result in its own copy of the trades.
+    """
+
+    def __init__(self, trades: Iterable[BuyTrade | SellTrade] = ()) -> None:
+        self._table = _ValueTable()
+        self._is_buy = array("b")
+        self._transaction_id = array("q")
+        self._ticker = array("l")
+        self._date = array("l")  # ordinal of the date
+        self._size = _DecimalColumn()
+        self._value = _DecimalColumn()
+        self._exchange_rate = _DecimalColumn()
+        self._currency = array("l")
+        self._note = array("l")
+        self._transaction_type = array("l")
+        self._description = array("l")
+        # fees of the i-th trade are from _fee_start[i] to _fee_start[i + 1]
+        self._fee_start = array("q", [0])
+        self._fee_value = _DecimalColumn()
+        self._fee_exchange_rate = _DecimalColumn()
+        self._fee_currency = array("l")
+        self._fee_note = array("l")
+        # position of the trades of each ticker, by index of the ticker
+        self._ticker_rows: DefaultDict[int, array] = defaultdict(lambda: array("q"))
+        # calculation status, events are kept only for trades that have any
+        self._unmatched = _DecimalColumn()
+        self._total_gain = _DecimalColumn()
+        self._allowable_cost = _DecimalColumn()
+        self._section104_pre_trade = _DecimalColumn()
+        self._section104_post_trade = _DecimalColumn()
+        self._events: dict[int, list[MatchEvent]] = {}
+        self.extend(trades)
+
+    def append(self, trade: BuyTrade | SellTrade) -> None:
+        """Add a trade to the end of the store"""
+        if not isinstance(trade, (BuyTrade, SellTrade)):
+            raise TypeError(f"Only BuyTrade and SellTrade can be stored, got {trade}")
+        index = len(self)
+        self._is_buy.append(isinstance(trade, BuyTrade))
+        self._transaction_id.append(trade.transaction_id)
+        ticker = self._table.add(trade.ticker)
+        self._ticker.append(ticker)
+        self._ticker_rows[ticker].append(index)
+        self._date.append(trade.transaction_date.toordinal())
+        self._size.append(trade.size)
+        self._value.append(trade.transaction_value.value)
+        self._exchange_rate.append(trade.transaction_value.exchange_rate)
+        self._currency.append(self._table.add(trade.transaction_value.currency))
+        self._note.append(self._table.add(trade.transaction_value.note))
+        self._transaction_type.append(self._table.add(trade.transaction_type))
+        self._description.append(self._table.add(trade.description))
+        for fee in trade.fee_and_tax:
+            self._fee_value.append(fee.value)
+            self._fee_exchange_rate.append(fee.exchange_rate)
+            self._fee_currency.append(self._table.add(fee.currency))
+            self._fee_note.append(self._table.add(fee.note))
+        self._fee_start.append(len(self._fee_note))
+        for column in (
+            self._unmatched,
+            self._total_gain,
+            self._allowable_cost,
+            self._section104_pre_trade,
+            self._section104_post_trade,
+        ):
+            column.append(Decimal(0))
+        self.set_calculation_status(index, trade.calculation_status)
+
+    def extend(self, trades: Iterable[BuyTrade | SellTrade]) -> None:
+        """Add trades to the end of the store"""
+        for trade in trades:
+            self.append(trade)
+
+    def tickers(self) -> list[str]:
+        """Tickers of the stored trades in the order they are first added"""
+        return [self._table.values[ticker] for ticker in self._ticker_rows]
+
+    def get_ticker_index(self, ticker: str) -> Sequence[int]:
+        """Position of the trades of a ticker in the store"""
+        if ticker not in self._table.index:
+            return []
+        return self._ticker_rows.get(self._table.index[ticker], [])
+
+    def set_calculation_status(self, index: int, status: CalculationStatus) -> None:
+        """Store the calculation status of the index-th trade"""
+        self._unmatched[index] = status.unmatched
+        self._total_gain[index] = status.total_gain
+        self._allowable_cost[index] = status.allowable_cost
+        self._section104_pre_trade[index] = status.section104_pre_trade
+        self._section104_post_trade[index] = status.section104_post_trade
+        if status.events:
+            self._events[index] = status.events
+        else:
+            self._events.pop(index, None)
+
+    def __len__(self) -> int:
+        return len(self._transaction_id)
+
+    @overload
+    def __getitem__(self, index: int) -> BuyTrade | SellTrade:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[BuyTrade | SellTrade]:
+        ...
+
+    def __getitem__(
+        self, index: int | slice
+    ) -> BuyTrade | SellTrade | list[BuyTrade | SellTrade]:
+        if isinstance(index, slice):
+            return [self._get_trade(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("TradeStore index out of range")
+        return self._get_trade(index)
+
+    def _get_trade(self, index: int) -> BuyTrade | SellTrade:
+        """Create the trade object of the index-th trade"""
+        values = self._table.values
+        fees = [
+            Money(
+                self._fee_value[i],
+                self._fee_exchange_rate[i],
+                values[self._fee_currency[i]],
+                values[self._fee_note[i]],
+            )
+            for i in range(self._fee_start[index], self._fee_start[index + 1])
+        ]
+        trade_class = BuyTrade if self._is_buy[index] else SellTrade
+        trade = trade_class(
+            values[self._ticker[index]],
+            datetime.date.fromordinal(self._date[index]),
+            self._size[index],
+            Money(
+                self._value[index],
+                self._exchange_rate[index],
+                values[self._currency[index]],
+                values[self._note[index]],
+            ),
+            fees,
+            values[self._transaction_type[index]],
+            values[self._description[index]],
+            transaction_id=self._transaction_id[index],
+        )
+        trade.calculation_status = CalculationStatus(
+            self._unmatched[index],
+            list(self._events.get(index, [])),
+            self._total_gain[index],
+            self._allowable_cost[index],
+            self._section104_pre_trade[index],
+            self._section104_post_trade[index],
+        )
+        return trade
+
+
+def calculate_from_store(
+    store: TradeStore,
+    corp_action_list: Optional[Sequence[ShareReorg]] = None,
+    init_section104: Optional[Section104] = None,
+) -> Section104:
+    """Calculate capital gain one ticker at a time and store the result in the
+    store, so only the trade objects of one ticker are in memory at a time.
+    Return the section 104 pool and open short sales of all tickers.
+    """
+    section104 = deepcopy(init_section104) if init_section104 else Section104()
+    ticker_corp_actions: DefaultDict[str, list[ShareReorg]] = defaultdict(list)
+    for corp_action in corp_action_list or []:
+        ticker_corp_actions[corp_action.ticker].append(corp_action)
+    for ticker in dict.fromkeys([*store.tickers(), *ticker_corp_actions]):
+        index = store.get_ticker_index(ticker)
+        trades = [store[i] for i in index]
+        for trade in trades:
+            trade.clear_calculation()
+        calculate_ticker(ticker, trades, ticker_corp_actions[ticker], section104)
+        for i, trade in zip(index, trades):
+            store.set_calculation_status(i, trade.calculation_status)
+    return section104
@@ -0,0 +1,211 @@
+"""Export calculated trades, match events, section 104 pool and dividends to
+columnar files for analysis. Needs the optional pyarrow package.
+Arrow IPC files are written uncompressed so that they can be memory-mapped.
+Rows are converted and written in record batches, so memory does not grow with
+the number of rows.
+"""
+from __future__ import annotations
+
+from contextlib import ExitStack
+from dataclasses import fields
+from decimal import Context, Decimal
+from enum import Enum
+from fractions import Fraction
+import itertools
+import os
+from typing import Any, Iterable, Iterator
+
+from capital_gain.model import Dividend, MatchEvent, ShareReorg, Trade, Transaction
+from excel_output.capital_gain_list import set_section104, set_trade_data
+from excel_output.dividend_list import set_dividend_data
+from excel_output.report import ReportData
+
+# Decimal is stored as decimal128 with this many decimal places
+DECIMAL_PLACES = 10
+_QUANTUM = Decimal(1).scaleb(-DECIMAL_PLACES)
+# decimal128 holds up to 38 digits
+_DECIMAL_CONTEXT = Context(prec=38)
+BATCH_SIZE = 65536  # number of rows converted and written at a time
+# every match event row has the fields of all kinds of events as columns
+EVENT_COLUMNS = list(
+    dict.fromkeys(
+        field.name
+        for event_type in MatchEvent.__subclasses__()
+        for field in fields(event_type)  # type: ignore[arg-type]
+    )
+)
+
+
+class ExportFormat(Enum):
+    """Columnar file formats, value is the file extension"""
+
+    ARROW = "arrow"
+    PARQUET = "parquet"
+
+
+def _import_pyarrow() -> Any:
+    """Import pyarrow only when an export is written"""
+    # pylint: disable=import-outside-toplevel
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError(
+            "pyarrow is needed for columnar export, install it with "
+            "'poetry install --extras columnar'"
+        ) from error
+    return pyarrow
+
+
+def check_pyarrow() -> None:
+    """Raise ImportError if pyarrow is not installed, so that a missing pyarrow
+    is found before any report is written"""
+    _import_pyarrow()
+
+
+def _to_column_value(value: Any) -> Any:
+    """Convert a value to a type that pyarrow stores in a column"""
+    if isinstance(value, Decimal):
+        return value.quantize(_QUANTUM, context=_DECIMAL_CONTEXT)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, Fraction):
+        return str(value)
+    return value
+
+
+def _to_column_rows(rows: Iterable[dict[str, Any]]) -> Iterator[dict[str, Any]]:
+    """Convert the values of rows"""
+    for row in rows:
+        yield {key: _to_column_value(value) for key, value in row.items()}
+
+
+def _event_data(
+    transaction: Trade | ShareReorg, step: int, event: MatchEvent
+) -> dict[str, Any]:
+    """Data of a match event, with the fields of all kinds of events as columns"""
+    return {
+        "ID": transaction.transaction_id,
+        "Step": step,
+        "Event": type(event).__name__,
+        **dict.fromkeys(EVENT_COLUMNS),
+        **{
+            field.name: getattr(event, field.name)
+            for field in fields(event)  # type: ignore[arg-type]
+        },
+    }
+
+
+def _match_event_rows(
+    transaction_list: Iterable[Transaction],
+) -> Iterable[dict[str, Any]]:
+    for transaction in transaction_list:
+        if isinstance(transaction, Trade):
+            events = transaction.calculation_status.events
+        elif isinstance(transaction, ShareReorg):
+            events = transaction.events
+        else:
+            continue
+        for step, event in enumerate(events):
+            yield _event_data(transaction, step, event)
+
+
+def _dividend_rows(dividend_list: Iterable[Dividend]) -> Iterable[dict[str, Any]]:
+    for dividend in dividend_list:
+        yield {
+            "Type": dividend.transaction_type.value,
+            "Country": dividend.country,
+            **set_dividend_data(dividend),
+        }
+
+
+def iter_columnar_tables(data: ReportData) -> dict[str, Iterator[dict[str, Any]]]:
+    """Rows of each exported table, with values converted for columnar storage.
+    Rows are created as they are read."""
+    transaction_list = sorted(data.transaction_list)
+    tables: dict[str, Iterable[dict[str, Any]]] = {
+        "trades": (set_trade_data(x) for x in transaction_list if isinstance(x, Trade)),
+        "match_events": _match_event_rows(transaction_list),
+        "section104": (
+            set_section104(*item) for item in data.section104.section104_list.items()
+        ),
+        "dividends": _dividend_rows(
+            sorted(data.dividend_list, key=lambda x: x.transaction_date)
+        ),
+    }
+    return {name: _to_column_rows(rows) for name, rows in tables.items()}
+
+
+def get_columnar_tables(data: ReportData) -> dict[str, list[dict[str, Any]]]:
+    """Rows of each exported table as lists, see iter_columnar_tables"""
+    return {name: list(rows) for name, rows in iter_columnar_tables(data).items()}
+
+
+def _fixed_decimal_type(pyarrow: Any, schema: Any) -> Any:
+    """Set decimal columns to the same type, instead of the precision inferred
+    from the values, so that tables of different exports can be combined"""
+    decimal_type = pyarrow.decimal128(38, DECIMAL_PLACES)
+    return pyarrow.schema(
+        [
+            field.with_type(decimal_type)
+            if pyarrow.types.is_decimal(field.type)
+            else field
+            for field in schema
+        ]
+    )
+
+
+def _record_batches(pyarrow: Any, rows: Iterator[dict[str, Any]]) -> Iterator[Any]:
+    """Group the rows into record batches of BATCH_SIZE rows"""
+    while batch := list(itertools.islice(rows, BATCH_SIZE)):
+        yield pyarrow.RecordBatch.from_pylist(batch)
+
+
+def _write_table(
+    pyarrow: Any, rows: Iterator[dict[str, Any]], file: str, file_format: ExportFormat
+) -> None:
+    """Write rows to a file one record batch at a time. A column with only None in
+    a batch has no type, so batches are held until every column has a type or
+    the rows end, and the file schema is taken from them."""
+    batches = _record_batches(pyarrow, rows)
+    held = []
+    schema = pyarrow.schema([])
+    for batch in batches:
+        held.append(batch)
+        schema = pyarrow.unify_schemas(
+            [schema, _fixed_decimal_type(pyarrow, batch.schema)]
+        )
+        if not any(pyarrow.types.is_null(field.type) for field in schema):
+            break
+    with ExitStack() as stack:
+        if file_format is ExportFormat.PARQUET:
+            writer = stack.enter_context(pyarrow.parquet.ParquetWriter(file, schema))
+        else:
+            sink = stack.enter_context(pyarrow.OSFile(file, "wb"))
+            writer = stack.enter_context(pyarrow.ipc.new_file(sink, schema))
+        for batch in itertools.chain(held, batches):
+            writer.write_table(pyarrow.Table.from_batches([batch]).cast(schema))
+
+
+def write_columnar(
+    data: ReportData,
+    directory: str = ".",
+    file_format: ExportFormat = ExportFormat.ARROW,
+) -> list[str]:
+    """Write each table to a file in the directory and return the file names
+    The columns of a table with no rows are not known, so it has no columns.
+    """
+    pyarrow = _import_pyarrow()
+    file_list = []
+    for name, rows in iter_columnar_tables(data).items():
+        file = os.path.join(directory, f"{name}.{file_format.value}")
+        _write_table(pyarrow, rows, file, file_format)
+        file_list.append(file)
+    return file_list
+
+
+def read_arrow(file: str) -> Any:
+    """Memory-map an Arrow IPC file written by write_columnar as a pyarrow Table"""
+    pyarrow = _import_pyarrow()
+    return pyarrow.ipc.open_file(pyarrow.memory_map(file)).read_all()
@@ -1,15 +1,11 @@
 """Capital gain related data output generation"""
-from collections import defaultdict
-from typing import Any
-
-import xlsxwriter
+from typing import Any, Iterable, Sequence
 
 from capital_gain.capital_summary import (
-    get_allowable_cost,
-    get_capital_loss,
-    get_disposal_proceeds,
-    get_number_of_disposal,
-    get_total_gain_exclude_loss,
+    CapitalGainSummary,
+    by_tax_year,
+    by_year_and_ticker,
+    get_grouped_capital_gain_summary,
 )
 from capital_gain.model import (
     Section104,
@@ -20,66 +16,112 @@ from capital_gain.model import (
     Transaction,
 )
 from const import get_tax_year
-from excel_output.utility import make_table
+from excel_output.utility import TableWriter, make_table, new_workbook
 
 
 def write_capital_gain_excels(
-    transaction_list: list[Transaction], section104: Section104
+    transaction_list: list[Transaction],
+    section104: Section104,
+    constant_memory: bool = False,
 ):
-    """Write a list of trades and capital gain summary to a file"""
+    """Write a list of trades and capital gain summary to a file
+    constant_memory: write the workbooks row by row with flat memory use
+    """
     transaction_list.sort()
-    _write_trade_by_ticker(transaction_list)
-    _write_cgt_per_year_and_summary(transaction_list)
-    _write_section104(section104)
+    write_trade_by_ticker(transaction_list, constant_memory)
+    write_cgt_per_year_and_summary(transaction_list, constant_memory)
+    write_section104(section104, constant_memory)
 
 
-def _write_trade_by_ticker(transaction_list: list[Transaction]):
-    trade_workbook = xlsxwriter.Workbook(
-        "TradesByTicker.xlsx", {"default_date_format": "d mmm yyyy"}
+def write_trade_by_ticker(
+    transaction_list: Iterable[Transaction], constant_memory: bool = False
+):
+    """Write TradesByTicker.xlsx from transactions sorted by date
+    constant_memory: ignored if transaction_list is a Sequence with more tickers
+    than MAX_CONSTANT_MEMORY_SHEETS, for other iterables the number of tickers
+    must be within it
+    """
+    sheet_count = (
+        len({x.ticker for x in transaction_list})
+        if isinstance(transaction_list, Sequence)
+        else None
     )
-    grouped_list_ticker: defaultdict[str, list[Transaction]] = defaultdict(list)
+    trade_workbook = new_workbook("TradesByTicker.xlsx", constant_memory, sheet_count)
+    # each transaction is written to the table of its ticker as it is read
+    ticker_table: dict[str, TableWriter] = {}
     for transaction in transaction_list:
-        grouped_list_ticker[transaction.ticker].append(transaction)
-    for ticker, grouped_list in grouped_list_ticker.items():
-        make_table(trade_workbook, ticker, map(_set_trade_data, grouped_list))
+        table = ticker_table.get(transaction.ticker)
+        if table is None:
+            table = ticker_table[transaction.ticker] = TableWriter(
+                trade_workbook, transaction.ticker
+            )
+        table.write(set_trade_data(transaction))
     trade_workbook.close()
 
 
-def _write_cgt_per_year_and_summary(transaction_list: list[Transaction]):
-    cgt_workbook = xlsxwriter.Workbook(
-        "CgtPerYearAndSummary.xlsx", {"default_date_format": "d mmm yyyy"}
-    )
-    grouped_list_year: defaultdict[int, list[Transaction]] = defaultdict(list)
-    summary_data = []
+def write_cgt_per_year_and_summary(
+    transaction_list: Sequence[Transaction], constant_memory: bool = False
+):
+    """Write CgtPerYearAndSummary.xlsx from transactions sorted by date"""
+    cgt_workbook = new_workbook("CgtPerYearAndSummary.xlsx", constant_memory)
+    year_table: dict[int, TableWriter] = {}
     for transaction in transaction_list:
-        grouped_list_year[get_tax_year(transaction.transaction_date)].append(
-            transaction
-        )
-    for year, grouped_list in grouped_list_year.items():
-        sell_trades = [x for x in grouped_list if isinstance(x, SellTrade)]
-        summary_data.append(_set_capital_gain_summary(year, sell_trades))
-        make_table(cgt_workbook, str(year), map(_set_trade_data, grouped_list))
-    make_table(cgt_workbook, "Summary", summary_data)
+        year = get_tax_year(transaction.transaction_date)
+        table = year_table.get(year)
+        if table is None:
+            table = year_table[year] = TableWriter(cgt_workbook, str(year))
+        table.write(set_trade_data(transaction))
+    sell_trades = [x for x in transaction_list if isinstance(x, SellTrade)]
+    year_summary = get_grouped_capital_gain_summary(sell_trades, by_tax_year)
+    make_table(
+        cgt_workbook,
+        "Summary",
+        (
+            {
+                "Tax year": year,
+                **_set_capital_gain_summary(
+                    year_summary.get(year, CapitalGainSummary())
+                ),
+            }
+            for year in year_table
+        ),
+    )
+    make_table(
+        cgt_workbook,
+        "Summary by ticker",
+        (
+            {
+                "Tax year": key.tax_year,
+                "Symbol": key.ticker,
+                **_set_capital_gain_summary(summary),
+            }
+            for key, summary in sorted(
+                get_grouped_capital_gain_summary(
+                    sell_trades, by_year_and_ticker
+                ).items()
+            )
+        ),
+    )
     cgt_workbook.close()
 
 
-def _write_section104(section104: Section104):
-    section104_workbook = xlsxwriter.Workbook(
-        "Section104.xlsx", {"default_date_format": "d mmm yyyy"}
-    )
+def write_section104(section104: Section104, constant_memory: bool = False):
+    """Write Section104.xlsx of the pool and open short sales"""
+    section104_workbook = new_workbook("Section104.xlsx", constant_memory)
     table_list = []
     for item in section104.section104_list.items():
-        table_list.append(_set_section104(*item))
+        table_list.append(set_section104(*item))
     make_table(section104_workbook, "Section104", table_list)
     make_table(
-        section104_workbook, "Short trade", map(_set_trade_data, section104.short_list)
+        section104_workbook, "Short trade", map(set_trade_data, section104.short_list)
     )
     section104_workbook.close()
 
 
-def _set_section104(
+def set_section104(
     section104_key: str, section104_value: Section104Value
 ) -> dict[str, Any]:
+    """Data for writing section 104 table"""
     return {
         "Symbol": section104_key,
         "Quantity": section104_value.quantity,
@@ -87,21 +129,18 @@ def _set_section104(
     }
 
 
-def _set_capital_gain_summary(
-    year: int, transaction_list: list[SellTrade]
-) -> dict[str, Any]:
+def _set_capital_gain_summary(summary: CapitalGainSummary) -> dict[str, Any]:
     """Data for writing capital gain summary table"""
     return {
-        "Tax year": year,
-        "Number of disposal": get_number_of_disposal(transaction_list),
-        "Disposal proceeds": get_disposal_proceeds(transaction_list),
-        "Allowable_cost": get_allowable_cost(transaction_list),
-        "Total gain exclude loss": get_total_gain_exclude_loss(transaction_list),
-        "Capital loss": get_capital_loss(transaction_list),
+        "Number of disposal": summary.number_of_disposal,
+        "Disposal proceeds": summary.disposal_proceeds,
+        "Allowable_cost": summary.allowable_cost,
+        "Total gain exclude loss": summary.total_gain_exclude_loss,
+        "Capital loss": summary.capital_loss,
     }
 
 
-def _set_trade_data(transaction: Transaction) -> dict[str, Any]:
+def set_trade_data(transaction: Transaction) -> dict[str, Any]:
     """Data for writing trade data table"""
     if isinstance(transaction, Trade):
         return {
@@ -113,10 +152,8 @@ def _set_trade_data(transaction: Transaction) -> dict[str, Any]:
             "Quantity": transaction.size,
             "Currency": transaction.transaction_value.currency.value,
             "Gross trade value in local Currency": transaction.transaction_value.value,
-            "Gross trade value in Sterling": transaction.transaction_value.get_value(),
-            "Incidental cost in Sterling": sum(
-                fee.get_value() for fee in transaction.fee_and_tax
-            ),
+            "Gross trade value in Sterling": transaction.get_gross_value(),
+            "Incidental cost in Sterling": transaction.get_total_fee(),
             "Unmatched shares": transaction.calculation_status.unmatched,
             "Total capital gain (loss)": transaction.calculation_status.total_gain,
             "Section104 size before trade": (
@@ -1,33 +1,69 @@
 """Methods for writing dividend data and summaries to excel"""
 from typing import Any
 
-import xlsxwriter
-
-from capital_gain.dividend_summary import DividendSummary
+from capital_gain.capital_summary import YearAndTicker
+from capital_gain.dividend_summary import (
+    DividendBreakdown,
+    DividendTotal,
+    YearAndCountry,
+    YearAndCurrency,
+)
 from capital_gain.model import Dividend
-from excel_output.utility import make_table
+from excel_output.utility import make_table, new_workbook
 
 
 def write_dividend_list(
-    dividend_and_tax_list: list[Dividend], summaries: list[DividendSummary]
+    dividend_and_tax_list: list[Dividend],
+    breakdown: DividendBreakdown,
+    constant_memory: bool = False,
 ):
-    """Write a list of dividend and tax to a file"""
-    workbook = xlsxwriter.Workbook(
-        "Dividend.xlsx", {"default_date_format": "d mmm yyyy"}
-    )
+    """Write a list of dividend and tax to a file
+    constant_memory: write the workbook row by row with flat memory use
+    """
+    workbook = new_workbook("Dividend.xlsx", constant_memory)
     dividend_and_tax_list.sort(key=lambda x: x.transaction_date)
-    summaries.sort(key=lambda x: x.year_and_country.tax_year)
-    dividend_list = [x for x in dividend_and_tax_list if x.is_dividend()]
-    withholding_list = [x for x in dividend_and_tax_list if x.is_withholding_tax()]
-    make_table(workbook, "Dividend List", map(_set_dividend_data, dividend_list))
+    dividend_list = (x for x in dividend_and_tax_list if x.is_dividend())
+    withholding_list = (x for x in dividend_and_tax_list if x.is_withholding_tax())
+    make_table(workbook, "Dividend List", map(set_dividend_data, dividend_list))
+    make_table(
+        workbook, "Withholding Tax List", map(set_dividend_data, withholding_list)
+    )
+    make_table(
+        workbook,
+        "Dividend Summary",
+        (
+            _set_dividend_summary(key, total)
+            for key, total in sorted(
+                breakdown.by_country.items(), key=lambda x: x[0].tax_year
+            )
+        ),
+    )
+    make_table(
+        workbook,
+        "Dividend by Ticker",
+        (
+            _set_dividend_summary(key, total)
+            for key, total in sorted(
+                breakdown.by_ticker.items(),
+                key=lambda x: (x[0].tax_year, x[0].ticker),
+            )
+        ),
+    )
     make_table(
-        workbook, "Withholding Tax List", map(_set_dividend_data, withholding_list)
+        workbook,
+        "Dividend by Currency",
+        (
+            _set_dividend_summary(key, total)
+            for key, total in sorted(
+                breakdown.by_currency.items(),
+                key=lambda x: (x[0].tax_year, x[0].currency),
+            )
+        ),
     )
-    make_table(workbook, "Dividend Summary", map(_set_dividend_summary, summaries))
     workbook.close()
 
 
-def _set_dividend_data(dividend_entry: Dividend) -> dict[str, Any]:
+def set_dividend_data(dividend_entry: Dividend) -> dict[str, Any]:
     """Heading for the dividend data table and the content"""
     return {
         "Date": dividend_entry.transaction_date,
@@ -40,12 +76,20 @@ def _set_dividend_data(dividend_entry: Dividend) -> dict[str, Any]:
     }
 
 
-def _set_dividend_summary(dividend_summary: DividendSummary) -> dict[str, Any]:
+def _set_dividend_summary(
+    key: YearAndCountry | YearAndTicker | YearAndCurrency, total: DividendTotal
+) -> dict[str, Any]:
     """Heading for the dividend summary table and the content"""
+    group: dict[str, Any] = {"Tax Year": key.tax_year}
+    if isinstance(key, YearAndCountry):
+        group["Country"] = key.country
+    elif isinstance(key, YearAndTicker):
+        group["Ticker"] = key.ticker
+    else:
+        group["Currency"] = key.currency
     return {
-        "Tax Year": dividend_summary.year_and_country.tax_year,
-        "Country": dividend_summary.year_and_country.country,
-        "Gross Dividend": dividend_summary.dividend_summary.total_dividend,
-        "Withholding Tax Paid": dividend_summary.dividend_summary.withholding_tax,
-        "Net Dividend": dividend_summary.dividend_summary.net_income,
+        **group,
+        "Gross Dividend": total.total_dividend,
+        "Withholding Tax Paid": total.withholding_tax,
+        "Net Dividend": total.net_income,
     }
@@ -0,0 +1,92 @@
+"""Write the report workbooks, in worker processes if required"""
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+from typing import Iterable, Optional
+
+from capital_gain.dividend_summary import get_dividend_breakdown
+from capital_gain.model import Dividend, Section104, Transaction
+from excel_output.capital_gain_list import (
+    write_cgt_per_year_and_summary,
+    write_section104,
+    write_trade_by_ticker,
+)
+from excel_output.dividend_list import write_dividend_list
+
+
+class Report(Enum):
+    """Report workbooks that can be written"""
+
+    DIVIDEND = "dividend"
+    TRADES_BY_TICKER = "trades_by_ticker"
+    CGT_PER_YEAR_AND_SUMMARY = "cgt_per_year_and_summary"
+    SECTION104 = "section104"
+
+
+@dataclass
+class ReportData:
+    """Calculated data the reports are written from"""
+
+    transaction_list: list[Transaction]
+    section104: Section104
+    dividend_list: list[Dividend]
+    constant_memory: bool = False
+
+
+# data of the reports in a worker process. It reaches each worker once through
+# initargs (a copy of the parent's memory under fork, a pickle under spawn and
+# forkserver), not once per report
+_WORKER_DATA: Optional[ReportData] = None
+
+
+def _init_worker(data: ReportData) -> None:
+    """Keep the report data in the worker so that only the report is sent for
+    each task"""
+    global _WORKER_DATA  # pylint: disable=global-statement
+    _WORKER_DATA = data
+
+
+def _write_worker_report(report: Report) -> None:
+    """Write a report from the data of the worker process"""
+    assert _WORKER_DATA is not None
+    write_report(report, _WORKER_DATA)
+
+
+def write_report(report: Report, data: ReportData) -> None:
+    """Write a report workbook, transactions and dividends must be sorted"""
+    if report is Report.DIVIDEND:
+        write_dividend_list(
+            data.dividend_list,
+            get_dividend_breakdown(data.dividend_list),
+            data.constant_memory,
+        )
+    elif report is Report.TRADES_BY_TICKER:
+        write_trade_by_ticker(data.transaction_list, data.constant_memory)
+    elif report is Report.CGT_PER_YEAR_AND_SUMMARY:
+        write_cgt_per_year_and_summary(data.transaction_list, data.constant_memory)
+    elif report is Report.SECTION104:
+        write_section104(data.section104, data.constant_memory)
+
+
+def write_reports(
+    data: ReportData, reports: Iterable[Report] = tuple(Report), workers: int = 1
+) -> None:
+    """Write the selected reports to the current directory
+    workers: number of processes used to write the reports, each report is
+    written by a single process. The data is sent to each worker once.
+    """
+    data.transaction_list.sort()
+    data.dividend_list.sort(key=lambda x: x.transaction_date)
+    reports = list(dict.fromkeys(reports))
+    if workers > 1 and len(reports) > 1:
+        with ProcessPoolExecutor(
+            min(workers, len(reports)), initializer=_init_worker, initargs=(data,)
+        ) as executor:
+            # raise the error of any report that failed
+            for _ in executor.map(_write_worker_report, reports):
+                pass
+    else:
+        for report in reports:
+            write_report(report, data)
@@ -1,18 +1,67 @@
 """Utility functions to be reused"""
-from typing import Any, Iterable
+import logging
+from typing import Any, Iterable, Optional
 
 from xlsxwriter import Workbook
 
+logger = logging.getLogger(__name__)
+
+# constant memory mode keeps a temporary file open for each worksheet, stay well
+# below the limit of open files, which is 256 by default on macOS
+MAX_CONSTANT_MEMORY_SHEETS = 200
+
+
+def new_workbook(
+    filename: str, constant_memory: bool = False, sheet_count: Optional[int] = None
+) -> Workbook:
+    """Create a workbook for the reports
+    constant_memory: write each row to a temporary file once the next row is
+    started, so memory does not grow with the number of rows. Rows of each
+    worksheet must then be written in order.
+    sheet_count: number of worksheets if known, the workbook is created in
+    default mode if it is more than MAX_CONSTANT_MEMORY_SHEETS
+    """
+    if (
+        constant_memory
+        and sheet_count is not None
+        and sheet_count > MAX_CONSTANT_MEMORY_SHEETS
+    ):
+        logger.warning(
+            "%s has %i worksheets, more than %i files would be kept open in "
+            "constant memory mode, writing it in default mode",
+            filename,
+            sheet_count,
+            MAX_CONSTANT_MEMORY_SHEETS,
+        )
+        constant_memory = False
+    return Workbook(
+        filename,
+        {"default_date_format": "d mmm yyyy", "constant_memory": constant_memory},
+    )
+
+
+class TableWriter:
+    """Write rows of a table to a new worksheet one at a time, with keys of the
+    first row as the table header"""
+
+    def __init__(self, workbook: Workbook, sheet_name: str) -> None:
+        self.worksheet = workbook.add_worksheet(sheet_name)
+        self.row_num = 0
+
+    def write(self, row: dict[str, Any]) -> None:
+        """Write a row below the last row written"""
+        if self.row_num == 0:
+            self.worksheet.write_row(0, 0, row.keys())
+            self.row_num = 1
+        self.worksheet.write_row(self.row_num, 0, row.values())
+        self.row_num += 1
+
 
 def make_table(
     workbook: Workbook, sheet_name: str, data_rows: Iterable[dict[str, Any]]
 ):
     """Create a new worksheet with a dictionary with
     keys=the table header and values=table content"""
-    worksheet = workbook.add_worksheet(sheet_name)
-    header_written = False
-    for row_num, row in enumerate(data_rows):
-        if not header_written:
-            worksheet.write_row(0, 0, row.keys())
-            header_written = True
-        worksheet.write_row(row_num + 1, 0, row.values())
+    table = TableWriter(workbook, sheet_name)
+    for row in data_rows:
+        table.write(row)
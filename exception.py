@@ -22,3 +22,24 @@ def section104_incorrect():
 def setting_not_found():
     """Handling when setting config is incorrect or not found"""
     print("Configuration not found, will use default setting")
+
+
+def report_not_found(name: str):
+    """Handling when a report in the setting is not known"""
+    print(
+        f"Report {name} not found and will not be written, reports are "
+        "'dividend', 'trades_by_ticker', 'cgt_per_year_and_summary', 'section104'"
+    )
+
+
+def columnar_format_not_found(name: str):
+    """Handling when the columnar export format in the setting is not known"""
+    print(
+        f"Columnar export format {name} not found, formats are 'arrow', 'parquet'. "
+        "Columnar export will not be written"
+    )
+
+
+def columnar_export_unavailable(error: ImportError):
+    """Handling when the package needed by the columnar export is not installed"""
+    print(f"{error}. Columnar export will not be written")
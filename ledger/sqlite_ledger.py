@@ -0,0 +1,541 @@
+""" SQLite ledger of trades, corporate actions, dividends and calculation result """
+from __future__ import annotations
+
+from copy import deepcopy
+from dataclasses import fields
+import datetime
+from decimal import Decimal
+from enum import Enum
+from fractions import Fraction
+from itertools import groupby
+import sqlite3
+from typing import Any, Callable, Iterable, Iterator, Optional, Sequence
+
+from iso4217 import Currency
+
+from capital_gain.calculator import calculate_ticker
+from capital_gain.model import (
+    BuyTrade,
+    CorporateActionType,
+    Dividend,
+    DividendType,
+    MatchEvent,
+    MatchType,
+    Money,
+    Section104,
+    SellTrade,
+    ShareReorg,
+    Trade,
+    Transaction,
+)
+from columnar_output.arrow_export import EVENT_COLUMNS
+from const import get_tax_year
+from statement_parser.ibkr import ParsedStatement
+
+_EVENT_TYPES = {
+    event_type.__name__: event_type for event_type in MatchEvent.__subclasses__()
+}
+# read a stored event field by the type annotation of the field
+_EVENT_FIELD_READERS: dict[str, Callable[[Any], Any]] = {
+    "Decimal": Decimal,
+    "Fraction": Fraction,
+    "MatchType": MatchType,
+    "int": int,
+    "str": str,
+    "datetime.date": datetime.date.fromisoformat,
+}
+
+# Decimal is stored as TEXT so that it is read back exactly
+_SCHEMA = (
+    """
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY,
+    is_buy INTEGER NOT NULL,
+    ticker TEXT NOT NULL,
+    date TEXT NOT NULL,
+    tax_year INTEGER NOT NULL,
+    size TEXT NOT NULL,
+    value TEXT NOT NULL,
+    exchange_rate TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    note TEXT NOT NULL,
+    transaction_type TEXT NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trades_ticker_date ON trades (ticker, date);
+CREATE INDEX IF NOT EXISTS trades_tax_year ON trades (tax_year);
+CREATE TABLE IF NOT EXISTS fees (
+    trade_id INTEGER NOT NULL REFERENCES trades (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    exchange_rate TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    note TEXT NOT NULL,
+    PRIMARY KEY (trade_id, position)
+);
+CREATE TABLE IF NOT EXISTS corp_actions (
+    id INTEGER PRIMARY KEY,
+    ticker TEXT NOT NULL,
+    date TEXT NOT NULL,
+    tax_year INTEGER NOT NULL,
+    transaction_type TEXT NOT NULL,
+    size TEXT NOT NULL,
+    ratio_numerator INTEGER NOT NULL,
+    ratio_denominator INTEGER NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS corp_actions_ticker_date ON corp_actions (ticker, date);
+CREATE INDEX IF NOT EXISTS corp_actions_tax_year ON corp_actions (tax_year);
+CREATE TABLE IF NOT EXISTS dividends (
+    id INTEGER PRIMARY KEY,
+    ticker TEXT NOT NULL,
+    date TEXT NOT NULL,
+    tax_year INTEGER NOT NULL,
+    transaction_type TEXT NOT NULL,
+    value TEXT NOT NULL,
+    exchange_rate TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    note TEXT NOT NULL,
+    country TEXT NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dividends_ticker_date ON dividends (ticker, date);
+CREATE INDEX IF NOT EXISTS dividends_tax_year ON dividends (tax_year);
+CREATE TABLE IF NOT EXISTS results (
+    trade_id INTEGER PRIMARY KEY REFERENCES trades (id) ON DELETE CASCADE,
+    unmatched TEXT NOT NULL,
+    total_gain TEXT NOT NULL,
+    allowable_cost TEXT NOT NULL,
+    section104_pre_trade TEXT NOT NULL,
+    section104_post_trade TEXT NOT NULL
+);
+-- steps of the calculation of a trade or corporate action, a column for each
+-- field of the kinds of match event, NULL if the event has no such field
+CREATE TABLE IF NOT EXISTS match_events (
+    transaction_id INTEGER NOT NULL,
+    step INTEGER NOT NULL,
+    event TEXT NOT NULL,
+"""
+    + "".join(f"    {column} TEXT,\n" for column in EVENT_COLUMNS)
+    + """    PRIMARY KEY (transaction_id, step)
+);
+CREATE INDEX IF NOT EXISTS match_events_event ON match_events (event);
+"""
+)
+
+
+def _where(
+    ticker: Optional[str],
+    start: Optional[datetime.date],
+    end: Optional[datetime.date],
+    tax_year: Optional[int],
+    table: str,
+) -> tuple[str, list[Any]]:
+    """WHERE clause of the query by ticker, date range and tax year"""
+    conditions = []
+    parameters: list[Any] = []
+    if ticker is not None:
+        conditions.append(f"{table}.ticker = ?")
+        parameters.append(ticker)
+    if start is not None:
+        conditions.append(f"{table}.date >= ?")
+        parameters.append(start.isoformat())
+    if end is not None:
+        conditions.append(f"{table}.date <= ?")
+        parameters.append(end.isoformat())
+    if tax_year is not None:
+        conditions.append(f"{table}.tax_year = ?")
+        parameters.append(tax_year)
+    if not conditions:
+        return "", parameters
+    return "WHERE " + " AND ".join(conditions), parameters
+
+
+class Ledger:
+    """Transactions and calculation result stored in a SQLite database, indexed
+    by ticker and date and by tax year so that a query does not need to load the
+    full history.
+    Transaction id of the records are kept, the id counter is moved past the
+    stored ids when the ledger is opened so that new transactions do not reuse
+    them. Adding a transaction with an id already stored raises
+    sqlite3.IntegrityError.
+    """
+
+    def __init__(self, path: str = ":memory:") -> None:
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(_SCHEMA)
+        max_id = max(
+            self.connection.execute(
+                f"SELECT coalesce(max(id), 0) FROM {table}"
+            ).fetchone()[0]
+            for table in ("trades", "corp_actions", "dividends")
+        )
+        Transaction.transaction_id_counter = max(
+            Transaction.transaction_id_counter, max_id + 1
+        )
+
+    def __enter__(self) -> Ledger:
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the database"""
+        self.connection.close()
+
+    def clear(self) -> None:
+        """Remove all records"""
+        with self.connection:
+            for table in (
+                "match_events",
+                "results",
+                "fees",
+                "trades",
+                "corp_actions",
+                "dividends",
+            ):
+                self.connection.execute(f"DELETE FROM {table}")
+
+    def add_statement(self, statement: ParsedStatement) -> None:
+        """Add the records of a parsed statement in one database transaction"""
+        with self.connection:
+            self._insert_trades([*statement.trades, *statement.fx_trades])
+            self._insert_corp_actions(statement.corp_actions)
+            self._insert_dividends(statement.dividends)
+
+    def add_trades(self, trades: Iterable[BuyTrade | SellTrade]) -> None:
+        """Add buy and sell trades"""
+        with self.connection:
+            self._insert_trades(trades)
+
+    def add_corp_actions(self, corp_actions: Iterable[ShareReorg]) -> None:
+        """Add share splits and merges"""
+        with self.connection:
+            self._insert_corp_actions(corp_actions)
+
+    def add_dividends(self, dividends: Iterable[Dividend]) -> None:
+        """Add dividends and withholding tax"""
+        with self.connection:
+            self._insert_dividends(dividends)
+
+    def _insert_trades(self, trades: Iterable[BuyTrade | SellTrade]) -> None:
+        trades = list(trades)
+        self.connection.executemany(
+            "INSERT INTO trades VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    trade.transaction_id,
+                    isinstance(trade, BuyTrade),
+                    trade.ticker,
+                    trade.transaction_date.isoformat(),
+                    get_tax_year(trade.transaction_date),
+                    str(trade.size),
+                    str(trade.transaction_value.value),
+                    str(trade.transaction_value.exchange_rate),
+                    trade.transaction_value.currency.value,
+                    trade.transaction_value.note,
+                    trade.transaction_type,
+                    trade.description,
+                )
+                for trade in trades
+            ),
+        )
+        self.connection.executemany(
+            "INSERT INTO fees VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    trade.transaction_id,
+                    position,
+                    str(fee.value),
+                    str(fee.exchange_rate),
+                    fee.currency.value,
+                    fee.note,
+                )
+                for trade in trades
+                for position, fee in enumerate(trade.fee_and_tax)
+            ),
+        )
+
+    def _insert_corp_actions(self, corp_actions: Iterable[ShareReorg]) -> None:
+        self.connection.executemany(
+            "INSERT INTO corp_actions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    corp_action.transaction_id,
+                    corp_action.ticker,
+                    corp_action.transaction_date.isoformat(),
+                    get_tax_year(corp_action.transaction_date),
+                    corp_action.transaction_type.value,
+                    str(corp_action.size),
+                    corp_action.ratio.numerator,
+                    corp_action.ratio.denominator,
+                    corp_action.description,
+                )
+                for corp_action in corp_actions
+            ),
+        )
+
+    def _insert_dividends(self, dividends: Iterable[Dividend]) -> None:
+        self.connection.executemany(
+            "INSERT INTO dividends VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    dividend.transaction_id,
+                    dividend.ticker,
+                    dividend.transaction_date.isoformat(),
+                    get_tax_year(dividend.transaction_date),
+                    dividend.transaction_type.value,
+                    str(dividend.value.value),
+                    str(dividend.value.exchange_rate),
+                    dividend.value.currency.value,
+                    dividend.value.note,
+                    dividend.country,
+                    dividend.description,
+                )
+                for dividend in dividends
+            ),
+        )
+
+    def save_results(self, transactions: Iterable[Trade | ShareReorg]) -> None:
+        """Store the calculation result of trades and events of corporate actions,
+        replacing the earlier result"""
+        trades = []
+        events: list[tuple[int, list[MatchEvent]]] = []
+        for transaction in transactions:
+            if isinstance(transaction, Trade):
+                trades.append(transaction)
+                events.append(
+                    (transaction.transaction_id, transaction.calculation_status.events)
+                )
+            else:
+                events.append((transaction.transaction_id, transaction.events))
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        trade.transaction_id,
+                        str(trade.calculation_status.unmatched),
+                        str(trade.calculation_status.total_gain),
+                        str(trade.calculation_status.allowable_cost),
+                        str(trade.calculation_status.section104_pre_trade),
+                        str(trade.calculation_status.section104_post_trade),
+                    )
+                    for trade in trades
+                ),
+            )
+            self.connection.executemany(
+                "DELETE FROM match_events WHERE transaction_id = ?",
+                ((transaction_id,) for transaction_id, _ in events),
+            )
+            self.connection.executemany(
+                "INSERT INTO match_events VALUES "
+                f"(?, ?, ?{', ?' * len(EVENT_COLUMNS)})",
+                (
+                    _event_row(transaction_id, step, event)
+                    for transaction_id, transaction_events in events
+                    for step, event in enumerate(transaction_events)
+                ),
+            )
+
+    def tickers(self) -> list[str]:
+        """Tickers of the trades and corporate actions"""
+        return [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT ticker FROM trades UNION SELECT ticker FROM corp_actions "
+                "ORDER BY ticker"
+            )
+        ]
+
+    def iter_trades(
+        self,
+        ticker: Optional[str] = None,
+        start: Optional[datetime.date] = None,
+        end: Optional[datetime.date] = None,
+        tax_year: Optional[int] = None,
+    ) -> Iterator[BuyTrade | SellTrade]:
+        """Trades in date order with the stored calculation result, filtered by
+        ticker, dates from start to end inclusive and tax year"""
+        where, parameters = _where(ticker, start, end, tax_year, "trades")
+        rows = self.connection.execute(
+            "SELECT trades.*, fees.value, fees.exchange_rate, fees.currency, "
+            "fees.note, results.unmatched, results.total_gain, "
+            "results.allowable_cost, results.section104_pre_trade, "
+            "results.section104_post_trade FROM trades "
+            "LEFT JOIN fees ON fees.trade_id = trades.id "
+            "LEFT JOIN results ON results.trade_id = trades.id "
+            f"{where} ORDER BY trades.date, trades.id, fees.position",
+            parameters,
+        )
+        events = self._iter_events("trades", where, parameters)
+        # a trade has one row for each fee
+        for _, trade_rows in groupby(rows, key=lambda row: row[0]):
+            trade = _make_trade(list(trade_rows))
+            trade.calculation_status.events = events.get(trade.transaction_id)
+            yield trade
+
+    def iter_corp_actions(
+        self,
+        ticker: Optional[str] = None,
+        start: Optional[datetime.date] = None,
+        end: Optional[datetime.date] = None,
+        tax_year: Optional[int] = None,
+    ) -> Iterator[ShareReorg]:
+        """Corporate actions in date order, filtered as iter_trades"""
+        where, parameters = _where(ticker, start, end, tax_year, "corp_actions")
+        events = self._iter_events("corp_actions", where, parameters)
+        for row in self.connection.execute(
+            f"SELECT * FROM corp_actions {where} ORDER BY date, id", parameters
+        ):
+            corp_action = ShareReorg(
+                row[1],
+                datetime.date.fromisoformat(row[2]),
+                CorporateActionType(row[4]),
+                Decimal(row[5]),
+                Fraction(row[6], row[7]),
+                row[8],
+            )
+            corp_action.transaction_id = row[0]
+            corp_action.events = events.get(corp_action.transaction_id)
+            yield corp_action
+
+    def _iter_events(
+        self, table: str, where: str, parameters: list[Any]
+    ) -> _EventReader:
+        """Match events of the transactions of the table selected by the WHERE
+        clause, in the same order as the transactions"""
+        return _EventReader(
+            self.connection.execute(
+                f"SELECT match_events.* FROM match_events JOIN {table} "
+                f"ON {table}.id = match_events.transaction_id {where} "
+                f"ORDER BY {table}.date, {table}.id, match_events.step",
+                parameters,
+            )
+        )
+
+    def iter_dividends(
+        self,
+        ticker: Optional[str] = None,
+        start: Optional[datetime.date] = None,
+        end: Optional[datetime.date] = None,
+        tax_year: Optional[int] = None,
+    ) -> Iterator[Dividend]:
+        """Dividends and withholding tax in date order, filtered as iter_trades"""
+        where, parameters = _where(ticker, start, end, tax_year, "dividends")
+        for row in self.connection.execute(
+            f"SELECT * FROM dividends {where} ORDER BY date, id", parameters
+        ):
+            dividend = Dividend(
+                row[1],
+                datetime.date.fromisoformat(row[2]),
+                DividendType(row[4]),
+                Money(Decimal(row[5]), Decimal(row[6]), Currency(row[7]), row[8]),
+                row[9],
+                row[10],
+            )
+            dividend.transaction_id = row[0]
+            yield dividend
+
+
+def _make_trade(rows: Sequence[tuple]) -> BuyTrade | SellTrade:
+    """Create a trade from the rows of the trade joined with each of its fees"""
+    row = rows[0]
+    fees = [
+        Money(
+            Decimal(fee_row[12]),
+            Decimal(fee_row[13]),
+            Currency(fee_row[14]),
+            fee_row[15],
+        )
+        for fee_row in rows
+        if fee_row[12] is not None
+    ]
+    trade_class = BuyTrade if row[1] else SellTrade
+    trade = trade_class(
+        row[2],
+        datetime.date.fromisoformat(row[3]),
+        Decimal(row[5]),
+        Money(Decimal(row[6]), Decimal(row[7]), Currency(row[8]), row[9]),
+        fees,
+        row[10],
+        row[11],
+    )
+    trade.transaction_id = row[0]
+    if row[16] is not None:
+        status = trade.calculation_status
+        status.unmatched = Decimal(row[16])
+        status.total_gain = Decimal(row[17])
+        status.allowable_cost = Decimal(row[18])
+        status.section104_pre_trade = Decimal(row[19])
+        status.section104_post_trade = Decimal(row[20])
+    return trade
+
+
+def _to_text(value: Any) -> Any:
+    """Value of an event field as stored in the database"""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, (Decimal, Fraction)):
+        return str(value)
+    return value
+
+
+def _event_row(transaction_id: int, step: int, event: MatchEvent) -> tuple:
+    """Row of the match_events table"""
+    values = dict.fromkeys(EVENT_COLUMNS)
+    for field in fields(event):  # type: ignore[arg-type]
+        values[field.name] = _to_text(getattr(event, field.name))
+    return (transaction_id, step, type(event).__name__, *values.values())
+
+
+def _make_event(row: Sequence[Any]) -> MatchEvent:
+    """Create a match event from a row of the match_events table"""
+    event_type = _EVENT_TYPES[row[2]]
+    values = dict(zip(EVENT_COLUMNS, row[3:]))
+    return event_type(
+        **{
+            field.name: _EVENT_FIELD_READERS[str(field.type)](values[field.name])
+            for field in fields(event_type)  # type: ignore[arg-type]
+        }
+    )
+
+
+class _EventReader:
+    """Match events grouped by transaction, read along with the transactions
+    that are in the same order"""
+
+    def __init__(self, rows: Iterable[tuple]) -> None:
+        self.groups = groupby(rows, key=lambda row: row[0])
+        self.current = next(self.groups, None)
+
+    def get(self, transaction_id: int) -> list[MatchEvent]:
+        """Events of the transaction, empty if none is stored"""
+        if self.current is None or self.current[0] != transaction_id:
+            return []
+        events = [_make_event(row) for row in self.current[1]]
+        self.current = next(self.groups, None)
+        return events
+
+
+def calculate_from_ledger(
+    ledger: Ledger, init_section104: Optional[Section104] = None
+) -> Section104:
+    """Calculate capital gain one ticker at a time from the ledger and store the
+    result, so only the trades of one ticker are in memory at a time.
+    Return the section 104 pool and open short sales of all tickers.
+    """
+    section104 = deepcopy(init_section104) if init_section104 else Section104()
+    for ticker in ledger.tickers():
+        trades = list(ledger.iter_trades(ticker))
+        # stored result of an earlier calculation is replaced
+        for trade in trades:
+            trade.clear_calculation()
+        corp_actions = list(ledger.iter_corp_actions(ticker))
+        calculate_ticker(ticker, trades, corp_actions, section104)
+        ledger.save_results([*trades, *corp_actions])
+    return section104
@@ -2,6 +2,7 @@
 from datetime import date, datetime
 from decimal import Decimal
 from glob import glob
+import os
 from tkinter import Tk, filedialog
 from typing import Optional
 
@@ -10,18 +11,14 @@ from tomlkit.exceptions import NonExistentKey
 from tomlkit.items import AoT
 
 from capital_gain.calculator import CgtCalculator
-from capital_gain.dividend_summary import get_dividend_summary
 from capital_gain.model import BuyTrade, Dividend, Section104, SellTrade, ShareReorg
+from columnar_output.arrow_export import ExportFormat, check_pyarrow, write_columnar
 import const
-from excel_output.capital_gain_list import write_capital_gain_excels
-from excel_output.dividend_list import write_dividend_list
+from excel_output.report import Report, ReportData, write_reports
 import exception
-from statement_parser.ibkr import (
-    parse_corp_action,
-    parse_dividend,
-    parse_fx_acquisition_and_disposal,
-    parse_trade,
-)
+from ledger.sqlite_ledger import Ledger
+from statement_parser.cache import CACHE_DIR, StatementCache
+from statement_parser.loader import load_statements
 
 
 class UKTaxCalculator:
@@ -33,6 +30,14 @@ class UKTaxCalculator:
         self.corp_action_list: list[ShareReorg] = []
         self.dividend_list: list[Dividend] = []
         self.include_fx: bool = True
+        self.parser_workers: int = 1
+        self.calculator_workers: int = 1
+        self.statement_cache: bool = False
+        self.report_constant_memory: bool = False
+        self.report_workers: int = 1
+        self.reports: list[Report] = list(Report)
+        self.columnar_export: Optional[ExportFormat] = None
+        self.ledger_file: Optional[str] = None
         self.start_date: Optional[date] = None
         self.end_date: Optional[date] = None
         self.read_setting_from_toml()
@@ -40,13 +45,9 @@ class UKTaxCalculator:
         # Acquisitions and disposals of GBP is not taxable, so including it is redundant
         self.trades_list = [x for x in self.trades_list if x.ticker != "GBP"]
         self.calculate()
+        self.save_ledger()
         self.filter_report_by_date()
-        write_dividend_list(
-            self.dividend_list, get_dividend_summary(self.dividend_list)
-        )
-        write_capital_gain_excels(
-            [*self.trades_list, *self.corp_action_list], self.section104
-        )
+        self.write_output()
 
     def filter_report_by_date(self) -> None:
         """filter report by start and end date if configured"""
@@ -91,7 +92,30 @@ class UKTaxCalculator:
             return
         start_date = settings.get("reporting_period_start")
         end_date = settings.get("reporting_period_end")
-        self.include_fx = settings.get("include_fx")
+        self.include_fx = bool(settings.get("include_fx", False))
+        self.parser_workers = settings.get("parser_workers", 1)
+        self.calculator_workers = settings.get("calculator_workers", 1)
+        self.statement_cache = settings.get("statement_cache", False)
+        self.report_constant_memory = settings.get("report_constant_memory", False)
+        self.report_workers = settings.get("report_workers", 1)
+        if "reports" in settings:
+            self.reports = []
+            for name in settings["reports"]:
+                try:
+                    self.reports.append(Report(name))
+                except ValueError:
+                    exception.report_not_found(name)
+        self.ledger_file = settings.get("ledger_file")
+        columnar_export = settings.get("columnar_export")
+        if columnar_export:
+            try:
+                self.columnar_export = ExportFormat(columnar_export)
+                check_pyarrow()
+            except ValueError:
+                exception.columnar_format_not_found(columnar_export)
+            except ImportError as error:
+                self.columnar_export = None
+                exception.columnar_export_unavailable(error)
         if start_date:
             self.start_date = datetime.strptime(start_date, "%d-%b-%Y").date()
         if end_date:
@@ -120,25 +144,55 @@ class UKTaxCalculator:
         root.withdraw()
         file_path = filedialog.askdirectory()
         if file_path != "":
-            return glob(file_path + "/*.xml")
+            return sorted(glob(file_path + "/*.xml") + glob(file_path + "/*.xml.gz"))
         else:
             return []
 
     def load_files(self, file_list: list[str]) -> None:
         """Read trade, dividend and stock split data from files"""
-        for file in file_list:
-            self.trades_list.extend(parse_trade(file))
-            self.corp_action_list.extend(parse_corp_action(file))
-            if self.include_fx:
-                self.trades_list.extend(parse_fx_acquisition_and_disposal(file))
-            self.dividend_list.extend(parse_dividend(file))
+        cache = None
+        if self.statement_cache and file_list:
+            # cache is stored next to the statements
+            cache = StatementCache(
+                os.path.join(os.path.dirname(file_list[0]), CACHE_DIR)
+            )
+        statement = load_statements(
+            file_list, self.include_fx, self.parser_workers, cache
+        )
+        self.trades_list.extend(statement.trades)
+        self.corp_action_list.extend(statement.corp_actions)
+        self.trades_list.extend(statement.fx_trades)
+        self.dividend_list.extend(statement.dividends)
+
+    def write_output(self) -> None:
+        """Write the report workbooks and the columnar export if configured"""
+        report_data = ReportData(
+            [*self.trades_list, *self.corp_action_list],
+            self.section104,
+            self.dividend_list,
+            self.report_constant_memory,
+        )
+        write_reports(report_data, self.reports, self.report_workers)
+        if self.columnar_export:
+            write_columnar(report_data, file_format=self.columnar_export)
+
+    def save_ledger(self) -> None:
+        """Replace the content of the ledger with the transactions and result"""
+        if not self.ledger_file:
+            return
+        with Ledger(self.ledger_file) as ledger:
+            ledger.clear()
+            ledger.add_trades(self.trades_list)
+            ledger.add_corp_actions(self.corp_action_list)
+            ledger.add_dividends(self.dividend_list)
+            ledger.save_results([*self.trades_list, *self.corp_action_list])
 
     def calculate(self) -> None:
         """invoke calculation of capital gain"""
         calculator = CgtCalculator(
             self.trades_list, self.corp_action_list, self.section104
         )
-        calculator.calculate_tax()
+        calculator.calculate_tax(self.calculator_workers)
         self.section104 = calculator.get_section104()
 
 
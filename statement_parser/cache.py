@@ -0,0 +1,116 @@
+""" On disk cache of parsed statements """
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import zlib
+
+from capital_gain.model import MODEL_VERSION
+from statement_parser.ibkr import PARSER_VERSION, ParsedStatement
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = ".statement_cache"
+CACHE_SUFFIX = ".cache"
+MAX_CACHE_SIZE = 512 * 1024 * 1024  # in bytes
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class StatementCache:
+    """Cache of ParsedStatement stored as compressed pickle, keyed by content hash
+    of the statement file, parser version and model version. Least recently used
+    entries are evicted when size of the cache exceeds max_size bytes.
+    """
+
+    def __init__(self, directory: str, max_size: int = MAX_CACHE_SIZE) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        self._remove_old_version()
+
+    @staticmethod
+    def _version() -> str:
+        """Prefix of the entries written by this version of parser and model"""
+        return f"{PARSER_VERSION}.{MODEL_VERSION}-"
+
+    def _get_path(self, file: str, include_fx: bool) -> str:
+        """Name of the cache entry of a statement file"""
+        file_hash = hashlib.sha256()
+        with open(file, "rb") as statement:
+            while chunk := statement.read(HASH_CHUNK_SIZE):
+                file_hash.update(chunk)
+        return os.path.join(
+            self.directory,
+            f"{self._version()}{int(bool(include_fx))}-{file_hash.hexdigest()}"
+            f"{CACHE_SUFFIX}",
+        )
+
+    def _list_entries(self) -> list[str]:
+        return [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(CACHE_SUFFIX)
+        ]
+
+    def _remove_old_version(self) -> None:
+        """Entries written by other versions of the parser or model can never be
+        hit"""
+        for path in self._list_entries():
+            if not os.path.basename(path).startswith(self._version()):
+                os.remove(path)
+
+    def load(self, file: str, include_fx: bool = True) -> ParsedStatement | None:
+        """Return the cached result of the statement, None if it is not cached"""
+        path = self._get_path(file, include_fx)
+        try:
+            with open(path, "rb") as cache_file:
+                statement = pickle.loads(zlib.decompress(cache_file.read()))
+        except FileNotFoundError:
+            return None
+        # an entry that cannot be unpickled, e.g. written with classes of another
+        # layout, raises anything from AttributeError to ImportError
+        except Exception:  # pylint: disable=broad-except
+            logger.warning("Discarding unreadable cache entry %s", path)
+            os.remove(path)
+            return None
+        # mark the entry as recently used for eviction
+        os.utime(path)
+        logger.info("Loaded %s from cache", file)
+        return statement
+
+    def save(
+        self, file: str, statement: ParsedStatement, include_fx: bool = True
+    ) -> None:
+        """Store the parsed result of a statement, then evict old entries"""
+        path = self._get_path(file, include_fx)
+        data = zlib.compress(pickle.dumps(statement, pickle.HIGHEST_PROTOCOL))
+        # write to a temporary file first so that a partial entry is never read
+        with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as temp:
+            temp.write(data)
+        os.replace(temp.name, path)
+        self.evict()
+
+    def invalidate(self, file: str) -> None:
+        """Remove cache entries of the current content of a statement"""
+        for include_fx in [True, False]:
+            path = self._get_path(file, include_fx)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def clear(self) -> None:
+        """Remove all cache entries"""
+        for path in self._list_entries():
+            os.remove(path)
+
+    def evict(self) -> None:
+        """Remove least recently used entries until cache is within max_size"""
+        entries = sorted(self._list_entries(), key=os.path.getmtime)
+        total_size = sum(os.path.getsize(path) for path in entries)
+        for path in entries:
+            if total_size <= self.max_size:
+                break
+            total_size -= os.path.getsize(path)
+            os.remove(path)
@@ -0,0 +1,9 @@
+""" Exception handling for statement parsing """
+
+
+class FxRateNotFoundError(ValueError):
+    """No usable fx rate for a currency and date in the statement"""
+
+    def __init__(self, message: str) -> None:
+        self.message = message
+        super().__init__(self.message)
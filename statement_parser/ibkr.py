@@ -1,10 +1,16 @@
 """ statement importing for interactive brokers """
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass, field, replace
 from datetime import datetime
 from decimal import Decimal
+from enum import Enum
 from fractions import Fraction
+import gzip
 import logging
 import re
-from typing import Any, Dict
+from typing import IO, Any, Dict, Iterator
 import xml.etree.ElementTree as ET
 
 from iso3166 import countries
@@ -19,6 +25,109 @@ from capital_gain.model import (
     SellTrade,
     ShareReorg,
 )
+from statement_parser.exception import FxRateNotFoundError
+
+# increase when change in parsing changes the parsed result, to invalidate cache
+PARSER_VERSION = "1"
+SUPPORTED_CORP_ACTION = ["FS", "RS"]
+SUPPORTED_DIVIDEND_TYPE = [
+    DividendType.DIVIDEND.value,
+    DividendType.DIVIDEND_IN_LIEU.value,
+    DividendType.WITHHOLDING.value,
+]
+
+
+class _RecordType(Enum):
+    """Kind of records in a Flex statement, value is the field in ParsedStatement"""
+
+    TRADE = "trades"
+    CORP_ACTION = "corp_actions"
+    FX = "fx_trades"
+    DIVIDEND = "dividends"
+    FX_RATE = "fx_rates"
+    PENDING_FX = "pending_fx_lines"
+
+
+class FxRateTable:
+    """IB provided fx rates indexed by report date, from currency and to currency.
+    Date format DD-MMM-YY e.g. "27-Jan-21"
+    """
+
+    def __init__(self) -> None:
+        self.rates: dict[tuple[str, str, str], Decimal] = {}
+
+    def add_rate(
+        self, date: str, currency: str, base_currency: str, rate: Decimal
+    ) -> None:
+        """Add a rate to the table, an existing valid rate is not overwritten"""
+        key = (date, currency, base_currency)
+        if self.rates.get(key, Decimal(-1)) == -1:
+            self.rates[key] = rate
+
+    def update(self, other: FxRateTable) -> None:
+        """Merge rates from the table of another statement, so that a rate missing
+        from one statement can be served from another"""
+        for (date, currency, base_currency), rate in other.rates.items():
+            self.add_rate(date, currency, base_currency, rate)
+
+    def get_rate(self, currency: str, base_currency: str, date: str) -> Decimal:
+        """To get IB provided FX rate given currency and date."""
+        # fx rate is 1 if currency is the same as base currency, no need to look up
+        if currency == base_currency:
+            return Decimal(1)
+        result = self.rates.get((date, currency, base_currency))
+        if result is None:
+            raise FxRateNotFoundError(
+                f"No fx rate found for {currency} against {base_currency} on {date}"
+            )
+        if result == -1:
+            raise FxRateNotFoundError(
+                f"fx rate is -1 for {currency} against "
+                f"{base_currency} on {date}, this is an error rate"
+            )
+        logging.debug(
+            "fx rate for %s against %s on %s is %s",
+            currency,
+            base_currency,
+            date,
+            result,
+        )
+        return result
+
+
+@dataclass
+class ParsedStatement:
+    """Records extracted from a Flex statement
+    pending_fx_lines: statement of funds lines that cannot be valued with the
+    fx rates of this statement, see resolve_fx_lines
+    """
+
+    trades: list[BuyTrade | SellTrade] = field(default_factory=list)
+    corp_actions: list[ShareReorg] = field(default_factory=list)
+    fx_trades: list[BuyTrade | SellTrade] = field(default_factory=list)
+    dividends: list[Dividend] = field(default_factory=list)
+    fx_rates: FxRateTable = field(default_factory=FxRateTable)
+    pending_fx_lines: list[ET.Element] = field(default_factory=list)
+
+    def add_fx_line(self, xml_entry: ET.Element) -> None:
+        """Value a statement of funds line with the fx rates of this statement,
+        put it to pending_fx_lines if rate is not found"""
+        try:
+            fx_trade = _transform_fx_line(xml_entry, self.fx_rates)
+        except FxRateNotFoundError:
+            self.pending_fx_lines.append(ET.Element(xml_entry.tag, xml_entry.attrib))
+            return
+        if fx_trade is not None:
+            self.fx_trades.append(fx_trade)
+
+    def resolve_fx_lines(self, fx_rates: FxRateTable) -> None:
+        """Value pending statement of funds lines with rates merged from other
+        statements. Raise FxRateNotFoundError if rate still cannot be found"""
+        for xml_entry in self.pending_fx_lines:
+            fx_trade = _transform_fx_line(xml_entry, fx_rates)
+            if fx_trade is not None:
+                self.fx_trades.append(fx_trade)
+        self.pending_fx_lines = []
 
 
 def _get_country_code(xml_entry: ET.Element) -> str:
@@ -49,7 +158,7 @@ def _transform_dividend(xml_entry: ET.Element) -> Dividend:
     )
     # correct negative sign for consistency
     if xml_entry.attrib["type"] == DividendType.WITHHOLDING.value:
-        dividend_value.value = dividend_value.value * -1
+        dividend_value = replace(dividend_value, value=dividend_value.value * -1)
     return Dividend(
         xml_entry.attrib["symbol"],
         datetime.strptime(xml_entry.attrib["reportDate"], "%d-%b-%y").date(),
@@ -120,32 +229,6 @@ def _transform_trade(xml_entry: ET.Element) -> BuyTrade | SellTrade:
         raise ValueError(f"Unexpected Trade Type {xml_entry.attrib['buySell']}")
 
 
-def parse_dividend(file: str) -> list[Dividend]:
-    """Parse xml to extract Dividend objects"""
-    dividend_type = [
-        DividendType.DIVIDEND,
-        DividendType.DIVIDEND_IN_LIEU,
-        DividendType.WITHHOLDING,
-    ]
-    tree = ET.parse(file)
-    test = tree.findall(".//CashTransaction")
-    dividend_list = [
-        x
-        for x in test
-        if x.attrib["type"] in [x.value for x in dividend_type]
-        and x.attrib["levelOfDetail"] == "DETAIL"
-    ]
-    return [_transform_dividend(dividend) for dividend in dividend_list]
-
-
-def parse_trade(file: str) -> list[BuyTrade | SellTrade]:
-    """Parse xml to extract Trade objects"""
-    tree = ET.parse(file)
-    test = tree.findall(".//Trades/Order")
-    trade_list = [x for x in test if x.attrib["assetCategory"] == "STK"]
-    return [_transform_trade(trade) for trade in trade_list]
-
-
 def _transform_corp_action(xml_entry: ET.Element) -> ShareReorg:
     """Parse corporation entries to ShareReorg objects, currently only split and
     reverse split is supported"""
@@ -173,50 +256,18 @@ def _transform_corp_action(xml_entry: ET.Element) -> ShareReorg:
     )
 
 
-def parse_corp_action(file: str) -> list[ShareReorg]:
-    """Parse xml to extract Corporation objects"""
-    supported_type = ["FS", "RS"]
-    tree = ET.parse(file)
-    test = tree.findall(".//CorporateActions/CorporateAction")
-    action_list = [x for x in test if x.attrib["type"] in supported_type]
-    return [_transform_corp_action(action) for action in action_list]
-
-
-def _fetch_fx_rate(
-    tree: ET.ElementTree, currency: str, base_currency: str, date: str
-) -> Decimal:
-    """To get IB provided FX rate from the XML file given currency and date.
-    Date format DD-MMM-YY e.g. "27-Jan-21"
-    """
-    # fx rate is 1 if currency is the same as base currency, no need to look up
-    if currency == base_currency:
-        return Decimal(1)
-    fx_rate_node = tree.find(
-        f".//ConversionRates/ConversionRate[@reportDate='{date}']"
-        f"[@fromCurrency='{currency}'][@toCurrency='{base_currency}']"
-    )
-    if fx_rate_node is None:
-        raise ValueError(
-            f"No fx rate found for {currency} against {base_currency} on {date}"
-        )
-    result = Decimal(fx_rate_node.attrib["rate"])
-    if result == -1:
-        raise ValueError(
-            f"fx rate is -1 for {currency} against "
-            f"{base_currency} on {date}, this is an error rate"
-        )
-    logging.debug(
-        "fx rate for %s against %s on %s is %s",
-        currency,
-        base_currency,
-        date,
-        result,
+def _add_fx_rate(fx_rates: FxRateTable, xml_entry: ET.Element) -> None:
+    """Add a conversion rate entry to the fx rate table"""
+    fx_rates.add_rate(
+        xml_entry.attrib["reportDate"],
+        xml_entry.attrib["fromCurrency"],
+        xml_entry.attrib["toCurrency"],
+        Decimal(xml_entry.attrib["rate"]),
     )
-    return result
 
 
 def _transform_fx_line(
-    xml_entry: ET.Element, tree: ET.ElementTree, base_currency: str = "GBP"
+    xml_entry: ET.Element, fx_rates: FxRateTable, base_currency: str = "GBP"
 ) -> BuyTrade | SellTrade | None:
     """To transform xml line to trade objects.
     Return None if no fx activity in the line"""
@@ -241,7 +292,7 @@ def _transform_fx_line(
         if xml_entry.attrib["debit"]
         else Decimal(xml_entry.attrib["credit"])
     )
-    fx_rate = _fetch_fx_rate(tree, currency, base_currency, raw_date)
+    fx_rate = fx_rates.get_rate(currency, base_currency, raw_date)
     value = Money(quantity * fx_rate)
     if xml_entry.attrib["credit"]:
         return BuyTrade(currency, date, quantity, value, description=description)
@@ -249,12 +300,176 @@ def _transform_fx_line(
         return SellTrade(currency, date, quantity, value, description=description)
 
 
+def _get_record_type(parent_tag: str | None, node: ET.Element) -> _RecordType | None:
+    """Identify the kind of record of a xml element, None if it is not needed"""
+    if node.tag == "CashTransaction":
+        if (
+            node.attrib["type"] in SUPPORTED_DIVIDEND_TYPE
+            and node.attrib["levelOfDetail"] == "DETAIL"
+        ):
+            return _RecordType.DIVIDEND
+    elif parent_tag == "Trades" and node.tag == "Order":
+        if node.attrib["assetCategory"] == "STK":
+            return _RecordType.TRADE
+    elif parent_tag == "CorporateActions" and node.tag == "CorporateAction":
+        if node.attrib["type"] in SUPPORTED_CORP_ACTION:
+            return _RecordType.CORP_ACTION
+    elif parent_tag == "StmtFunds" and node.tag == "StatementOfFundsLine":
+        return _RecordType.FX
+    elif parent_tag == "ConversionRates" and node.tag == "ConversionRate":
+        return _RecordType.FX_RATE
+    return None
+
+
+def open_statement(file: str) -> IO[bytes] | gzip.GzipFile:
+    """Open a statement, which is compressed with gzip if the name ends with .gz"""
+    if file.endswith(".gz"):
+        return gzip.open(file, "rb")
+    return open(file, "rb")
+
+
+def _iter_nodes(file: str) -> Iterator[tuple[str | None, ET.Element]]:
+    """Stream each closed element of the xml with the tag of its parent. Element
+    is removed once the caller has processed it, as only attributes are used, so
+    memory usage does not grow with the size of the file."""
+    stack: list[ET.Element] = []
+    with open_statement(file) as source:
+        for event, node in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                stack.append(node)
+                continue
+            stack.pop()
+            parent = stack[-1] if stack else None
+            yield (parent.tag if parent is not None else None), node
+            node.clear()
+            if parent is not None:
+                parent.remove(node)
+
+
+def _read_fx_rates(file: str, fx_rates: FxRateTable) -> None:
+    """Add the conversion rates of the statement to fx_rates"""
+    for parent_tag, node in _iter_nodes(file):
+        if _get_record_type(parent_tag, node) == _RecordType.FX_RATE:
+            _add_fx_rate(fx_rates, node)
+
+
+def _iter_records(
+    file: str, include_fx: bool, fx_rates: FxRateTable
+) -> Iterator[
+    tuple[_RecordType, BuyTrade | SellTrade | ShareReorg | Dividend | ET.Element]
+]:
+    """Stream records from the xml with iterparse. If include_fx, the conversion
+    rates are read in a first pass, so that statement of funds lines can be valued
+    as they are read whatever the order of the sections. Lines without a rate in
+    the statement are yielded as PENDING_FX.
+    """
+    if include_fx:
+        _read_fx_rates(file, fx_rates)
+    for parent_tag, node in _iter_nodes(file):
+        record_type = _get_record_type(parent_tag, node)
+        if record_type == _RecordType.TRADE:
+            yield record_type, _transform_trade(node)
+        elif record_type == _RecordType.CORP_ACTION:
+            yield record_type, _transform_corp_action(node)
+        elif record_type == _RecordType.DIVIDEND:
+            yield record_type, _transform_dividend(node)
+        elif include_fx and record_type == _RecordType.FX:
+            try:
+                fx_trade = _transform_fx_line(node, fx_rates)
+            except FxRateNotFoundError:
+                yield _RecordType.PENDING_FX, ET.Element(node.tag, node.attrib)
+                continue
+            if fx_trade is not None:
+                yield record_type, fx_trade
+
+
+def iter_statement(
+    file: str, include_fx: bool = True, fx_rates: FxRateTable | None = None
+) -> Iterator[BuyTrade | SellTrade | ShareReorg | Dividend]:
+    """Streaming alternative of parse_statement for very large statements.
+    Records are yielded in the order they appear in the file. The file is read
+    twice if include_fx, first for the conversion rates.
+    fx_rates: rates from other statements, used if a rate is not in this file
+    """
+    statement_rates = FxRateTable()
+    for _, record in _iter_records(file, include_fx, statement_rates):
+        if isinstance(record, ET.Element):
+            # rates of other statements are merged once, at the first line that
+            # needs them
+            if fx_rates is not None:
+                statement_rates.update(fx_rates)
+                fx_rates = None
+            fx_trade = _transform_fx_line(record, statement_rates)
+            if fx_trade is not None:
+                yield fx_trade
+        else:
+            yield record
+
+
+def _parse_tree(file: str, record_types: set[_RecordType]) -> ParsedStatement:
+    """Parse xml as a full tree and transform only the records of record_types,
+    so that no transaction id is taken by records that are not returned"""
+    result = ParsedStatement()
+    with open_statement(file) as source:
+        tree = ET.parse(source)
+    nodes: defaultdict[_RecordType, list[ET.Element]] = defaultdict(list)
+    for parent in tree.iter():
+        for node in parent:
+            record_type = _get_record_type(parent.tag, node)
+            if record_type in record_types:
+                nodes[record_type].append(node)
+    # transform in a fixed order so that transaction id is assigned the same way
+    # regardless of the order of sections in the file
+    result.trades = [_transform_trade(node) for node in nodes[_RecordType.TRADE]]
+    result.corp_actions = [
+        _transform_corp_action(node) for node in nodes[_RecordType.CORP_ACTION]
+    ]
+    for node in nodes[_RecordType.FX_RATE]:
+        _add_fx_rate(result.fx_rates, node)
+    for node in nodes[_RecordType.FX]:
+        result.add_fx_line(node)
+    result.dividends = [
+        _transform_dividend(node) for node in nodes[_RecordType.DIVIDEND]
+    ]
+    return result
+
+
+def parse_statement(
+    file: str, include_fx: bool = True, streaming: bool = False
+) -> ParsedStatement:
+    """Parse xml once and extract trades, corporate actions, acquisition and
+    disposal of foreign currency and dividends in a single walk of the tree.
+    include_fx: set to False to skip converting statement of funds to fx trades
+    streaming: build the result from iter_statement instead of a full tree
+    """
+    if streaming:
+        result = ParsedStatement()
+        for streamed_type, record in _iter_records(file, include_fx, result.fx_rates):
+            getattr(result, streamed_type.value).append(record)
+        return result
+    record_types = {_RecordType.TRADE, _RecordType.CORP_ACTION, _RecordType.DIVIDEND}
+    if include_fx:
+        record_types |= {_RecordType.FX_RATE, _RecordType.FX}
+    return _parse_tree(file, record_types)
+
+
+def parse_trade(file: str) -> list[BuyTrade | SellTrade]:
+    """Parse xml to extract Trade objects"""
+    return _parse_tree(file, {_RecordType.TRADE}).trades
+
+
+def parse_corp_action(file: str) -> list[ShareReorg]:
+    """Parse xml to extract Corporation objects"""
+    return _parse_tree(file, {_RecordType.CORP_ACTION}).corp_actions
+
+
 def parse_fx_acquisition_and_disposal(file: str) -> list[BuyTrade | SellTrade]:
     """Parse xml to extract acquisition and disposal of foreign currency"""
-    tree = ET.parse(file)
-    raw_result = tree.findall(".//StmtFunds/StatementOfFundsLine")
-    return [
-        x
-        for x in [_transform_fx_line(line, tree) for line in raw_result]
-        if x is not None
-    ]
+    statement = _parse_tree(file, {_RecordType.FX_RATE, _RecordType.FX})
+    statement.resolve_fx_lines(statement.fx_rates)
+    return statement.fx_trades
+
+
+def parse_dividend(file: str) -> list[Dividend]:
+    """Parse xml to extract Dividend objects"""
+    return _parse_tree(file, {_RecordType.DIVIDEND}).dividends
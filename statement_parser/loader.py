@@ -0,0 +1,78 @@
+""" Load and merge many Flex statements """
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from capital_gain.model import Dividend, Transaction
+from statement_parser.cache import StatementCache
+from statement_parser.ibkr import ParsedStatement, parse_statement
+
+
+def _assign_transaction_id(record: Transaction | Dividend, transaction_id: int) -> int:
+    """Give a record the transaction id and return the id of the next record"""
+    record.transaction_id = transaction_id
+    return transaction_id + 1
+
+
+def _parse_files(
+    file_list: list[str], include_fx: bool, workers: int
+) -> list[ParsedStatement]:
+    """Parse statements, in worker processes if workers > 1"""
+    if workers > 1 and len(file_list) > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            return list(
+                executor.map(partial(parse_statement, include_fx=include_fx), file_list)
+            )
+    return [parse_statement(file, include_fx) for file in file_list]
+
+
+def load_statements(
+    file_list: list[str],
+    include_fx: bool = True,
+    workers: int = 1,
+    cache: StatementCache | None = None,
+) -> ParsedStatement:
+    """Parse statements and merge them into one ParsedStatement.
+    workers: number of processes used to parse the files, each file is parsed
+    in a single process.
+    cache: if given, unchanged files are loaded from the cache instead of parsed
+    Files are merged in the given order, and transaction id is assigned again
+    in that order so that the result does not depend on the number of workers
+    or whether the file is cached. The ids start from the counter before the
+    files are parsed, as parsing in this process also advances the counter.
+    """
+    next_id = Transaction.transaction_id_counter
+    cached = [
+        cache.load(file, include_fx) if cache is not None else None
+        for file in file_list
+    ]
+    to_parse = [file for file, statement in zip(file_list, cached) if statement is None]
+    parsed = iter(_parse_files(to_parse, include_fx, workers))
+    statements: list[ParsedStatement] = []
+    for file, statement in zip(file_list, cached):
+        if statement is None:
+            statement = next(parsed)
+            # statement is cached before fx lines are resolved with other files
+            if cache is not None:
+                cache.save(file, statement, include_fx)
+        statements.append(statement)
+    result = ParsedStatement()
+    # rate missing from a statement can be found in statement of other period
+    for statement in statements:
+        result.fx_rates.update(statement.fx_rates)
+    for statement in statements:
+        statement.resolve_fx_lines(result.fx_rates)
+        for record in [
+            *statement.trades,
+            *statement.corp_actions,
+            *statement.fx_trades,
+            *statement.dividends,
+        ]:
+            next_id = _assign_transaction_id(record, next_id)
+        result.trades.extend(statement.trades)
+        result.corp_actions.extend(statement.corp_actions)
+        result.fx_trades.extend(statement.fx_trades)
+        result.dividends.extend(statement.dividends)
+    Transaction.transaction_id_counter = next_id
+    return result
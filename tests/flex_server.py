@@ -0,0 +1,131 @@
+""" Local stub of the Flex Web Service for testing the XML download """
+from __future__ import annotations
+
+import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+from typing import Any
+import urllib.parse
+
+STATEMENT = (
+    '<FlexQueryResponse queryName="{query}" type="AF">'
+    '<FlexStatements count="1">'
+    '<FlexStatement accountId="U1234567" fromDate="{from_date}" toDate="{to_date}">'
+    "<Trades /></FlexStatement></FlexStatements></FlexQueryResponse>"
+)
+REQUEST_ACCEPTED = (
+    '<FlexStatementResponse timestamp="17 October, 2026 10:00 AM EDT">'
+    "<Status>Success</Status><ReferenceCode>{reference}</ReferenceCode>"
+    "<Url>{url}</Url></FlexStatementResponse>"
+)
+ERROR = (
+    '<FlexStatementResponse timestamp="17 October, 2026 10:00 AM EDT">'
+    "<Status>{status}</Status><ErrorCode>{code}</ErrorCode>"
+    "<ErrorMessage>{message}</ErrorMessage></FlexStatementResponse>"
+)
+
+
+class FlexServer:
+    """Accept a request of any query except of token "bad", then answer error
+    1019 (statement generation in progress) to the first pending_polls fetches
+    of the statement, and until generation_time seconds have passed since the
+    request. statements maps a query to the statement to return, by default a
+    statement with no trades of the requested period, or 6 Apr 2021 to 5 Apr
+    2022 if the request has no dates. delay is the time to answer a request."""
+
+    def __init__(
+        self, pending_polls: int = 1, delay: float = 0, generation_time: float = 0
+    ) -> None:
+        self.pending_polls = pending_polls
+        self.delay = delay
+        self.generation_time = generation_time
+        self.requested: dict[str, float] = {}
+        self.periods: dict[str, tuple[str, str]] = {}
+        self.statements: dict[str, str] = {}
+        self.polls: dict[str, int] = {}
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        """Url of the request to generate a statement"""
+        return f"http://127.0.0.1:{self.server.server_address[1]}/SendRequest"
+
+    def __enter__(self) -> FlexServer:
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self, path: str, parameters: dict[str, str]) -> str:
+        """Body of the response to a request"""
+        if path == "/SendRequest":
+            if parameters["t"] == "bad":
+                return ERROR.format(status="Fail", code="1012", message="Token expired")
+            # reference code of the n-th request of a query is query-n
+            with self.lock:
+                reference = f"{parameters['q']}-" + str(
+                    sum(x.startswith(f"{parameters['q']}-") for x in self.requested)
+                )
+                self.requested[reference] = time.monotonic()
+                if "fd" in parameters:
+                    self.periods[reference] = (parameters["fd"], parameters["td"])
+            return REQUEST_ACCEPTED.format(
+                reference=reference,
+                url=self.url.replace("SendRequest", "GetStatement"),
+            )
+        with self.lock:
+            polls = self.polls.get(parameters["q"], 0)
+            self.polls[parameters["q"]] = polls + 1
+        generating = (
+            time.monotonic() - self.requested.get(parameters["q"], 0)
+            < self.generation_time
+        )
+        if polls < self.pending_polls or generating:
+            return ERROR.format(
+                status="Warn",
+                code="1019",
+                message="Statement generation in progress. Please try again shortly.",
+            )
+        query = parameters["q"].rsplit("-", 1)[0]
+        from_date, to_date = (
+            datetime.datetime.strptime(x, "%Y%m%d").strftime("%d-%b-%y")
+            for x in self.periods.get(parameters["q"], ("20210406", "20220405"))
+        )
+        return self.statements.get(
+            query, STATEMENT.format(query=query, from_date=from_date, to_date=to_date)
+        )
+
+    def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Answer the requests with the stub"""
+
+            def do_GET(self) -> None:  # pylint: disable=invalid-name
+                """Answer a GET request"""
+                url = urllib.parse.urlsplit(self.path)
+                parameters = dict(urllib.parse.parse_qsl(url.query))
+                with stub.lock:
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                time.sleep(stub.delay)
+                body = stub.respond(url.path, parameters).encode("utf-8")
+                with stub.lock:
+                    stub.active -= 1
+                self.send_response(200)
+                self.send_header("Content-Type", "text/xml")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_: Any) -> None:
+                """Do not log the requests"""
+
+        return Handler
@@ -0,0 +1,74 @@
+""" testing for downloading flex queries from a local stub server """
+import asyncio
+import os
+import tempfile
+import unittest
+
+from tests.flex_server import FlexServer
+from xml_import import importer
+from xml_import.batch_importer import BatchDownloader, FlexQuery, download_xml_batch
+from xml_import.exception import RequestRejectedError, RequestTimeoutError
+from xml_import.polling import PollingPolicy
+
+NO_WAIT = PollingPolicy(initial_wait=0, jitter=0, deadline=10)
+
+
+class TestBatchImporter(unittest.TestCase):
+    """To test downloading statements while the server answers error 1019"""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def _queries(self, *tokens: str) -> list[FlexQuery]:
+        return [
+            FlexQuery(token, str(number), os.path.join(self.directory.name, token))
+            for number, token in enumerate(tokens)
+        ]
+
+    def test_download_xml(self) -> None:
+        """Test the synchronous download of one query"""
+        filename = os.path.join(self.directory.name, "data.xml")
+        with FlexServer(pending_polls=2) as server:
+            importer.download_xml("token", "123", filename, server.url, NO_WAIT)
+            self.assertEqual(3, server.polls["123-0"])
+        with open(filename, encoding="utf-8") as file:
+            self.assertIn('queryName="123"', file.read())
+
+    def test_download_batch(self) -> None:
+        """Test that every statement is saved and an error is returned for the
+        rejected query without stopping the others"""
+        queries = self._queries("a", "b", "bad", "c")
+        with FlexServer(pending_polls=3) as server:
+            downloader = BatchDownloader(base_url=server.url, policy=NO_WAIT)
+            result = asyncio.run(downloader.download(queries))
+        self.assertIsInstance(result[2], RequestRejectedError)
+        for query, root in zip(queries, result):
+            if query.token == "bad":
+                self.assertFalse(os.path.exists(query.filename))
+                continue
+            self.assertEqual(query.filename, root)
+            with open(query.filename, encoding="utf-8") as file:
+                self.assertIn(f'queryName="{query.report_number}"', file.read())
+
+    def test_concurrency(self) -> None:
+        """Test that the queries are downloaded at the same time, capped by the
+        maximum concurrency"""
+        queries = self._queries(*"abcdefgh")
+        with FlexServer(pending_polls=1, delay=0.05) as server:
+            result = download_xml_batch(queries, 3, server.url, NO_WAIT)
+            self.assertEqual(3, server.max_active)
+        self.assertFalse(any(isinstance(x, BaseException) for x in result))
+
+    def test_timeout(self) -> None:
+        """Test that the download stops after the retry limit"""
+        with FlexServer(pending_polls=10) as server:
+            policy = PollingPolicy(initial_wait=0.1, backoff=1, jitter=0, deadline=0.15)
+            downloader = BatchDownloader(base_url=server.url, policy=policy)
+            result = asyncio.run(downloader.download(self._queries("a")))
+            self.assertGreaterEqual(server.polls["0-0"], 1)
+        self.assertIsInstance(result[0], RequestTimeoutError)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,5 @@
 """ testing for capital gain matching module """
+from copy import deepcopy
 import datetime
 from decimal import Decimal
 from fractions import Fraction
@@ -8,10 +9,15 @@ import unittest
 from capital_gain.calculator import CgtCalculator
 from capital_gain.model import (
     BuyTrade,
+    CapitalGainEvent,
     CorporateActionType,
+    MatchType,
     Money,
+    Section104,
+    Section104AddEvent,
     SellTrade,
     ShareReorg,
+    TradeMatchEvent,
 )
 
 
@@ -41,6 +47,45 @@ class TestCalculator(unittest.TestCase):
             trades[1].get_unmatched_share(),
         )
 
+    def test_cover_multiple_short(self) -> None:
+        """To test that a buy covers all earlier short sales of the same ticker
+
+        Expected result: Both AMD shorts are covered by the buy and the remaining
+        5 shares go to section 104. The TSLA short stays open.
+        """
+        trades: Sequence[BuyTrade | SellTrade] = [
+            SellTrade(
+                "AMD",
+                datetime.date(2021, 1, 5),
+                Decimal(10),
+                Money(Decimal(1000)),
+            ),
+            SellTrade(
+                "TSLA",
+                datetime.date(2021, 1, 5),
+                Decimal(10),
+                Money(Decimal(1000)),
+            ),
+            SellTrade(
+                "AMD",
+                datetime.date(2021, 1, 6),
+                Decimal(10),
+                Money(Decimal(1000)),
+            ),
+            BuyTrade(
+                "AMD",
+                datetime.date(2021, 3, 1),
+                Decimal(25),
+                Money(Decimal(2500)),
+            ),
+        ]
+        test = CgtCalculator(trades)
+        test.calculate_tax()
+        self.assertEqual(0, trades[0].get_unmatched_share())
+        self.assertEqual(0, trades[2].get_unmatched_share())
+        self.assertEqual(5, test.get_section104().get_qty("AMD"))
+        self.assertEqual([trades[1]], test.get_section104().short_list)
+
     def test_same_day_matching(self) -> None:
         """To test that same day matching function works
 
@@ -74,6 +119,54 @@ class TestCalculator(unittest.TestCase):
         self.assertEqual(trades[1].get_total_gain_exclude_loss(), 5000)
         self.assertEqual(section104_pool.get_cost("AMD"), 10000)
 
+    def test_same_day_multiple_trades(self) -> None:
+        """To test same day matching with several buys and sells on the same day
+
+        Expected result: The first sell matches all 60 shares of the first buy and
+        40 shares of the second buy of the same day. The second sell matches the
+        remaining 20 shares of the second buy, the buy on the next day is untouched
+        """
+        trades: Sequence[BuyTrade | SellTrade] = [
+            BuyTrade(
+                "AMD",
+                datetime.date(2021, 10, 7),
+                Decimal(60),
+                Money(Decimal(6000)),
+            ),
+            SellTrade(
+                "AMD",
+                datetime.date(2021, 10, 7),
+                Decimal(100),
+                Money(Decimal(12000)),
+            ),
+            BuyTrade(
+                "AMD",
+                datetime.date(2021, 10, 8),
+                Decimal(100),
+                Money(Decimal(5000)),
+            ),
+            BuyTrade(
+                "AMD",
+                datetime.date(2021, 10, 7),
+                Decimal(60),
+                Money(Decimal(9000)),
+            ),
+            SellTrade(
+                "AMD",
+                datetime.date(2021, 10, 7),
+                Decimal(20),
+                Money(Decimal(2000)),
+            ),
+        ]
+        test = CgtCalculator(trades)
+        test.calculate_tax()
+        # 12000 - 6000 - 6000
+        self.assertEqual(0, trades[1].calculation_status.total_gain)
+        # 2000 - 3000
+        self.assertEqual(-1000, trades[4].calculation_status.total_gain)
+        self.assertEqual(100, test.get_section104().get_qty("AMD"))
+        self.assertEqual(5000, test.get_section104().get_cost("AMD"))
+
     def test_bed_and_breakfast_matching(self) -> None:
         """To test bread and breakfast matching works and
         match buy transaction within 30 days of a sell
@@ -137,6 +230,48 @@ class TestCalculator(unittest.TestCase):
         self.assertEqual(trades[1].get_total_gain_exclude_loss(), 800)
         self.assertEqual(trades[4].get_total_gain_exclude_loss(), 400)
 
+    def test_bed_and_breakfast_order(self) -> None:
+        """To test that bed and breakfast matching is first in first out even if
+        trades are not given in date order
+
+        Expected result: The sell matches the buy on 10 Oct first, then 5 shares of
+        the buy on 20 Oct. The earlier sell is matched first and takes the buy
+        on 10 Oct.
+        """
+        trades: Sequence[BuyTrade | SellTrade] = [
+            BuyTrade(
+                "AMD",
+                datetime.date(2021, 10, 20),
+                Decimal(10),
+                Money(Decimal(2000)),
+            ),
+            SellTrade(
+                "AMD",
+                datetime.date(2021, 10, 5),
+                Decimal(5),
+                Money(Decimal(1000)),
+            ),
+            BuyTrade(
+                "AMD",
+                datetime.date(2021, 10, 10),
+                Decimal(10),
+                Money(Decimal(1000)),
+            ),
+            SellTrade(
+                "AMD",
+                datetime.date(2021, 10, 1),
+                Decimal(15),
+                Money(Decimal(3000)),
+            ),
+        ]
+        test = CgtCalculator(trades)
+        test.calculate_tax()
+        # 3000 - 1000 - 2000 * 5 / 10
+        self.assertEqual(1000, trades[3].calculation_status.total_gain)
+        # 1000 - 2000 * 5 / 10
+        self.assertEqual(0, trades[1].calculation_status.total_gain)
+        self.assertEqual(0, test.get_section104().get_qty("AMD"))
+
     def test_hmrc_example3(self) -> None:
         """
         In April 2014 Ms Pierson buys 1,000 Lobster plc shares for 400p per share plus
@@ -344,3 +479,149 @@ class TestCalculator(unittest.TestCase):
         section104 = test.get_section104()
         self.assertAlmostEqual(3000, section104.get_qty("Lobster plc"))
         self.assertAlmostEqual(10000, section104.get_cost("Lobster plc"))
+
+    def test_parallel_calculation(self) -> None:
+        """To test that matching tickers in worker processes gives the same result
+        as the serial calculation"""
+        trades: list[BuyTrade | SellTrade] = []
+        for day in range(60):
+            for ticker in ["AMD", "TSLA", "USD"]:
+                trade_class = BuyTrade if (day + len(ticker)) % 3 else SellTrade
+                trades.append(
+                    trade_class(
+                        ticker,
+                        datetime.date(2021, 1, 1) + datetime.timedelta(days=day * 3),
+                        Decimal(day % 7 + 1),
+                        Money(Decimal(day * 10 + 100)),
+                        [Money(Decimal(1))],
+                    )
+                )
+        # leave an open short sale
+        trades.append(
+            SellTrade(
+                "USD",
+                datetime.date(2021, 9, 1),
+                Decimal(1000),
+                Money(Decimal(800)),
+            )
+        )
+        share_reorg = [
+            ShareReorg(
+                "AMD",
+                datetime.date(2021, 3, 1),
+                CorporateActionType.SHARE_SPLIT,
+                Decimal(0),
+                Fraction(2, 1),
+            )
+        ]
+        init_section104 = Section104()
+        init_section104.add_to_section104("TSLA", Decimal(10), Decimal(1000))
+        parallel_trades = deepcopy(trades)
+        parallel_reorg = deepcopy(share_reorg)
+        serial = CgtCalculator(trades, share_reorg, init_section104)
+        serial.calculate_tax()
+        parallel = CgtCalculator(parallel_trades, parallel_reorg, init_section104)
+        parallel.calculate_tax(workers=2)
+        self.assertEqual(trades, parallel_trades)
+        self.assertEqual(share_reorg, parallel_reorg)
+        self.assertEqual(
+            serial.get_section104().section104_list,
+            parallel.get_section104().section104_list,
+        )
+        self.assertEqual(
+            [x.transaction_id for x in serial.get_section104().short_list],
+            [x.transaction_id for x in parallel.get_section104().short_list],
+        )
+        # open shorts refer to the trades given to the calculator
+        self.assertTrue(parallel.get_section104().short_list)
+        for short in parallel.get_section104().short_list:
+            self.assertTrue(any(short is trade for trade in parallel_trades))
+
+    def test_cover_short_of_initial_pool(self) -> None:
+        """Test that a buy covers a short sale carried in the initial section 104
+        pool, as when a calculation is resumed"""
+        first = CgtCalculator(
+            [
+                SellTrade(
+                    "AMD",
+                    datetime.date(2021, 1, 4),
+                    Decimal(10),
+                    Money(Decimal(1000)),
+                )
+            ]
+        )
+        first.calculate_tax()
+        buy = BuyTrade(
+            "AMD",
+            datetime.date(2021, 3, 1),
+            Decimal(15),
+            Money(Decimal(900)),
+        )
+        calculator = CgtCalculator([buy], init_section104=first.get_section104())
+        [short] = calculator.get_section104().short_book["AMD"]
+        calculator.calculate_tax()
+        self.assertEqual(Decimal(0), short.calculation_status.unmatched)
+        self.assertEqual(Decimal(400), short.calculation_status.total_gain)
+        event = buy.calculation_status.events[0]
+        assert isinstance(event, TradeMatchEvent)
+        self.assertEqual(MatchType.SHORT_COVER, event.match_type)
+        self.assertEqual([], calculator.get_section104().short_list)
+        self.assertEqual(Decimal(5), calculator.get_section104().get_qty("AMD"))
+        self.assertEqual(Decimal(300), calculator.get_section104().get_cost("AMD"))
+
+    def test_match_events(self) -> None:
+        """To test that matching records events which are rendered as comment"""
+        trades: Sequence[BuyTrade | SellTrade] = [
+            BuyTrade(
+                "AMD",
+                datetime.date(2021, 10, 5),
+                Decimal(100),
+                Money(Decimal(10000)),
+            ),
+            SellTrade(
+                "AMD",
+                datetime.date(2021, 10, 5),
+                Decimal(40),
+                Money(Decimal(6000)),
+                [Money(Decimal(5))],
+            ),
+        ]
+        test = CgtCalculator(trades)
+        test.calculate_tax()
+        sell_events = trades[1].calculation_status.events
+        self.assertEqual(
+            TradeMatchEvent(MatchType.SAME_DAY, trades[0].transaction_id, Decimal(40)),
+            sell_events[0],
+        )
+        gain_event = sell_events[1]
+        assert isinstance(gain_event, CapitalGainEvent)
+        self.assertEqual(1995, gain_event.capital_gain)
+        self.assertIsInstance(
+            trades[0].calculation_status.events[-1], Section104AddEvent
+        )
+        self.assertEqual(
+            f"same day matched with trade ID {trades[0].transaction_id} for 40.00 "
+            "share(s)Gross proceeds is £6000.00.\n"
+            "Minus cost of buying: £4000.00\n"
+            "Minus allowable disposal dealing cost: £5.00\n"
+            "Capital gain = £1995.00\n\n",
+            trades[1].calculation_status.comment,
+        )
+
+    def test_cached_sterling_value(self) -> None:
+        """To test that cached sterling value and fee follow new value and fee"""
+        trade = SellTrade(
+            "AMD",
+            datetime.date(2021, 10, 5),
+            Decimal(40),
+            Money(Decimal(6000), Decimal("0.5")),
+            [Money(Decimal(5)), Money(Decimal(2), Decimal("0.5"))],
+        )
+        self.assertEqual(3000, trade.get_gross_value())
+        self.assertEqual(6, trade.get_total_fee())
+        trade.transaction_value = Money(Decimal(8000), Decimal("0.5"))
+        trade.fee_and_tax = [Money(Decimal(1))]
+        self.assertEqual(4000, trade.get_gross_value())
+        self.assertEqual(1, trade.get_total_fee())
+        self.assertEqual(2000, trade.get_partial_value(Decimal(20)))
+        self.assertEqual(trade, deepcopy(trade))
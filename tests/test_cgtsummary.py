@@ -68,6 +68,12 @@ class TestCgtSummary(unittest.TestCase):
         self.assertEqual(-535, summary.get_capital_loss(sell_list))
         # 15000 + 5000 + 1500
         self.assertEqual(21500, summary.get_disposal_proceeds(sell_list))
+        self.assertEqual(
+            summary.CapitalGainSummary(
+                3, Decimal(21500), Decimal(15175), Decimal(6860), Decimal(-535)
+            ),
+            summary.get_capital_gain_summary(sell_list),
+        )
 
     def test_date_range(self) -> None:
         """test that only date inside date range is calculated"""
@@ -125,3 +131,71 @@ class TestCgtSummary(unittest.TestCase):
         self.assertEqual(0, summary.get_capital_loss(sell_list))
         # 15000 + 5000 (1500 is outside date range)
         self.assertEqual(16100, summary.get_disposal_proceeds(sell_list))
+
+    def test_grouped_summary(self) -> None:
+        """test that summary of each year and ticker is calculated in one call"""
+        trades: list[BuyTrade | SellTrade] = [
+            BuyTrade(
+                "MMM",
+                datetime.date(2021, 10, 5),
+                Decimal(100),
+                Money(Decimal(10000)),
+            ),
+            BuyTrade(
+                "AMD",
+                datetime.date(2021, 10, 5),
+                Decimal(100),
+                Money(Decimal(5000)),
+            ),
+            SellTrade(
+                "MMM",
+                datetime.date(2021, 11, 3),
+                Decimal(50),
+                Money(Decimal(6000)),
+            ),
+            SellTrade(
+                "MMM",
+                datetime.date(2021, 11, 3),
+                Decimal(10),
+                Money(Decimal(1200)),
+            ),
+            SellTrade(
+                "AMD",
+                datetime.date(2021, 11, 3),
+                Decimal(50),
+                Money(Decimal(2000)),
+            ),
+            SellTrade(
+                "MMM",
+                datetime.date(2022, 5, 3),
+                Decimal(40),
+                Money(Decimal(3000)),
+            ),
+        ]
+        CgtCalculator(trades).calculate_tax()
+        sell_list = [x for x in trades if isinstance(x, SellTrade)]
+        by_year = summary.get_grouped_capital_gain_summary(
+            sell_list, summary.by_tax_year
+        )
+        self.assertEqual([2021, 2022], list(by_year))
+        # two disposals of MMM on the same day count as one
+        self.assertEqual(2, by_year[2021].number_of_disposal)
+        # 1000 + 200 gain from MMM and 500 loss from AMD
+        self.assertEqual(1200, by_year[2021].total_gain_exclude_loss)
+        self.assertEqual(-500, by_year[2021].capital_loss)
+        self.assertEqual(-1000, by_year[2022].capital_loss)
+        by_year_and_ticker = summary.get_grouped_capital_gain_summary(
+            sell_list, summary.by_year_and_ticker
+        )
+        self.assertEqual(
+            summary.CapitalGainSummary(
+                1, Decimal(2000), Decimal(2500), Decimal(0), Decimal(-500)
+            ),
+            by_year_and_ticker[summary.YearAndTicker(2021, "AMD")],
+        )
+        self.assertEqual(
+            by_year[2022], by_year_and_ticker[summary.YearAndTicker(2022, "MMM")]
+        )
+        self.assertEqual(
+            summary.CapitalGainSummary(), summary.get_capital_gain_summary([])
+        )
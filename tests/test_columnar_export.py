@@ -0,0 +1,132 @@
+""" testing for columnar export of the calculation """
+import datetime
+from decimal import Decimal
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from iso4217 import Currency
+
+from capital_gain.calculator import CgtCalculator
+from capital_gain.model import (
+    BuyTrade,
+    Dividend,
+    DividendType,
+    Money,
+    SellTrade,
+    Transaction,
+)
+from columnar_output import arrow_export
+from columnar_output.arrow_export import (
+    ExportFormat,
+    get_columnar_tables,
+    read_arrow,
+    write_columnar,
+)
+from excel_output.report import ReportData
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+class TestColumnarExport(unittest.TestCase):
+    """To test that the calculation is exported as columnar tables"""
+
+    def setUp(self) -> None:
+        trades: list[BuyTrade | SellTrade] = [
+            BuyTrade(
+                "AMD",
+                datetime.date(2021, 10, 5),
+                Decimal(100),
+                Money(Decimal(10000)),
+            ),
+            SellTrade(
+                "AMD",
+                datetime.date(2021, 10, 5),
+                Decimal(30),
+                Money(Decimal(4000)),
+                [Money(Decimal(5))],
+            ),
+            SellTrade(
+                "AMD",
+                datetime.date(2021, 11, 5),
+                Decimal(40),
+                Money(Decimal(6000)),
+            ),
+        ]
+        calculator = CgtCalculator(trades)
+        calculator.calculate_tax()
+        transactions: list[Transaction] = list(trades)
+        dividends = [
+            Dividend(
+                "KO",
+                datetime.date(2021, 6, 1),
+                DividendType.DIVIDEND,
+                Money(Decimal(100), Decimal("0.5"), Currency("USD")),
+                "US",
+            )
+        ]
+        self.data = ReportData(transactions, calculator.get_section104(), dividends)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+
+    def test_columnar_tables(self) -> None:
+        """Test the rows of each table"""
+        tables = get_columnar_tables(self.data)
+        self.assertEqual(3, len(tables["trades"]))
+        self.assertEqual(["AMD"], [x["Symbol"] for x in tables["section104"]])
+        self.assertEqual("Dividends", tables["dividends"][0]["Type"])
+        events = tables["match_events"]
+        # every row has the columns of all kinds of events
+        self.assertEqual(1, len({tuple(row) for row in events}))
+        self.assertEqual("same day", events[0]["match_type"])
+        self.assertIsNone(events[0]["proceeds"])
+        gain = [x for x in events if x["Event"] == "CapitalGainEvent"]
+        # 4000 - 3000 - 5 for the same day match
+        self.assertEqual(Decimal("995.0000000000"), gain[0]["capital_gain"])
+        self.assertEqual(-10, gain[0]["capital_gain"].as_tuple().exponent)
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow is not installed")
+    def test_write_arrow(self) -> None:
+        """Test that the Arrow files can be memory-mapped back"""
+        files = write_columnar(self.data, self.directory)
+        self.assertEqual(4, len(files))
+        trades = read_arrow(os.path.join(self.directory, "trades.arrow"))
+        self.assertEqual(3, trades.num_rows)
+        self.assertEqual(
+            "decimal128(38, 10)", str(trades.schema.field("Quantity").type)
+        )
+        self.assertEqual(
+            [x["ID"] for x in get_columnar_tables(self.data)["trades"]],
+            trades.column("ID").to_pylist(),
+        )
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow is not installed")
+    def test_record_batches(self) -> None:
+        """Test that a table written in many batches has the rows of all
+        batches, including a column that is None in the first batches"""
+        with mock.patch.object(arrow_export, "BATCH_SIZE", 1):
+            write_columnar(self.data, self.directory)
+        events = read_arrow(os.path.join(self.directory, "match_events.arrow"))
+        expected = get_columnar_tables(self.data)["match_events"]
+        self.assertIsNone(expected[0]["proceeds"])
+        self.assertEqual(expected, events.to_pylist())
+        self.assertEqual(
+            "decimal128(38, 10)", str(events.schema.field("proceeds").type)
+        )
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow is not installed")
+    def test_write_parquet(self) -> None:
+        """Test that the tables are written as Parquet files"""
+        files = write_columnar(self.data, self.directory, ExportFormat.PARQUET)
+        self.assertTrue(all(x.endswith(".parquet") for x in files))
+
+    @unittest.skipIf(HAS_PYARROW, "pyarrow is installed")
+    def test_missing_pyarrow(self) -> None:
+        """Test that the export tells pyarrow is needed"""
+        with self.assertRaises(ImportError):
+            write_columnar(self.data, self.directory)
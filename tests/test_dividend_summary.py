@@ -0,0 +1,83 @@
+""" testing for dividend summary """
+import datetime
+from decimal import Decimal
+import unittest
+
+from iso4217 import Currency
+
+from capital_gain.capital_summary import YearAndTicker
+from capital_gain.dividend_summary import (
+    DividendTotal,
+    YearAndCountry,
+    YearAndCurrency,
+    get_dividend_breakdown,
+    get_dividend_summary,
+)
+from capital_gain.model import Dividend, DividendType, Money
+
+
+class TestDividendSummary(unittest.TestCase):
+    """To test that dividend summary is calculated correctly"""
+
+    def setUp(self) -> None:
+        self.dividends = [
+            Dividend(
+                "KO",
+                datetime.date(2021, 6, 1),
+                DividendType.DIVIDEND,
+                Money(Decimal(100), Decimal("0.5"), Currency("USD")),
+                "US",
+            ),
+            Dividend(
+                "KO",
+                datetime.date(2021, 6, 1),
+                DividendType.WITHHOLDING,
+                Money(Decimal(15), Decimal("0.5"), Currency("USD")),
+                "US",
+            ),
+            Dividend(
+                "MMM",
+                datetime.date(2022, 3, 1),
+                DividendType.DIVIDEND_IN_LIEU,
+                Money(Decimal(40), Decimal("0.5"), Currency("USD")),
+                "US",
+            ),
+            Dividend(
+                "BP",
+                datetime.date(2022, 5, 1),
+                DividendType.DIVIDEND,
+                Money(Decimal(30)),
+                "GB",
+            ),
+        ]
+
+    def test_dividend_summary(self) -> None:
+        """Test the summary by tax year and country"""
+        summary = get_dividend_summary(self.dividends)
+        self.assertEqual(2, len(summary))
+        self.assertEqual(YearAndCountry(2021, "US"), summary[0].year_and_country)
+        # 50 + 20 dividend in tax year 2021 and 7.5 withholding tax
+        self.assertEqual(
+            DividendTotal(Decimal(70), Decimal("7.5"), Decimal("62.5")),
+            summary[0].dividend_summary,
+        )
+
+    def test_dividend_breakdown(self) -> None:
+        """Test that summary by ticker and currency are built together"""
+        breakdown = get_dividend_breakdown(self.dividends)
+        self.assertEqual(
+            DividendTotal(Decimal(50), Decimal("7.5"), Decimal("42.5")),
+            breakdown.by_ticker[YearAndTicker(2021, "KO")],
+        )
+        self.assertEqual(
+            DividendTotal(Decimal(20), Decimal(0), Decimal(20)),
+            breakdown.by_ticker[YearAndTicker(2021, "MMM")],
+        )
+        self.assertEqual(
+            breakdown.by_country[YearAndCountry(2021, "US")],
+            breakdown.by_currency[YearAndCurrency(2021, "USD")],
+        )
+        self.assertEqual(
+            DividendTotal(Decimal(30), Decimal(0), Decimal(30)),
+            breakdown.by_currency[YearAndCurrency(2022, "GBP")],
+        )
@@ -0,0 +1,134 @@
+""" testing for fixed point share matching against the Decimal calculation """
+from copy import deepcopy
+import datetime
+from decimal import Decimal
+from fractions import Fraction
+import pickle
+import random
+import unittest
+from unittest import mock
+
+from capital_gain.calculator import CgtCalculator
+from capital_gain.exception import OverMatchError
+from capital_gain.fixed_point import FixedPointCgtCalculator
+from capital_gain.model import (
+    BuyTrade,
+    CorporateActionType,
+    Money,
+    SellTrade,
+    ShareReorg,
+)
+from tests import test_cgtcalc
+
+# largest difference allowed between the fixed point and Decimal calculation
+TOLERANCE = Decimal("1E-6")
+
+
+def make_history(
+    seed: int, number_of_trades: int = 200
+) -> tuple[list[BuyTrade | SellTrade], list[ShareReorg]]:
+    """Random trades of two tickers with fees, short sales and share splits"""
+    rng = random.Random(seed)
+    start = datetime.date(2020, 1, 1)
+    trades: list[BuyTrade | SellTrade] = []
+    for _ in range(number_of_trades):
+        size = Decimal(rng.randint(1, 5000)) / rng.choice([1, 100])
+        trade_class = BuyTrade if rng.random() < 0.55 else SellTrade
+        trades.append(
+            trade_class(
+                rng.choice(["AMD", "TSLA"]),
+                start + datetime.timedelta(days=rng.randint(0, 365)),
+                size,
+                Money(size * Decimal(rng.randint(100, 20000)) / 100, Decimal("0.73")),
+                [Money(Decimal(rng.randint(-100, 1000)) / 100)],
+            )
+        )
+    trades.sort(key=lambda x: x.transaction_date)
+    corp_actions = [
+        ShareReorg(
+            "AMD",
+            start + datetime.timedelta(days=rng.randint(0, 365)),
+            CorporateActionType.SHARE_SPLIT,
+            Decimal(0),
+            Fraction(rng.choice([2, 3, 10]), rng.choice([1, 2, 7])),
+        )
+        for _ in range(rng.randint(0, 3))
+    ]
+    return trades, corp_actions
+
+
+class TestFixedPointCalculator(test_cgtcalc.TestCalculator):
+    """Run the capital gain tests with the fixed point calculator"""
+
+    def setUp(self) -> None:
+        patcher = mock.patch.object(
+            test_cgtcalc, "CgtCalculator", FixedPointCgtCalculator
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TestFixedPointFuzz(unittest.TestCase):
+    """Compare fixed point calculation with Decimal calculation on random trades"""
+
+    def assert_close(self, expected: Decimal, actual: Decimal) -> None:
+        """Assert that two values differ by rounding only"""
+        self.assertLessEqual(abs(expected - actual), TOLERANCE, (expected, actual))
+
+    def test_random_history(self) -> None:
+        """Test that gain, cost and section 104 pool agree on random histories"""
+        compared = 0
+        for seed in range(100):
+            trades, corp_actions = make_history(seed)
+            decimal_trades = deepcopy(trades)
+            decimal_calculator = CgtCalculator(decimal_trades, deepcopy(corp_actions))
+            try:
+                decimal_calculator.calculate_tax()
+            except OverMatchError:
+                # Decimal rounding can over match after a split, nothing to compare
+                continue
+            calculator = FixedPointCgtCalculator(trades, corp_actions)
+            calculator.calculate_tax()
+            compared += 1
+            for expected, actual in zip(decimal_trades, trades):
+                self.assert_close(
+                    expected.calculation_status.unmatched,
+                    actual.calculation_status.unmatched,
+                )
+                self.assert_close(
+                    expected.calculation_status.total_gain,
+                    actual.calculation_status.total_gain,
+                )
+                self.assert_close(
+                    expected.calculation_status.allowable_cost,
+                    actual.calculation_status.allowable_cost,
+                )
+            for ticker in ["AMD", "TSLA"]:
+                self.assert_close(
+                    decimal_calculator.get_section104().get_qty(ticker),
+                    calculator.get_section104().get_qty(ticker),
+                )
+                self.assert_close(
+                    decimal_calculator.get_section104().get_cost(ticker),
+                    calculator.get_section104().get_cost(ticker),
+                )
+        self.assertGreater(compared, 50)
+
+    def test_events(self) -> None:
+        """Test that events have the kinds of the Decimal calculation, and are
+        pickled as the event classes of the model"""
+        # without share split, so that rounding does not change the matching
+        trades, _ = make_history(1, 50)
+        decimal_trades = deepcopy(trades)
+        CgtCalculator(decimal_trades).calculate_tax()
+        FixedPointCgtCalculator(trades).calculate_tax()
+        for expected, actual in zip(decimal_trades, trades):
+            events = actual.calculation_status.events
+            self.assertEqual(
+                [type(x).__name__ for x in expected.calculation_status.events],
+                [type(x).__name__ for x in events],
+            )
+            for event in events:
+                copy = pickle.loads(pickle.dumps(event))
+                self.assertIs(type(copy), type(event).__mro__[1])
+                self.assertEqual(copy, event)
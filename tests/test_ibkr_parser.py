@@ -0,0 +1,214 @@
+""" testing for Interactive Brokers statement parser """
+from decimal import Decimal
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+from capital_gain.model import (
+    BuyTrade,
+    CorporateActionType,
+    Dividend,
+    SellTrade,
+    ShareReorg,
+    Transaction,
+)
+from statement_parser.exception import FxRateNotFoundError
+from statement_parser.ibkr import (
+    FxRateTable,
+    ParsedStatement,
+    iter_statement,
+    parse_corp_action,
+    parse_dividend,
+    parse_fx_acquisition_and_disposal,
+    parse_statement,
+    parse_trade,
+)
+
+SAMPLE_STATEMENT = os.path.join(
+    os.path.dirname(__file__), "data", "sample_statement.xml"
+)
+MISSING_RATE_STATEMENT = os.path.join(
+    os.path.dirname(__file__), "data", "sample_statement_missing_rate.xml"
+)
+
+
+def _summarise(transaction_list) -> list[tuple]:
+    """fields that identify a parsed record regardless of its transaction id"""
+    return [
+        (type(x).__name__, x.ticker, x.transaction_date, getattr(x, "size", None))
+        for x in transaction_list
+    ]
+
+
+class TestIbkrParser(unittest.TestCase):
+    """To test that Flex statement is parsed correctly"""
+
+    def test_parse_statement(self) -> None:
+        """Test that every record type is extracted with a single parse"""
+        statement = parse_statement(SAMPLE_STATEMENT)
+        # option trade is not included
+        self.assertEqual(["AMD", "AMD", "VOD"], [x.ticker for x in statement.trades])
+        self.assertIsInstance(statement.trades[0], BuyTrade)
+        self.assertIsInstance(statement.trades[1], SellTrade)
+        self.assertEqual(Decimal(40), statement.trades[1].size)
+        # only forward and reverse split is supported
+        self.assertEqual(1, len(statement.corp_actions))
+        self.assertEqual(
+            CorporateActionType.SHARE_SPLIT, statement.corp_actions[0].transaction_type
+        )
+        # statement of funds line without debit and credit is ignored
+        self.assertEqual(["USD", "USD", "GBP"], [x.ticker for x in statement.fx_trades])
+        self.assertEqual(
+            Decimal("10001") * Decimal("0.72"),
+            statement.fx_trades[0].transaction_value.get_value(),
+        )
+        # summary and interest lines are not dividends
+        self.assertEqual(2, len(statement.dividends))
+        self.assertEqual(Decimal("1.5"), statement.dividends[1].value.value)
+
+    def test_include_fx(self) -> None:
+        """Test that fx lines are skipped when not needed"""
+        statement = parse_statement(SAMPLE_STATEMENT, include_fx=False)
+        self.assertEqual([], statement.fx_trades)
+        self.assertEqual(3, len(statement.trades))
+
+    def test_wrapper(self) -> None:
+        """Test that the per type functions give the same result"""
+        statement = parse_statement(SAMPLE_STATEMENT)
+        self.assertEqual(
+            _summarise(statement.trades), _summarise(parse_trade(SAMPLE_STATEMENT))
+        )
+        self.assertEqual(
+            _summarise(statement.corp_actions),
+            _summarise(parse_corp_action(SAMPLE_STATEMENT)),
+        )
+        self.assertEqual(
+            _summarise(statement.fx_trades),
+            _summarise(parse_fx_acquisition_and_disposal(SAMPLE_STATEMENT)),
+        )
+        self.assertEqual(
+            _summarise(statement.dividends),
+            _summarise(parse_dividend(SAMPLE_STATEMENT)),
+        )
+        # only the returned records take a transaction id
+        next_id = Transaction.transaction_id_counter
+        corp_actions = parse_corp_action(SAMPLE_STATEMENT)
+        self.assertEqual(
+            next_id + len(corp_actions), Transaction.transaction_id_counter
+        )
+
+    def test_streaming(self) -> None:
+        """Test that streaming mode extract the same records as tree mode"""
+        statement = parse_statement(SAMPLE_STATEMENT)
+        streamed = parse_statement(SAMPLE_STATEMENT, streaming=True)
+        self.assertEqual(_summarise(statement.trades), _summarise(streamed.trades))
+        self.assertEqual(
+            _summarise(statement.corp_actions), _summarise(streamed.corp_actions)
+        )
+        # rate of GBP is known without looking up conversion rates at the end
+        self.assertEqual(
+            sorted(_summarise(statement.fx_trades)),
+            sorted(_summarise(streamed.fx_trades)),
+        )
+        self.assertEqual(
+            _summarise(statement.dividends), _summarise(streamed.dividends)
+        )
+        self.assertEqual(
+            sorted(
+                x.transaction_value.get_value()
+                for x in [*statement.trades, *statement.fx_trades]
+            ),
+            sorted(
+                x.transaction_value.get_value()
+                for x in [*streamed.trades, *streamed.fx_trades]
+            ),
+        )
+
+    def test_gzip(self) -> None:
+        """Test that a statement compressed with gzip is parsed the same way"""
+        with tempfile.TemporaryDirectory() as directory:
+            compressed = os.path.join(directory, "statement.xml.gz")
+            with open(SAMPLE_STATEMENT, "rb") as source, gzip.open(
+                compressed, "wb"
+            ) as target:
+                shutil.copyfileobj(source, target)
+            for streaming in (False, True):
+                statement = parse_statement(SAMPLE_STATEMENT, streaming=streaming)
+                parsed = parse_statement(compressed, streaming=streaming)
+                for record_type in ("trades", "corp_actions", "fx_trades", "dividends"):
+                    self.assertEqual(
+                        _summarise(getattr(statement, record_type)),
+                        _summarise(getattr(parsed, record_type)),
+                    )
+
+    def test_iter_statement(self) -> None:
+        """Test that records are yielded in file order, including fx trades
+        before the conversion rates section"""
+        records = list(iter_statement(SAMPLE_STATEMENT))
+        self.assertEqual(
+            ["AMD", "AMD", "VOD", "NVDA", "AMD", "AMD", "USD", "USD", "GBP"],
+            [x.ticker for x in records],
+        )
+        self.assertIsInstance(records[3], ShareReorg)
+        self.assertIsInstance(records[4], Dividend)
+        self.assertEqual(6, len(list(iter_statement(SAMPLE_STATEMENT, False))))
+
+    def test_iter_statement_other_rates(self) -> None:
+        """Test that a rate missing in the statement is taken from other
+        statements, which are not changed"""
+        fx_rates = parse_statement(SAMPLE_STATEMENT).fx_rates
+        rates = dict(fx_rates.rates)
+        with self.assertRaises(FxRateNotFoundError):
+            list(iter_statement(MISSING_RATE_STATEMENT))
+        records = list(iter_statement(MISSING_RATE_STATEMENT, fx_rates=fx_rates))
+        self.assertEqual(["TSLA", "USD"], [x.ticker for x in records])
+        self.assertEqual(rates, fx_rates.rates)
+
+    def test_fx_rate_table(self) -> None:
+        """Test look up and merging of fx rates"""
+        fx_rates = FxRateTable()
+        fx_rates.add_rate("05-Oct-21", "USD", "GBP", Decimal("0.72"))
+        fx_rates.add_rate("06-Oct-21", "USD", "GBP", Decimal(-1))
+        self.assertEqual(Decimal("0.72"), fx_rates.get_rate("USD", "GBP", "05-Oct-21"))
+        self.assertEqual(Decimal(1), fx_rates.get_rate("GBP", "GBP", "07-Oct-21"))
+        with self.assertRaises(FxRateNotFoundError):
+            fx_rates.get_rate("USD", "GBP", "06-Oct-21")
+        with self.assertRaises(FxRateNotFoundError):
+            fx_rates.get_rate("USD", "GBP", "07-Oct-21")
+        other = FxRateTable()
+        other.add_rate("05-Oct-21", "USD", "GBP", Decimal("0.8"))
+        other.add_rate("06-Oct-21", "USD", "GBP", Decimal("0.73"))
+        fx_rates.update(other)
+        # existing valid rate is kept, error rate is replaced
+        self.assertEqual(Decimal("0.72"), fx_rates.get_rate("USD", "GBP", "05-Oct-21"))
+        self.assertEqual(Decimal("0.73"), fx_rates.get_rate("USD", "GBP", "06-Oct-21"))
+
+    def test_pending_fx_line(self) -> None:
+        """Test that fx line without rate is valued with rates of another file"""
+        statement = ParsedStatement()
+        statement.add_fx_line(
+            ET.Element(
+                "StatementOfFundsLine",
+                {
+                    "currency": "USD",
+                    "reportDate": "05-Oct-21",
+                    "activityDescription": "Buy 100 ADVANCED MICRO DEVICES",
+                    "debit": "-100",
+                    "credit": "",
+                },
+            )
+        )
+        self.assertEqual([], statement.fx_trades)
+        self.assertEqual(1, len(statement.pending_fx_lines))
+        with self.assertRaises(FxRateNotFoundError):
+            statement.resolve_fx_lines(statement.fx_rates)
+        merged_rates = FxRateTable()
+        merged_rates.update(parse_statement(SAMPLE_STATEMENT).fx_rates)
+        statement.resolve_fx_lines(merged_rates)
+        self.assertEqual([], statement.pending_fx_lines)
+        self.assertEqual(
+            Decimal(72), statement.fx_trades[0].transaction_value.get_value()
+        )
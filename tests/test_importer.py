@@ -0,0 +1,72 @@
+""" testing for streaming the flex query file to disk """
+import gzip
+import os
+import tempfile
+import unittest
+
+from tests.flex_server import ERROR, STATEMENT, FlexServer
+from xml_import import importer
+from xml_import.exception import RequestRejectedError
+from xml_import.polling import PollingPolicy
+
+
+class TestImporter(unittest.TestCase):
+    """To test downloading a statement from a local stub server"""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.policy = PollingPolicy(initial_wait=0, jitter=0, deadline=10)
+        # statement larger than a chunk, so it is written in several chunks
+        self.statement = STATEMENT.format(
+            query="1", from_date="06-Apr-21", to_date="05-Apr-22"
+        ).replace(
+            "<Trades />", "<Trades>" + '<Trade symbol="AMD" />' * 10000 + "</Trades>"
+        )
+        self.assertGreater(len(self.statement), importer.CHUNK_SIZE)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory.name, name)
+
+    def test_stream_to_file(self) -> None:
+        """Test that the response is saved unchanged, without a temporary file
+        left behind"""
+        with FlexServer(pending_polls=1) as server:
+            server.statements["1"] = self.statement
+            importer.download_xml(
+                "token", "1", self._path("data.xml"), server.url, self.policy
+            )
+        with open(self._path("data.xml"), encoding="utf-8") as file:
+            self.assertEqual(self.statement, file.read())
+        self.assertEqual(["data.xml"], os.listdir(self.directory.name))
+
+    def test_gzip(self) -> None:
+        """Test that the statement is compressed when the name ends with .gz"""
+        with FlexServer(pending_polls=0) as server:
+            server.statements["1"] = self.statement
+            importer.download_xml(
+                "token", "1", self._path("data.xml.gz"), server.url, self.policy
+            )
+        with gzip.open(self._path("data.xml.gz"), "rt", encoding="utf-8") as file:
+            self.assertEqual(self.statement, file.read())
+        self.assertLess(os.path.getsize(self._path("data.xml.gz")), len(self.statement))
+
+    def test_rejected(self) -> None:
+        """Test that an existing file is kept when the download fails"""
+        with open(self._path("data.xml"), "w", encoding="utf-8") as file:
+            file.write("old")
+        with FlexServer(pending_polls=1) as server:
+            server.statements["1"] = ERROR.format(
+                status="Fail", code="1020", message="Invalid request"
+            )
+            with self.assertRaises(RequestRejectedError):
+                importer.download_xml(
+                    "token", "1", self._path("data.xml"), server.url, self.policy
+                )
+        with open(self._path("data.xml"), encoding="utf-8") as file:
+            self.assertEqual("old", file.read())
+        self.assertEqual(["data.xml"], os.listdir(self.directory.name))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,202 @@
+""" testing for the SQLite ledger of transactions and calculation result """
+from copy import deepcopy
+import datetime
+from decimal import Decimal
+from fractions import Fraction
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from iso4217 import Currency
+
+from capital_gain.calculator import CgtCalculator
+from capital_gain.model import (
+    BuyTrade,
+    CorporateActionType,
+    Dividend,
+    DividendType,
+    Money,
+    Section104,
+    SellTrade,
+    ShareReorg,
+    Transaction,
+)
+from ledger.sqlite_ledger import Ledger, calculate_from_ledger
+from tests.test_fixed_point import make_history
+
+
+class TestLedger(unittest.TestCase):
+    """To test storing and querying the transactions in the ledger"""
+
+    def setUp(self) -> None:
+        self.trades: list[BuyTrade | SellTrade] = [
+            BuyTrade(
+                "AMD",
+                datetime.date(2021, 3, 5),
+                Decimal(100),
+                Money(Decimal("10000.5"), Decimal("0.73"), Currency("USD"), "note"),
+                [Money(Decimal(5)), Money(Decimal("1.25"), Decimal("0.73"))],
+            ),
+            SellTrade(
+                "AMD",
+                datetime.date(2021, 4, 6),
+                Decimal(30),
+                Money(Decimal(4000)),
+            ),
+            SellTrade(
+                "TSLA",
+                datetime.date(2021, 4, 10),
+                Decimal(10),
+                Money(Decimal(6000)),
+            ),
+        ]
+        self.corp_actions = [
+            ShareReorg(
+                "AMD",
+                datetime.date(2021, 5, 1),
+                CorporateActionType.SHARE_SPLIT,
+                Decimal(0),
+                Fraction(3, 2),
+            )
+        ]
+        self.dividends = [
+            Dividend(
+                "KO",
+                datetime.date(2021, 6, 1),
+                DividendType.DIVIDEND,
+                Money(Decimal(100), Decimal("0.5"), Currency("USD")),
+                "US",
+            )
+        ]
+        self.ledger = Ledger()
+        self.ledger.add_trades(self.trades)
+        self.ledger.add_corp_actions(self.corp_actions)
+        self.ledger.add_dividends(self.dividends)
+
+    def tearDown(self) -> None:
+        self.ledger.close()
+
+    def test_round_trip(self) -> None:
+        """Test that the records are read back unchanged with their id"""
+        self.assertEqual(self.trades, list(self.ledger.iter_trades()))
+        self.assertEqual(
+            [x.transaction_id for x in self.trades],
+            [x.transaction_id for x in self.ledger.iter_trades()],
+        )
+        self.assertEqual(self.corp_actions, list(self.ledger.iter_corp_actions()))
+        self.assertEqual(self.dividends, list(self.ledger.iter_dividends()))
+
+    def test_query(self) -> None:
+        """Test querying by ticker, date range and tax year"""
+        self.assertEqual(self.trades[:2], list(self.ledger.iter_trades("AMD")))
+        self.assertEqual(
+            self.trades[1:],
+            list(self.ledger.iter_trades(start=datetime.date(2021, 4, 6))),
+        )
+        self.assertEqual(
+            self.trades[:2],
+            list(self.ledger.iter_trades(end=datetime.date(2021, 4, 6))),
+        )
+        # tax year 2021 starts on 6 Apr 2021
+        self.assertEqual(self.trades[1:], list(self.ledger.iter_trades(tax_year=2021)))
+        self.assertEqual([], list(self.ledger.iter_dividends("AMD")))
+        self.assertEqual(["AMD", "TSLA"], self.ledger.tickers())
+
+    def test_duplicate_id(self) -> None:
+        """Test that a transaction is not added twice"""
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.ledger.add_trades(self.trades[:1])
+        # the failed insert is rolled back
+        self.assertEqual(3, len(list(self.ledger.iter_trades())))
+
+    def test_reopen(self) -> None:
+        """Test that new transactions do not reuse the stored ids"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ledger.sqlite")
+            with Ledger(path) as ledger:
+                ledger.add_trades(self.trades)
+            Transaction.transaction_id_counter = 0
+            with Ledger(path) as ledger:
+                self.assertEqual(self.trades, list(ledger.iter_trades()))
+                self.assertGreater(
+                    Transaction.transaction_id_counter,
+                    max(x.transaction_id for x in self.trades),
+                )
+
+    def test_calculate_from_ledger(self) -> None:
+        """Test that the calculation per ticker gives the same result as
+        calculating all trades at once"""
+        trades, corp_actions = make_history(7)
+        init_section104 = Section104()
+        init_section104.add_to_section104("AMD", Decimal(1000), Decimal(5000))
+        expected_trades = deepcopy(trades)
+        calculator = CgtCalculator(
+            expected_trades, deepcopy(corp_actions), deepcopy(init_section104)
+        )
+        calculator.calculate_tax()
+        expected = calculator.get_section104()
+        with Ledger() as ledger:
+            ledger.add_trades(trades)
+            ledger.add_corp_actions(corp_actions)
+            section104 = calculate_from_ledger(ledger, init_section104)
+            # the initial pool is not changed
+            self.assertEqual(
+                Decimal(1000), init_section104.section104_list["AMD"].quantity
+            )
+            self.assertEqual(
+                dict(expected.section104_list), dict(section104.section104_list)
+            )
+            self.assertEqual(expected.short_list, section104.short_list)
+            stored = sorted(ledger.iter_trades(), key=lambda x: x.transaction_id)
+            expected_trades.sort(key=lambda x: x.transaction_id)
+            self.assertEqual(
+                [x.calculation_status for x in expected_trades],
+                [x.calculation_status for x in stored],
+            )
+            # calculating again replaces the stored result
+            calculate_from_ledger(ledger, init_section104)
+            self.assertEqual(
+                [x.calculation_status for x in stored],
+                [
+                    x.calculation_status
+                    for x in sorted(
+                        ledger.iter_trades(), key=lambda x: x.transaction_id
+                    )
+                ],
+            )
+
+    def test_match_events(self) -> None:
+        """Test that the match events are stored in columns that can be queried
+        and read back with the trades and corporate actions"""
+        trades, corp_actions = make_history(1)
+        CgtCalculator(trades, corp_actions).calculate_tax()
+        with Ledger() as ledger:
+            ledger.add_trades(trades)
+            ledger.add_corp_actions(corp_actions)
+            ledger.save_results([*trades, *corp_actions])
+            self.assertEqual(
+                sorted(trades, key=lambda x: x.transaction_id),
+                sorted(ledger.iter_trades(), key=lambda x: x.transaction_id),
+            )
+            self.assertEqual(
+                [x.calculation_status.events for x in trades if x.ticker == "AMD"],
+                [x.calculation_status.events for x in ledger.iter_trades("AMD")],
+            )
+            self.assertEqual(
+                [x.events for x in corp_actions],
+                [x.events for x in ledger.iter_corp_actions()],
+            )
+            total_gain = ledger.connection.execute(
+                "SELECT sum(capital_gain) FROM match_events "
+                "WHERE event = 'CapitalGainEvent'"
+            ).fetchone()[0]
+            self.assertAlmostEqual(
+                float(sum(x.calculation_status.total_gain for x in trades)),
+                total_gain,
+                places=4,
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+""" testing for the polling policy of the flex query download """
+import os
+import random
+import tempfile
+import time
+import unittest
+
+from tests.flex_server import FlexServer
+from xml_import import importer
+from xml_import.exception import RequestTimeoutError
+from xml_import.polling import PollingPolicy, expected_size
+
+
+class FakeClock:
+    """Clock that only moves when a wait is taken"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _take_waits(policy: PollingPolicy, clock: FakeClock, size=None) -> list[float]:
+    """Waits until the deadline, as if each attempt took no time"""
+    waits = []
+    for wait in policy.waits(size):
+        waits.append(wait)
+        clock.now += wait
+    return waits
+
+
+class TestPollingPolicy(unittest.TestCase):
+    """To test the waiting time between the attempts"""
+
+    def test_backoff(self) -> None:
+        """Test that the wait doubles up to the maximum, and the last wait ends
+        at the deadline"""
+        clock = FakeClock()
+        policy = PollingPolicy(jitter=0, deadline=200, clock=clock)
+        self.assertEqual([1, 2, 4, 8, 16, 32, 60, 60, 17], _take_waits(policy, clock))
+
+    def test_jitter(self) -> None:
+        """Test that the wait is changed randomly within the jitter"""
+        clock = FakeClock()
+        policy = PollingPolicy(
+            initial_wait=10, backoff=1, jitter=0.2, rng=random.Random(1), clock=clock
+        )
+        waits = _take_waits(policy, clock)
+        self.assertTrue(all(8 <= x <= 12 for x in waits[:-1]))
+        self.assertGreater(len(set(waits)), 1)
+        self.assertAlmostEqual(600, sum(waits))
+
+    def test_expected_size(self) -> None:
+        """Test that a larger statement waits longer for the first attempt"""
+        policy = PollingPolicy()
+        self.assertEqual(1, policy.first_wait())
+        self.assertEqual(21, policy.first_wait(10_000_000))
+        self.assertEqual(60, policy.first_wait(1_000_000_000))
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "data.xml")
+            self.assertIsNone(expected_size(filename))
+            with open(filename, "wb") as file:
+                file.write(b"0" * 100)
+            self.assertEqual(100, expected_size(filename))
+
+    def test_fake_server(self) -> None:
+        """Test that a small statement is fetched soon after it is generated, a
+        large statement is fetched with few attempts, and the download stops at
+        the deadline"""
+        with tempfile.TemporaryDirectory() as directory, FlexServer(
+            pending_polls=0, generation_time=0.2
+        ) as server:
+            filename = os.path.join(directory, "data.xml")
+            policy = PollingPolicy(initial_wait=0.05, jitter=0, deadline=5)
+            start = time.monotonic()
+            importer.download_xml("token", "1", filename, server.url, policy)
+            # polls at 0.05, 0.15, 0.35 seconds
+            self.assertLess(time.monotonic() - start, 1)
+            self.assertEqual(3, server.polls["1-0"])
+
+            server.generation_time = 1.5
+            importer.download_xml("token", "2", filename, server.url, policy)
+            self.assertLessEqual(server.polls["2-0"], 6)
+
+            policy.deadline = 0.3
+            server.generation_time = 10
+            with self.assertRaises(RequestTimeoutError):
+                importer.download_xml("token", "3", filename, server.url, policy)
+
+
+if __name__ == "__main__":
+    unittest.main()
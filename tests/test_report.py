@@ -0,0 +1,101 @@
+""" testing for writing the report workbooks """
+import datetime
+from decimal import Decimal
+import os
+import shutil
+import tempfile
+import unittest
+
+from iso4217 import Currency
+
+from capital_gain.calculator import CgtCalculator
+from capital_gain.model import (
+    BuyTrade,
+    Dividend,
+    DividendType,
+    Money,
+    SellTrade,
+    Transaction,
+)
+from excel_output.capital_gain_list import write_trade_by_ticker
+from excel_output.report import Report, ReportData, write_reports
+from excel_output.utility import MAX_CONSTANT_MEMORY_SHEETS, new_workbook
+
+
+class TestReport(unittest.TestCase):
+    """To test that the selected report workbooks are written"""
+
+    def setUp(self) -> None:
+        trades: list[BuyTrade | SellTrade] = [
+            BuyTrade(
+                "AMD",
+                datetime.date(2021, 10, 5),
+                Decimal(100),
+                Money(Decimal(10000)),
+            ),
+            SellTrade(
+                "AMD",
+                datetime.date(2021, 11, 5),
+                Decimal(40),
+                Money(Decimal(6000)),
+            ),
+        ]
+        calculator = CgtCalculator(trades)
+        calculator.calculate_tax()
+        transactions: list[Transaction] = list(trades)
+        dividends = [
+            Dividend(
+                "KO",
+                datetime.date(2021, 6, 1),
+                DividendType.DIVIDEND,
+                Money(Decimal(100), Decimal("0.5"), Currency("USD")),
+                "US",
+            )
+        ]
+        self.data = ReportData(transactions, calculator.get_section104(), dividends)
+        self.directory = tempfile.mkdtemp()
+        current_directory = os.getcwd()
+        os.chdir(self.directory)
+        self.addCleanup(os.chdir, current_directory)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+
+    def test_selected_reports(self) -> None:
+        """Test that only the selected reports are written"""
+        write_reports(self.data, [Report.DIVIDEND, Report.SECTION104])
+        self.assertEqual(
+            ["Dividend.xlsx", "Section104.xlsx"], sorted(os.listdir(self.directory))
+        )
+
+    def test_parallel_reports(self) -> None:
+        """Test that all reports are written by worker processes"""
+        write_reports(self.data, workers=2)
+        self.assertEqual(
+            [
+                "CgtPerYearAndSummary.xlsx",
+                "Dividend.xlsx",
+                "Section104.xlsx",
+                "TradesByTicker.xlsx",
+            ],
+            sorted(os.listdir(self.directory)),
+        )
+
+    def test_constant_memory_sheet_limit(self) -> None:
+        """Test that a workbook with too many worksheets for constant memory
+        mode is written in default mode"""
+        for sheet_count, expected in [
+            (None, True),
+            (MAX_CONSTANT_MEMORY_SHEETS, True),
+            (MAX_CONSTANT_MEMORY_SHEETS + 1, False),
+        ]:
+            workbook = new_workbook("Test.xlsx", True, sheet_count)
+            self.assertEqual(expected, workbook.constant_memory)
+            workbook.close()
+        trades = [
+            BuyTrade(f"T{i}", datetime.date(2021, 10, 5), Decimal(1), Money(Decimal(1)))
+            for i in range(MAX_CONSTANT_MEMORY_SHEETS + 1)
+        ]
+        with self.assertLogs("excel_output.utility", "WARNING"):
+            write_trade_by_ticker(trades, constant_memory=True)
+        self.assertTrue(os.path.exists("TradesByTicker.xlsx"))
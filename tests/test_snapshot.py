@@ -0,0 +1,193 @@
+""" testing for snapshot of capital gain calculation """
+from copy import deepcopy
+import datetime
+from decimal import Decimal
+from fractions import Fraction
+import os
+import shutil
+import tempfile
+import unittest
+
+from capital_gain.calculator import CgtCalculator
+from capital_gain.exception import SnapshotMismatchError
+from capital_gain.model import (
+    BuyTrade,
+    CorporateActionType,
+    Money,
+    SellTrade,
+    ShareReorg,
+    Transaction,
+)
+from capital_gain.snapshot import (
+    load_snapshot,
+    resume_calculator,
+    save_snapshot,
+    take_snapshot,
+    verify_snapshot,
+)
+
+BOUNDARY = datetime.date(2021, 4, 6)
+
+
+class TestSnapshot(unittest.TestCase):
+    """To test that calculation resumed from a snapshot matches full calculation"""
+
+    def setUp(self) -> None:
+        self.trades: list[BuyTrade | SellTrade] = [
+            BuyTrade(
+                "AMD",
+                datetime.date(2020, 10, 5),
+                Decimal(100),
+                Money(Decimal(10000)),
+            ),
+            # short sale covered after the share split and the boundary
+            SellTrade(
+                "TSLA",
+                datetime.date(2020, 11, 2),
+                Decimal(10),
+                Money(Decimal(5000)),
+            ),
+            # inside 30 days before the boundary
+            SellTrade(
+                "AMD",
+                datetime.date(2021, 3, 30),
+                Decimal(50),
+                Money(Decimal(7500)),
+            ),
+            # bed and breakfast match of the sell before the boundary
+            BuyTrade(
+                "AMD",
+                datetime.date(2021, 4, 10),
+                Decimal(20),
+                Money(Decimal(2400)),
+            ),
+            BuyTrade(
+                "TSLA",
+                datetime.date(2021, 6, 1),
+                Decimal(40),
+                Money(Decimal(4000)),
+            ),
+            SellTrade(
+                "AMD",
+                datetime.date(2021, 7, 1),
+                Decimal(30),
+                Money(Decimal(4500)),
+            ),
+        ]
+        self.share_reorg = [
+            ShareReorg(
+                "TSLA",
+                datetime.date(2020, 12, 1),
+                CorporateActionType.SHARE_SPLIT,
+                Decimal(0),
+                Fraction(3, 1),
+            )
+        ]
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+
+    def _new_trades(self) -> list[BuyTrade | SellTrade]:
+        """trades from the boundary onward"""
+        return [x for x in self.trades if x.transaction_date >= BOUNDARY]
+
+    def test_resume_match_full_calculation(self) -> None:
+        """Test that resumed calculation gives the same gain as full calculation"""
+        snapshot = take_snapshot(self.trades, BOUNDARY, self.share_reorg)
+        self.assertEqual(100, snapshot.section104.get_qty("AMD"))
+        self.assertEqual(
+            [datetime.date(2021, 3, 30)],
+            [x.transaction_date for x in snapshot.pending_trades],
+        )
+        self.assertEqual(1, len(snapshot.section104.short_list))
+        new_trades = deepcopy(self._new_trades())
+        calculator = resume_calculator(snapshot, new_trades)
+        calculator.calculate_tax()
+        CgtCalculator(self.trades, self.share_reorg).calculate_tax()
+        # 7500 - 2400 - 10000 * 30 / 100
+        self.assertEqual(2100, snapshot.pending_trades[0].calculation_status.total_gain)
+        self.assertEqual(
+            self.trades[2].calculation_status.total_gain,
+            snapshot.pending_trades[0].calculation_status.total_gain,
+        )
+        self.assertEqual(
+            self.trades[5].calculation_status.total_gain,
+            new_trades[2].calculation_status.total_gain,
+        )
+        # short of 10 shares is 30 shares after the split, 10 shares go to section 104
+        self.assertEqual(10, calculator.get_section104().get_qty("TSLA"))
+        self.assertEqual([], calculator.get_section104().short_list)
+
+    def test_verify_snapshot(self) -> None:
+        """Test that verification finds a snapshot that does not match history"""
+        snapshot = take_snapshot(self.trades, BOUNDARY, self.share_reorg)
+        verify_snapshot(snapshot, self.trades, self.share_reorg)
+        snapshot.section104.add_to_section104("AMD", Decimal(0), Decimal(1))
+        with self.assertRaises(SnapshotMismatchError):
+            verify_snapshot(snapshot, self.trades, self.share_reorg)
+
+    def test_snapshot_from_previous_snapshot(self) -> None:
+        """Test that a snapshot can be taken from the snapshot of previous year"""
+        first = take_snapshot(self.trades, datetime.date(2021, 1, 1), self.share_reorg)
+        second = take_snapshot(
+            [x for x in self.trades if x.transaction_date >= datetime.date(2021, 1, 1)],
+            BOUNDARY,
+            previous=first,
+        )
+        self.assertEqual(1, len(second.split_history))
+        verify_snapshot(second, self.trades, self.share_reorg)
+
+    def test_hold_through_split(self) -> None:
+        """Test that a split of shares held in the pool is applied in a year with
+        no trade of the ticker"""
+        trades: list[BuyTrade | SellTrade] = [
+            BuyTrade(
+                "NVDA", datetime.date(2020, 6, 1), Decimal(10), Money(Decimal(1000))
+            ),
+            SellTrade(
+                "NVDA", datetime.date(2022, 6, 1), Decimal(40), Money(Decimal(3000))
+            ),
+        ]
+        split = [
+            ShareReorg(
+                "NVDA",
+                datetime.date(2021, 7, 20),
+                CorporateActionType.SHARE_SPLIT,
+                Decimal(0),
+                Fraction(4, 1),
+            )
+        ]
+        first = take_snapshot(trades, BOUNDARY, split)
+        second = take_snapshot([], datetime.date(2022, 4, 6), split, previous=first)
+        self.assertEqual(40, second.section104.get_qty("NVDA"))
+        verify_snapshot(second, trades, split)
+        new_trades = deepcopy(trades[1:])
+        calculator = resume_calculator(second, new_trades)
+        calculator.calculate_tax()
+        self.assertEqual(2000, new_trades[0].calculation_status.total_gain)
+        self.assertEqual([], calculator.get_section104().short_list)
+
+    def test_resume_before_boundary(self) -> None:
+        """Test that trades before the boundary cannot be added to snapshot"""
+        snapshot = take_snapshot(self.trades, BOUNDARY, self.share_reorg)
+        with self.assertRaises(ValueError):
+            resume_calculator(snapshot, self.trades)
+
+    def test_save_and_load(self) -> None:
+        """Test that saved snapshot is loaded with the id counter moved past its
+        transactions"""
+        snapshot = take_snapshot(self.trades, BOUNDARY, self.share_reorg)
+        file = os.path.join(self.directory, "snapshot")
+        save_snapshot(snapshot, file)
+        Transaction.transaction_id_counter = 1
+        loaded = load_snapshot(file)
+        self.assertEqual(
+            snapshot.section104.section104_list, loaded.section104.section104_list
+        )
+        self.assertEqual(snapshot.pending_trades, loaded.pending_trades)
+        self.assertGreater(
+            Transaction.transaction_id_counter,
+            max(x.transaction_id for x in loaded.section104.short_list),
+        )
+        verify_snapshot(loaded, self.trades, self.share_reorg)
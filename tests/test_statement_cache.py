@@ -0,0 +1,106 @@
+""" testing for cache of parsed statements """
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from statement_parser import cache as statement_cache
+from statement_parser.cache import StatementCache
+from statement_parser.ibkr import parse_statement
+from statement_parser.loader import load_statements
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+SAMPLE_STATEMENT = os.path.join(DATA_DIR, "sample_statement.xml")
+MISSING_RATE_STATEMENT = os.path.join(DATA_DIR, "sample_statement_missing_rate.xml")
+
+
+class TestStatementCache(unittest.TestCase):
+    """To test that parsed statements are cached and invalidated correctly"""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.cache = StatementCache(os.path.join(self.directory, "cache"))
+        self.statement = os.path.join(self.directory, "statement.xml")
+        shutil.copy(SAMPLE_STATEMENT, self.statement)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+
+    def test_load_from_cache(self) -> None:
+        """Test that second load of unchanged file does not parse the file again"""
+        first = load_statements([self.statement], cache=self.cache)
+        with mock.patch("statement_parser.loader.parse_statement") as parse:
+            second = load_statements([self.statement], cache=self.cache)
+            parse.assert_not_called()
+        self.assertEqual(
+            [(x.ticker, x.size) for x in first.trades],
+            [(x.ticker, x.size) for x in second.trades],
+        )
+        self.assertEqual(len(first.fx_trades), len(second.fx_trades))
+        self.assertNotEqual(
+            first.trades[0].transaction_id, second.trades[0].transaction_id
+        )
+
+    def test_pending_fx_line_cached(self) -> None:
+        """Test that fx line is resolved with other files after loading from cache"""
+        file_list = [MISSING_RATE_STATEMENT, self.statement]
+        load_statements(file_list, cache=self.cache)
+        cached = load_statements(file_list, cache=self.cache)
+        self.assertEqual("USD", cached.fx_trades[0].ticker)
+
+    def test_invalidation(self) -> None:
+        """Test that cache miss when file content, parser version or option
+        is changed"""
+        self.cache.save(self.statement, parse_statement(self.statement))
+        self.assertIsNotNone(self.cache.load(self.statement))
+        self.assertIsNone(self.cache.load(self.statement, include_fx=False))
+        for version in ["PARSER_VERSION", "MODEL_VERSION"]:
+            with mock.patch.object(statement_cache, version, "0"):
+                self.assertIsNone(self.cache.load(self.statement))
+                # entry of other parser or model version is removed
+                StatementCache(self.cache.directory)
+                self.assertEqual([], os.listdir(self.cache.directory))
+            self.cache.save(self.statement, parse_statement(self.statement))
+        with open(self.statement, "a", encoding="utf-8") as file:
+            file.write("\n")
+        self.assertIsNone(self.cache.load(self.statement))
+        self.cache.clear()
+        self.assertEqual([], os.listdir(self.cache.directory))
+
+    def test_include_fx_none(self) -> None:
+        """Test that include_fx of None is cached as no fx, as an unset option in
+        the settings"""
+        statement = load_statements([self.statement], None, 1, self.cache)  # type: ignore[arg-type]
+        self.assertEqual([], statement.fx_trades)
+        self.assertIsNotNone(self.cache.load(self.statement, include_fx=False))
+
+    def test_unreadable_entry(self) -> None:
+        """Test that an entry which cannot be unpickled is a cache miss and is
+        removed"""
+        self.cache.save(self.statement, parse_statement(self.statement))
+        with mock.patch.object(
+            statement_cache.pickle, "loads", side_effect=AttributeError
+        ):
+            self.assertIsNone(self.cache.load(self.statement))
+        self.assertEqual([], os.listdir(self.cache.directory))
+
+    def test_eviction(self) -> None:
+        """Test that least recently used entry is evicted"""
+        other = os.path.join(self.directory, "other.xml")
+        shutil.copy(MISSING_RATE_STATEMENT, other)
+        self.cache.save(self.statement, parse_statement(self.statement))
+        [first_entry] = os.listdir(self.cache.directory)
+        # make the entry of the first statement the least recently used one
+        os.utime(os.path.join(self.cache.directory, first_entry), (0, 0))
+        self.cache.save(other, parse_statement(other))
+        self.assertEqual(2, len(os.listdir(self.cache.directory)))
+        self.cache.max_size = max(
+            os.path.getsize(os.path.join(self.cache.directory, x))
+            for x in os.listdir(self.cache.directory)
+        )
+        self.cache.evict()
+        self.assertIsNone(self.cache.load(self.statement))
+        self.assertIsNotNone(self.cache.load(other))
+        self.cache.invalidate(other)
+        self.assertIsNone(self.cache.load(other))
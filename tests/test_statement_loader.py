@@ -0,0 +1,77 @@
+""" testing for loading of multiple statements """
+from decimal import Decimal
+import os
+import tempfile
+import unittest
+
+from capital_gain.model import Transaction
+from statement_parser.cache import StatementCache
+from statement_parser.exception import FxRateNotFoundError
+from statement_parser.loader import load_statements
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+SAMPLE_STATEMENT = os.path.join(DATA_DIR, "sample_statement.xml")
+MISSING_RATE_STATEMENT = os.path.join(DATA_DIR, "sample_statement_missing_rate.xml")
+
+
+def _summarise(statement) -> list[tuple]:
+    """transaction id and the record fields"""
+    records = [
+        *statement.trades,
+        *statement.corp_actions,
+        *statement.fx_trades,
+        *statement.dividends,
+    ]
+    return [(x.transaction_id, x.ticker, x.transaction_date) for x in records]
+
+
+def _load_from_id_1(file_list: list[str], **kwargs) -> list[tuple]:
+    Transaction.transaction_id_counter = 1
+    return _summarise(load_statements(file_list, **kwargs))
+
+
+class TestStatementLoader(unittest.TestCase):
+    """To test that statements are loaded and merged correctly"""
+
+    def setUp(self) -> None:
+        Transaction.transaction_id_counter = 1
+
+    def test_fx_rate_from_other_file(self) -> None:
+        """Test that rate missing in a statement is found in another statement"""
+        with self.assertRaises(FxRateNotFoundError):
+            load_statements([MISSING_RATE_STATEMENT])
+        statement = load_statements([MISSING_RATE_STATEMENT, SAMPLE_STATEMENT])
+        self.assertEqual(
+            ["TSLA", "AMD", "AMD", "VOD"], [x.ticker for x in statement.trades]
+        )
+        self.assertEqual(
+            Decimal("1999") * Decimal("0.735"),
+            statement.fx_trades[0].transaction_value.get_value(),
+        )
+
+    def test_transaction_id(self) -> None:
+        """Test that transaction id is unique and follows the order of files"""
+        statement = load_statements([MISSING_RATE_STATEMENT, SAMPLE_STATEMENT])
+        summary = _summarise(statement)
+        self.assertEqual(
+            list(range(1, len(summary) + 1)), sorted(x[0] for x in summary)
+        )
+        # trades, corporate actions, fx trades then dividends of the first file
+        # get their id before the second file
+        self.assertEqual("TSLA", statement.trades[0].ticker)
+        self.assertEqual(1, statement.trades[0].transaction_id)
+        self.assertEqual(2, statement.fx_trades[0].transaction_id)
+        self.assertEqual(3, statement.trades[1].transaction_id)
+        # next record created continues after the loaded records
+        self.assertEqual(len(summary) + 1, Transaction.transaction_id_counter)
+
+    def test_parallel(self) -> None:
+        """Test that result is the same regardless of number of workers"""
+        file_list = [MISSING_RATE_STATEMENT, SAMPLE_STATEMENT, SAMPLE_STATEMENT]
+        expected = _load_from_id_1(file_list)
+        self.assertEqual(1, expected[0][0])
+        self.assertEqual(expected, _load_from_id_1(file_list, workers=3))
+        with tempfile.TemporaryDirectory() as directory:
+            cache = StatementCache(directory)
+            self.assertEqual(expected, _load_from_id_1(file_list, cache=cache))
+            self.assertEqual(expected, _load_from_id_1(file_list, cache=cache))
@@ -0,0 +1,153 @@
+""" testing for downloading only the periods not covered by the statements """
+import datetime
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from ledger.sqlite_ledger import Ledger
+from tests.flex_server import FlexServer
+from tests.test_ibkr_parser import SAMPLE_STATEMENT
+from xml_import.polling import PollingPolicy
+from xml_import.sync import missing_periods, statement_periods, sync_statements
+
+NO_WAIT = PollingPolicy(initial_wait=0, jitter=0, deadline=10)
+YEAR_2021 = (datetime.date(2021, 1, 1), datetime.date(2021, 12, 31))
+
+
+def _date(text: str) -> datetime.date:
+    return datetime.date.fromisoformat(text)
+
+
+class TestSync(unittest.TestCase):
+    """To test the incremental download of statements"""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_missing_periods(self) -> None:
+        """Test the gaps between the covered periods"""
+        self.assertEqual(
+            [
+                (_date("2020-01-01"), _date("2020-12-30")),
+                (_date("2020-12-31"), _date("2020-12-31")),
+                (_date("2022-01-01"), _date("2022-01-10")),
+            ],
+            list(
+                missing_periods([YEAR_2021], _date("2020-01-01"), _date("2022-01-10"))
+            ),
+        )
+        self.assertEqual(
+            [(_date("2021-03-01"), _date("2021-03-31"))],
+            list(
+                missing_periods(
+                    [
+                        (_date("2021-04-01"), _date("2021-12-31")),
+                        (_date("2021-01-01"), _date("2021-02-28")),
+                        (_date("2021-02-01"), _date("2021-02-10")),
+                    ],
+                    _date("2021-01-01"),
+                    _date("2021-12-31"),
+                )
+            ),
+        )
+        self.assertEqual([], list(missing_periods([YEAR_2021], *YEAR_2021)))
+
+    def test_statement_periods(self) -> None:
+        """Test reading the account and period of a statement"""
+        expected = [("U1234567", YEAR_2021)]
+        self.assertEqual(expected, statement_periods(SAMPLE_STATEMENT))
+        compressed = os.path.join(self.directory.name, "statement.xml.gz")
+        with open(SAMPLE_STATEMENT, "rb") as source, gzip.open(
+            compressed, "wb"
+        ) as target:
+            shutil.copyfileobj(source, target)
+        self.assertEqual(expected, statement_periods(compressed))
+
+    def test_sync(self) -> None:
+        """Test that only the period not on disk is downloaded, and nothing is
+        downloaded when the statements are up to date"""
+        shutil.copy(SAMPLE_STATEMENT, self.directory.name)
+        end = _date("2022-03-31")
+        with FlexServer(pending_polls=1) as server:
+            files = sync_statements(
+                "token",
+                "1",
+                self.directory.name,
+                YEAR_2021[0],
+                end,
+                compress=True,
+                base_url=server.url,
+                policy=NO_WAIT,
+            )
+            self.assertEqual([("20220101", "20220331")], list(server.periods.values()))
+            self.assertEqual(
+                [os.path.join(self.directory.name, "1_20220101_20220331.xml.gz")],
+                files,
+            )
+            self.assertEqual(
+                [("U1234567", (_date("2022-01-01"), end))],
+                statement_periods(files[0]),
+            )
+            files = sync_statements(
+                "token",
+                "1",
+                self.directory.name,
+                YEAR_2021[0],
+                end,
+                base_url=server.url,
+                policy=NO_WAIT,
+            )
+            self.assertEqual([], files)
+            self.assertEqual(1, len(server.requested))
+            # statements of another account do not count
+            sync_statements(
+                "token",
+                "1",
+                self.directory.name,
+                YEAR_2021[0],
+                end,
+                account_id="U7654321",
+                base_url=server.url,
+                policy=NO_WAIT,
+            )
+            self.assertEqual(
+                [
+                    ("20210101", "20211231"),
+                    ("20220101", "20220331"),
+                    ("20220101", "20220331"),
+                ],
+                sorted(server.periods.values()),
+            )
+
+    def test_ledger(self) -> None:
+        """Test that the records of the new statements are added to the ledger"""
+        with open(SAMPLE_STATEMENT, encoding="utf-8") as file:
+            statement = file.read().replace(
+                'fromDate="01-Jan-21" toDate="31-Dec-21"',
+                'fromDate="01-Jan-22" toDate="31-Jan-22"',
+            )
+        with FlexServer(pending_polls=0) as server, Ledger() as ledger:
+            server.statements["1"] = statement
+            sync_statements(
+                "token",
+                "1",
+                self.directory.name,
+                _date("2022-01-01"),
+                _date("2022-01-31"),
+                ledger=ledger,
+                base_url=server.url,
+                policy=NO_WAIT,
+            )
+            self.assertEqual(
+                ["AMD", "AMD", "VOD"],
+                [x.ticker for x in ledger.iter_trades("AMD")]
+                + [x.ticker for x in ledger.iter_trades("VOD")],
+            )
+            self.assertEqual(2, len(list(ledger.iter_dividends())))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+""" testing for columnar storage of trades """
+import datetime
+from decimal import Decimal
+import unittest
+
+from iso4217 import Currency
+
+from capital_gain.calculator import CgtCalculator
+from capital_gain.model import BuyTrade, Money, SellTrade, Transaction
+from capital_gain.trade_store import TradeStore, calculate_from_store
+
+
+class TestTradeStore(unittest.TestCase):
+    """To test that trades read from the store are the same as stored"""
+
+    def setUp(self) -> None:
+        self.trades: list[BuyTrade | SellTrade] = [
+            BuyTrade(
+                "AMD",
+                datetime.date(2021, 10, 5),
+                Decimal(100),
+                Money(Decimal(10000), Decimal("0.75"), Currency("USD"), "rate 0.75"),
+                [Money(Decimal(5)), Money(Decimal("0.5"), note="stamp duty")],
+                description="ADVANCED MICRO DEVICES",
+            ),
+            SellTrade(
+                "AMD",
+                datetime.date(2021, 10, 5),
+                Decimal(60),
+                Money(Decimal(9000)),
+            ),
+            SellTrade(
+                "TSLA",
+                datetime.date(2021, 11, 1),
+                Decimal(10),
+                Money(Decimal(5000)),
+                [Money(Decimal(1))],
+            ),
+        ]
+        self.store = TradeStore(self.trades)
+
+    def test_read_trade(self) -> None:
+        """Test that trade read from the store equals the stored trade"""
+        self.assertEqual(3, len(self.store))
+        self.assertEqual(self.trades, list(self.store))
+        self.assertEqual(self.trades[-1], self.store[-1])
+        self.assertEqual(self.trades[1:], self.store[1:])
+        self.assertIsInstance(self.store[0], BuyTrade)
+        with self.assertRaises(IndexError):
+            self.store[3]  # pylint: disable=pointless-statement
+
+    def test_read_keeps_counter(self) -> None:
+        """Test that reading trades does not take new transaction ids"""
+        next_id = Transaction.transaction_id_counter
+        list(self.store)
+        BuyTrade(
+            "AMD",
+            datetime.date(2021, 10, 5),
+            Decimal(1),
+            Money(Decimal(1)),
+            transaction_id=next_id,
+        )
+        self.assertEqual(next_id, Transaction.transaction_id_counter)
+
+    def test_append_wrong_type(self) -> None:
+        """Test that only buy and sell trades can be stored"""
+        with self.assertRaises(TypeError):
+            self.store.append("AMD")  # type: ignore
+
+    def test_read_exact_decimal(self) -> None:
+        """Test that values that do not fit in the arrays are read back exactly"""
+        value = Decimal(1) / Decimal(3)
+        self.store.append(
+            BuyTrade(
+                "AMD",
+                datetime.date(2021, 12, 1),
+                Decimal("-0"),
+                Money(Decimal("1E+200"), value),
+            )
+        )
+        trade = self.store[-1]
+        self.assertEqual("-0", str(trade.size))
+        self.assertEqual("1E+200", str(trade.transaction_value.value))
+        self.assertEqual(value, trade.transaction_value.exchange_rate)
+        self.assertEqual("0.5", str(self.store[0].fee_and_tax[1].value))
+
+    def test_calculate_from_store(self) -> None:
+        """Test that calculating from the store gives the same result as the
+        trades and that the result is kept in the store"""
+        calculator = CgtCalculator(self.trades)
+        calculator.calculate_tax()
+        section104 = calculate_from_store(self.store)
+        self.assertEqual(self.trades, list(self.store))
+        self.assertEqual(
+            Decimal("4496.70"), self.store[1].calculation_status.total_gain
+        )
+        self.assertEqual(
+            calculator.get_section104().section104_list, section104.section104_list
+        )
+        self.assertEqual(calculator.get_section104().short_list, section104.short_list)
+        # calculating again replaces the stored result
+        calculate_from_store(self.store)
+        self.assertEqual(self.trades, list(self.store))
@@ -0,0 +1,112 @@
+""" Download many flex queries concurrently with asyncio """
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+import logging
+from typing import Iterable, Optional
+
+from xml_import.exception import RequestTimeoutError
+from xml_import.importer import (
+    BASE_URL,
+    REQUEST_VERSION,
+    XML_VERSION,
+    Period,
+    check_request_response,
+    download_statement,
+    find_text,
+    read_url,
+    request_url,
+    statement_url,
+)
+from xml_import.polling import PollingPolicy, expected_size
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENCY = 4  # number of requests sent to the server at the same time
+
+
+@dataclass(frozen=True)
+class FlexQuery:
+    """A flex query of an account and the file to save the statement to.
+    period: first and last date of the statement instead of the period of the
+    query"""
+
+    token: str
+    report_number: str
+    filename: str
+    period: Optional[Period] = None
+
+
+class BatchDownloader:
+    """Send the requests of all queries at once, then fetch each statement when
+    its wait is over. Waiting does not block the other queries as the requests
+    are run in threads, the semaphore caps the requests running at a time."""
+
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENCY,
+        base_url: str = BASE_URL,
+        policy: Optional[PollingPolicy] = None,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.base_url = base_url
+        self.policy = policy if policy else PollingPolicy()
+
+    async def _read_url(self, semaphore: asyncio.Semaphore, url: str) -> bytes:
+        async with semaphore:
+            return await asyncio.to_thread(read_url, url)
+
+    async def _download(self, semaphore: asyncio.Semaphore, query: FlexQuery) -> str:
+        reply = check_request_response(
+            await self._read_url(
+                semaphore,
+                request_url(
+                    query.token,
+                    query.report_number,
+                    REQUEST_VERSION,
+                    self.base_url,
+                    query.period,
+                ),
+            )
+        )
+        url = statement_url(
+            find_text(reply, "Url"),
+            find_text(reply, "ReferenceCode"),
+            query.token,
+            XML_VERSION,
+        )
+        for wait in self.policy.waits(expected_size(query.filename)):
+            logger.info(
+                "Waiting %.1f seconds before fetching XML of %s",
+                wait,
+                query.report_number,
+            )
+            await asyncio.sleep(wait)
+            async with semaphore:
+                if await asyncio.to_thread(download_statement, url, query.filename):
+                    return query.filename
+        raise RequestTimeoutError()
+
+    async def download(self, queries: Iterable[FlexQuery]) -> list[str | BaseException]:
+        """Download the statement of each query to its file. Return the file name
+        or the error of each query, in the order of the queries, a failed query
+        does not stop the others."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        return await asyncio.gather(
+            *(self._download(semaphore, query) for query in queries),
+            return_exceptions=True,
+        )
+
+
+def download_xml_batch(
+    queries: Iterable[FlexQuery],
+    max_concurrency: int = MAX_CONCURRENCY,
+    base_url: str = BASE_URL,
+    policy: Optional[PollingPolicy] = None,
+) -> list[str | BaseException]:
+    """Download the statements of many flex queries concurrently, see
+    BatchDownloader.download"""
+    return asyncio.run(
+        BatchDownloader(max_concurrency, base_url, policy).download(queries)
+    )
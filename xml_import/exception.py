@@ -12,10 +12,10 @@ class RequestRejectedError(Exception):
 
 
 class RequestTimeoutError(Exception):
-    """XML request aborted as retry limit reached"""
+    """XML request aborted as deadline reached"""
 
     def __init__(self) -> None:
-        self.message = """XML file cannot be generated after retry limit reached.
-         Please increase retry limit in xml_import.py
+        self.message = """XML file cannot be generated before the deadline.
+         Please increase deadline of PollingPolicy in xml_import/polling.py
          or reduce the scope of the XML report"""
         super().__init__(self.message)
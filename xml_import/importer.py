@@ -1,28 +1,37 @@
-""" Import functions for Interactive Brokers flex queries """
+""" Import functions for Interactive Brokers flex queries. The steps of a download
+are public so that batch_importer can run them concurrently """
 from __future__ import annotations
 
+import datetime
+import gzip
+import itertools
 import logging
+import os
+import tempfile
 import time
+from typing import IO, Iterator, Optional
 import urllib.parse
 import urllib.request
 from xml.etree import ElementTree
 
 from xml_import.exception import RequestRejectedError, RequestTimeoutError
+from xml_import.polling import PollingPolicy, expected_size
 
 logger = logging.getLogger(__name__)
 
+Period = tuple[datetime.date, datetime.date]
+
 REQUEST_VERSION = "3"
 XML_VERSION = "3"
-INITIAL_WAIT = 5  # Waiting time for first attempt
-RETRY = 7  # number of retry before aborting
-RETRY_INCREMENT = 10  # amount of wait time increase for each failed attempt
+DATE_FORMAT = "%Y%m%d"  # format of the dates of the period in a request
+CHUNK_SIZE = 64 * 1024  # size of each read of the flex query file
 BASE_URL = (
     "https://gdcdyn.interactivebrokers.com"
     "/Universal/servlet/FlexStatementService.SendRequest"
 )
 
 
-def _find_text(root: ElementTree.ElementTree | ElementTree.Element, target: str) -> str:
+def find_text(root: ElementTree.ElementTree | ElementTree.Element, target: str) -> str:
     """Helper function to handle case when the search return None"""
     result = root.find(target)
     if result is not None:
@@ -31,58 +40,164 @@ def _find_text(root: ElementTree.ElementTree | ElementTree.Element, target: str)
         return ""
 
 
+def read_url(url: str) -> bytes:
+    """Read the whole response of a request"""
+    with urllib.request.urlopen(url) as response:
+        return response.read()
+
+
+def request_url(
+    token: str,
+    report_number: str,
+    version: str,
+    base_url: str,
+    period: Optional[Period] = None,
+) -> str:
+    """Url of the request to generate the flex query file, for the period of the
+    query or from and to the dates of period"""
+    values = {"t": token, "q": report_number, "v": version}
+    if period:
+        values["fd"] = period[0].strftime(DATE_FORMAT)
+        values["td"] = period[1].strftime(DATE_FORMAT)
+    return base_url + "?" + urllib.parse.urlencode(values)
+
+
+def statement_url(base_url: str, reference_code: str, token: str, version: str) -> str:
+    """Url of the generated flex query file"""
+    xml_url_values = urllib.parse.urlencode(
+        {"q": reference_code, "t": token, "v": version}
+    )
+    return base_url + "?" + xml_url_values
+
+
+def check_request_response(data: bytes) -> ElementTree.Element:
+    """Return the response of an accepted request, which has the reference code
+    and url of the flex query file"""
+    root = ElementTree.fromstring(data)
+    status = find_text(root, "Status")
+    logger.info("XML request Status: %s", status)
+    if status == "Success":
+        return root
+    else:
+        error_code = find_text(root, "ErrorCode")
+        error_message = find_text(root, "ErrorMessage")
+        raise RequestRejectedError(error_code, error_message)
+
+
+def _check_statement_response(data: bytes) -> None:
+    """Check a response that is not a flex query file, raise the error unless
+    the file is not yet ready"""
+    root = ElementTree.fromstring(data)
+    if (
+        find_text(root, "ErrorCode") == "1019"
+    ):  # statement generation in process, retry later
+        logger.info("XML is not yet ready.")
+    else:
+        error_code = find_text(root, "ErrorCode")
+        error_message = find_text(root, "ErrorMessage")
+        raise RequestRejectedError(error_code, error_message)
+
+
+def _is_statement(chunks: Iterator[bytes], head: list[bytes]) -> bool:
+    """Read chunks into head until the first child of the root element is
+    found, and tell if it is the statements of a flex query file"""
+    parser: ElementTree.XMLPullParser = ElementTree.XMLPullParser(events=("start",))
+    depth = 0
+    for chunk in chunks:
+        head.append(chunk)
+        parser.feed(chunk)
+        for event in parser.read_events():
+            depth += 1
+            if depth == 2:
+                element = event[-1]
+                return (
+                    isinstance(element, ElementTree.Element)
+                    and element.tag == "FlexStatements"
+                )
+    return False
+
+
+def _open_output(file: IO[bytes], filename: str) -> IO[bytes] | gzip.GzipFile:
+    """Compress the output with gzip if the file name ends with .gz"""
+    if filename.endswith(".gz"):
+        return gzip.GzipFile(
+            filename=os.path.basename(filename), fileobj=file, mode="wb"
+        )
+    return file
+
+
+def download_statement(url: str, filename: str) -> bool:
+    """Stream the flex query file to a temporary file next to filename and move it
+    into place, so that filename is not left half written. Return False when the
+    file is not yet ready. Only the start of the response is parsed to tell the
+    file from an error response.
+    The file is stored compressed with gzip if filename ends with .gz
+    """
+    with urllib.request.urlopen(url) as response:
+        chunks = iter(lambda: response.read(CHUNK_SIZE), b"")
+        head: list[bytes] = []
+        if not _is_statement(chunks, head):
+            # error response is small, so it is read in whole
+            _check_statement_response(b"".join([*head, *chunks]))
+            return False
+        file_descriptor, temp_name = tempfile.mkstemp(
+            suffix=".tmp", dir=os.path.dirname(os.path.abspath(filename))
+        )
+        try:
+            with os.fdopen(file_descriptor, "wb") as temp_file:
+                with _open_output(temp_file, filename) as output:
+                    for chunk in itertools.chain(head, chunks):
+                        output.write(chunk)
+            os.replace(temp_name, filename)
+        except BaseException:
+            os.remove(temp_name)
+            raise
+    logger.info("XML download is successful.")
+    return True
+
+
 def _make_xml_request(
-    token: str, report_number: str, version: str
+    token: str,
+    report_number: str,
+    version: str,
+    base_url: str = BASE_URL,
+    period: Optional[Period] = None,
 ) -> ElementTree.Element:
     """Step 1 : Request IB to generate the flex query file by giving a request
      with the token
     note that the server is not always up, and sometimes it is down on Sat/Sun"""
-    url_values = urllib.parse.urlencode({"t": token, "q": report_number, "v": version})
-    full_url = BASE_URL + "?" + url_values
-    with urllib.request.urlopen(full_url) as xml_request_response:
-        root = ElementTree.fromstring(xml_request_response.read())
-        status = _find_text(root, "Status")
-        logger.info("XML request Status: %s", status)
-        if status == "Success":
-            return root
-        else:
-            error_code = _find_text(root, "ErrorCode")
-            error_message = _find_text(root, "ErrorMessage")
-            raise RequestRejectedError(error_code, error_message)
+    return check_request_response(
+        read_url(request_url(token, report_number, version, base_url, period))
+    )
 
 
 def _get_xml(
-    base_url: str, reference_code: str, token: str, version: str
-) -> ElementTree.Element:
+    base_url: str,
+    reference_code: str,
+    token: str,
+    version: str,
+    filename: str,
+    policy: PollingPolicy,
+) -> None:
     """Step 2: After the request is accepted,
     you need to wait until the file is ready to download."""
-    xml_url_values = urllib.parse.urlencode(
-        {"q": reference_code, "t": token, "v": version}
-    )
-    xml_full_url = base_url + "?" + xml_url_values
-    retry = 0
-    while retry < RETRY:
-        timer = retry * RETRY_INCREMENT + INITIAL_WAIT
-        logger.info("Waiting %i seconds before fetching XML", timer)
+    xml_full_url = statement_url(base_url, reference_code, token, version)
+    for timer in policy.waits(expected_size(filename)):
+        logger.info("Waiting %.1f seconds before fetching XML", timer)
         time.sleep(timer)
-        with urllib.request.urlopen(xml_full_url) as xml_data:
-            root = ElementTree.fromstring(xml_data.read())
-            if root[0].tag == "FlexStatements":
-                logger.info("XML download is successful.")
-                return root
-            elif (
-                _find_text(root, "ErrorCode") == "1019"
-            ):  # statement generation in process, retry later
-                logger.info("XML is not yet ready.")
-                retry += 1
-            else:
-                error_code = _find_text(root, "ErrorCode")
-                error_message = _find_text(root, "ErrorMessage")
-                raise RequestRejectedError(error_code, error_message)
+        if download_statement(xml_full_url, filename):
+            return
     raise RequestTimeoutError()
 
 
-def download_xml(token: str, report_number: str, filename: str = "data.xml") -> None:
+def download_xml(
+    token: str,
+    report_number: str,
+    filename: str = "data.xml",
+    base_url: str = BASE_URL,
+    policy: Optional[PollingPolicy] = None,
+    period: Optional[Period] = None,
+) -> None:
     """
     Flex query report number is generated when you create a flex query.
     https://www.interactivebrokers.com.hk/
@@ -91,15 +206,21 @@ def download_xml(token: str, report_number: str, filename: str = "data.xml") ->
     Please refer to the link below on how to get the token
     https://www.interactivebrokers.com.hk
     /en/software/am/am/reports/flex_web_service_version_3.htm
+
+    The file is compressed with gzip if filename ends with .gz
+    policy: waiting time between the attempts to fetch the file, an earlier
+    download in filename is taken as the expected size of the file
+    period: first and last date of the statement instead of the period of the
+    query, at most 365 days
     """
-    xml_reply = _make_xml_request(token, report_number, REQUEST_VERSION)
-    xml_result = _get_xml(
-        _find_text(xml_reply, "Url"),
-        _find_text(xml_reply, "ReferenceCode"),
+    xml_reply = _make_xml_request(
+        token, report_number, REQUEST_VERSION, base_url, period
+    )
+    _get_xml(
+        find_text(xml_reply, "Url"),
+        find_text(xml_reply, "ReferenceCode"),
         token,
         XML_VERSION,
+        filename,
+        policy if policy else PollingPolicy(),
     )
-    tree = ElementTree.ElementTree(xml_result)
-    # the response is actually a xml file that you can write directly to a file
-    with open(filename, "wb") as file:
-        tree.write(file)
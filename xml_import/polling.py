@@ -0,0 +1,55 @@
+""" Waiting time between the attempts to fetch a flex query file """
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import os
+import random
+import time
+from typing import Callable, Iterator, Optional
+
+INITIAL_WAIT = 1.0  # Waiting time for first attempt of a small statement
+BACKOFF = 2.0  # waiting time is multiplied by this after each failed attempt
+MAX_WAIT = 60.0  # longest waiting time between two attempts
+JITTER = 0.2  # waiting time is randomly changed by up to this fraction
+DEADLINE = 600.0  # total time to wait before aborting
+SECONDS_PER_MB = 2.0  # estimated time for the server to generate 1 MB of statement
+
+
+def expected_size(filename: str) -> Optional[int]:
+    """Size of an earlier download of the statement, if any, as the estimate of
+    the size of the statement to generate"""
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return None
+
+
+@dataclass
+class PollingPolicy:
+    """Exponential backoff with jitter until the deadline. The first wait is
+    longer for a larger expected statement, as it takes longer to generate."""
+
+    initial_wait: float = INITIAL_WAIT
+    backoff: float = BACKOFF
+    max_wait: float = MAX_WAIT
+    jitter: float = JITTER
+    deadline: float = DEADLINE
+    seconds_per_mb: float = SECONDS_PER_MB
+    rng: random.Random = field(default_factory=random.Random, repr=False)
+    clock: Callable[[], float] = field(default=time.monotonic, repr=False)
+
+    def first_wait(self, size: Optional[int] = None) -> float:
+        """Waiting time before the first attempt for the expected size in bytes"""
+        estimate = self.seconds_per_mb * size / 1_000_000 if size else 0
+        return min(self.initial_wait + estimate, self.max_wait)
+
+    def waits(self, size: Optional[int] = None) -> Iterator[float]:
+        """Waiting time before each attempt, ends when the deadline is reached.
+        The time is taken when the next wait is asked, so the time spent on
+        each attempt counts toward the deadline."""
+        end = self.clock() + self.deadline
+        wait = self.first_wait(size)
+        while (remaining := end - self.clock()) > 0:
+            jittered = wait * self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+            yield min(jittered, remaining)
+            wait = min(wait * self.backoff, self.max_wait)
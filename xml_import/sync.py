@@ -0,0 +1,149 @@
+""" Download only the periods that are not covered by the statements on disk """
+from __future__ import annotations
+
+import datetime
+from glob import glob
+import logging
+import os
+from typing import Iterator, Optional
+from xml.etree import ElementTree
+
+from ledger.sqlite_ledger import Ledger
+from statement_parser.ibkr import open_statement
+from statement_parser.loader import load_statements
+from xml_import.batch_importer import MAX_CONCURRENCY, FlexQuery, download_xml_batch
+from xml_import.importer import BASE_URL, Period
+from xml_import.polling import PollingPolicy
+
+logger = logging.getLogger(__name__)
+
+MAX_PERIOD_DAYS = 365  # longest period of a request with dates
+# date format of the statement depends on the setting of the flex query
+STATEMENT_DATE_FORMATS = ["%d-%b-%y", "%Y%m%d", "%Y-%m-%d", "%m/%d/%Y"]
+_ONE_DAY = datetime.timedelta(days=1)
+
+
+def _parse_date(text: str) -> datetime.date:
+    for date_format in STATEMENT_DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unknown date format of statement: {text}")
+
+
+def statement_periods(file: str) -> list[tuple[str, Period]]:
+    """Account and period of each statement in a file, only the statement
+    elements are read so that the rest of the file is not kept in memory"""
+    periods = []
+    count = None
+    with open_statement(file) as source:
+        for _, node in ElementTree.iterparse(source, events=("start",)):
+            if node.tag == "FlexStatements":
+                count = int(node.attrib.get("count", 0)) or None
+            elif node.tag == "FlexStatement":
+                periods.append(
+                    (
+                        node.attrib.get("accountId", ""),
+                        (
+                            _parse_date(node.attrib["fromDate"]),
+                            _parse_date(node.attrib["toDate"]),
+                        ),
+                    )
+                )
+                # no need to read the records once all statements are found
+                if len(periods) == count:
+                    break
+    return periods
+
+
+def covered_periods(directory: str, account_id: Optional[str] = None) -> list[Period]:
+    """Periods of the statements in the directory, of one account if given"""
+    periods: list[Period] = []
+    for file in glob(os.path.join(directory, "*.xml")) + glob(
+        os.path.join(directory, "*.xml.gz")
+    ):
+        try:
+            file_periods = statement_periods(file)
+        except (ElementTree.ParseError, KeyError, ValueError):
+            logger.warning("Period of %s is not known, it is not counted", file)
+            continue
+        periods.extend(
+            period
+            for account, period in file_periods
+            if account_id is None or account == account_id
+        )
+    return sorted(periods)
+
+
+def missing_periods(
+    covered: list[Period], start: datetime.date, end: datetime.date
+) -> Iterator[Period]:
+    """Periods from start to end that are not covered, split into periods of at
+    most MAX_PERIOD_DAYS days"""
+    gap_start = start
+    for covered_start, covered_end in sorted(covered):
+        if covered_start > gap_start:
+            yield from _split_period(gap_start, min(covered_start, end + _ONE_DAY))
+        gap_start = max(gap_start, covered_end + _ONE_DAY)
+        if gap_start > end:
+            return
+    yield from _split_period(gap_start, end + _ONE_DAY)
+
+
+def _split_period(start: datetime.date, stop: datetime.date) -> Iterator[Period]:
+    """Split the dates from start until the day before stop"""
+    while start < stop:
+        end = min(stop, start + datetime.timedelta(days=MAX_PERIOD_DAYS)) - _ONE_DAY
+        yield start, end
+        start = end + _ONE_DAY
+
+
+def sync_statements(
+    token: str,
+    report_number: str,
+    directory: str,
+    start: datetime.date,
+    end: Optional[datetime.date] = None,
+    account_id: Optional[str] = None,
+    ledger: Optional[Ledger] = None,
+    compress: bool = False,
+    max_concurrency: int = MAX_CONCURRENCY,
+    base_url: str = BASE_URL,
+    policy: Optional[PollingPolicy] = None,
+) -> list[str]:
+    """Download the statements of the dates from start to end that are not
+    covered by the statements in the directory, and return the new files.
+    end: default is yesterday, as the statement of today is not final
+    account_id: only count the statements of this account as covered
+    ledger: if given, the records of the new statements are added to it
+    compress: store the new statements compressed with gzip
+    If a download fails the error is raised after the other periods are
+    downloaded, and the next sync requests only the failed periods.
+    """
+    if end is None:
+        end = datetime.date.today() - _ONE_DAY
+    suffix = ".xml.gz" if compress else ".xml"
+    queries = [
+        FlexQuery(
+            token,
+            report_number,
+            os.path.join(
+                directory,
+                f"{report_number}_{period[0]:%Y%m%d}_{period[1]:%Y%m%d}{suffix}",
+            ),
+            period,
+        )
+        for period in missing_periods(
+            covered_periods(directory, account_id), start, end
+        )
+    ]
+    logger.info("Downloading %i missing period(s)", len(queries))
+    results = download_xml_batch(queries, max_concurrency, base_url, policy)
+    files = [result for result in results if isinstance(result, str)]
+    if ledger is not None and files:
+        ledger.add_statement(load_statements(files))
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return files